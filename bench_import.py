@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+导入耗时基准
+每个模块在全新的解释器中用 python -X importtime 导入若干次，取最小值和中位数，
+并检查导入后是否加载了 bleak / flask 等重量级依赖
+
+用法:
+    python bench_import.py                 # 测量默认模块列表
+    python bench_import.py dm40_protocol dm40ble --repeat 10
+    python bench_import.py --check         # 离线模块加载了 bleak/flask 时返回非零退出码
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# 模块 -> 不允许加载的重量级依赖（--check 时检查）
+DEFAULT_MODULES = {
+    'dm40_protocol': ('bleak', 'flask'),
+    'dm40_wire': ('bleak', 'flask'),
+    'dm40_stats': ('bleak', 'flask'),
+    'dm40_stream': ('bleak', 'flask'),
+    'dm40_filter': ('bleak', 'flask'),
+    'dm40_rules': ('bleak', 'flask'),
+    'dm40_capture': ('bleak', 'flask'),
+    'dm40_align': ('bleak', 'flask'),
+    'dm40_derived': ('bleak', 'flask'),
+    'dm40_analysis': ('bleak', 'flask'),
+    'dm40_recorder': ('bleak', 'flask'),
+    'dm40_storage': ('bleak', 'flask'),
+    'dm40_sqlite': ('bleak', 'flask'),
+    'dm40_shm': ('bleak', 'flask'),
+    'dm40_transport': ('bleak', 'flask'),
+    'dm40ble': ('bleak', 'flask'),
+    'dm40_worker': ('bleak', 'flask'),
+    'dm40_gateway': ('bleak', 'flask'),
+    'web_server': ('bleak',),
+}
+
+HEAVY = ('bleak', 'flask', 'flask_socketio', 'engineio', 'numpy')
+
+_PROBE = ("import sys, {module}; "
+          "print(','.join(sorted({{n.split('.')[0] for n in sys.modules}} & set({heavy!r}))))")
+
+
+def measure(module: str, repeat: int = 5):
+    """返回 (各次累计导入耗时列表(ms), 加载的重量级依赖集合)"""
+    times = []
+    loaded = set()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _PROBE.format(module=module, heavy=HEAVY)],
+            capture_output=True, text=True, cwd=root)
+        if proc.returncode != 0:
+            raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr.strip().splitlines()[-1]}")
+        # 格式: "import time: self [us] | cumulative | imported package"，顶层模块没有缩进
+        for line in proc.stderr.splitlines():
+            parts = line.split('|')
+            if len(parts) == 3 and parts[2].rstrip() == f' {module}':
+                times.append(int(parts[1]) / 1000)
+        if proc.stdout.strip():
+            loaded.update(proc.stdout.strip().split(','))
+    return times, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DM40 模块导入耗时基准")
+    parser.add_argument('modules', nargs='*', help='要测量的模块，默认测量全部')
+    parser.add_argument('--repeat', type=int, default=5, help='每个模块重复次数')
+    parser.add_argument('--check', action='store_true', help='检查离线模块是否加载了重量级依赖')
+    args = parser.parse_args()
+
+    modules = args.modules or list(DEFAULT_MODULES)
+    failed = []
+    print(f"{'模块':<16}{'最小(ms)':>10}{'中位数(ms)':>12}  已加载的重量级依赖")
+    print('-' * 60)
+    for module in modules:
+        try:
+            times, loaded = measure(module, args.repeat)
+        except RuntimeError as e:
+            print(f"{module:<16}{'-':>10}{'-':>12}  {e}")
+            continue
+        print(f"{module:<16}{min(times):>10.1f}{statistics.median(times):>12.1f}  {', '.join(sorted(loaded)) or '-'}")
+        forbidden = loaded & set(DEFAULT_MODULES.get(module, ()))
+        if forbidden:
+            failed.append((module, forbidden))
+
+    if args.check and failed:
+        print()
+        for module, forbidden in failed:
+            print(f"✗ {module} 导入时加载了 {', '.join(sorted(forbidden))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
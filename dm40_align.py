@@ -0,0 +1,136 @@
+"""
+DM40A 多表时间对齐
+把多台万用表各自采样时刻不同的读数流重采样到同一时间轴上（numpy 向量化线性插值），
+用于电压 × 电流等需要逐点对应的计算
+
+    aligner = StreamAligner(horizon=60)
+    aligner.attach(meter_v, 'V')
+    aligner.attach(meter_i, 'I')
+    t, values, errors = aligner.aligned(step=0.1)
+    power = values['V'] * values['I']
+
+读数时间戳取 Reading.timestamp（读数命令往返的中点），对齐后每个点同时给出时间误差
+（插值点两侧样本 uncertainty 的较大值）；超量程读数和超过 max_gap 的采样间隙在结果中为 NaN
+"""
+import collections
+import threading
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def align(streams: Dict[str, Tuple[Sequence[float], Sequence[Optional[float]]]], step: Optional[float] = None,
+          start: Optional[float] = None, end: Optional[float] = None, max_gap: Optional[float] = None,
+          uncertainties: Optional[Dict[str, Sequence[Optional[float]]]] = None):
+    """
+    把多条 (时间戳, 数值) 序列插值到公共时间轴
+    - step: 时间轴间隔（秒），默认取各序列中位采样间隔的最小值
+    - start/end: 时间范围，默认取各序列时间范围的交集
+    - max_gap: 两侧样本间隔超过该值（秒）的插值点置为 NaN，默认 3 倍中位采样间隔
+    - uncertainties: 各序列每个样本的时间误差（秒），None 视为 0
+    返回: (时间轴, {名称: 数值数组}, {名称: 时间误差数组})，没有重叠时间时返回空数组
+    """
+    series = {}
+    for name, (times, values) in streams.items():
+        t = np.asarray(times, dtype=np.float64)
+        v = np.array([np.nan if x is None else x for x in values], dtype=np.float64)
+        u = np.zeros_like(t)
+        if uncertainties and name in uncertainties:
+            u = np.array([0.0 if x is None else x for x in uncertainties[name]], dtype=np.float64)
+        order = np.argsort(t, kind='stable')
+        series[name] = (t[order], v[order], u[order])
+
+    empty = np.empty(0)
+    if not series or any(len(t) < 2 for t, _, _ in series.values()):
+        return empty, {name: empty for name in streams}, {name: empty for name in streams}
+
+    intervals = {name: float(np.median(np.diff(t))) for name, (t, _, _) in series.items()}
+    if step is None:
+        step = min(intervals.values())
+    if start is None:
+        start = max(t[0] for t, _, _ in series.values())
+    if end is None:
+        end = min(t[-1] for t, _, _ in series.values())
+    if step <= 0 or end < start:
+        return empty, {name: empty for name in streams}, {name: empty for name in streams}
+
+    grid = start + step * np.arange(int(np.floor((end - start) / step)) + 1)
+    values, errors = {}, {}
+    for name, (t, v, u) in series.items():
+        gap = max_gap if max_gap is not None else 3 * intervals[name]
+        # 每个插值点右侧样本的下标，左侧为 right - 1
+        right = np.clip(np.searchsorted(t, grid, side='left'), 1, len(t) - 1)
+        left = right - 1
+        span = t[right] - t[left]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(span > 0, (grid - t[left]) / span, 0.0)
+        out = v[left] + weight * (v[right] - v[left])
+        error = np.maximum(u[left], u[right])
+        # 恰好落在样本上的点直接取该样本，不受另一侧超量程影响
+        hit_left, hit_right = t[left] == grid, t[right] == grid
+        out = np.where(hit_right, v[right], np.where(hit_left, v[left], out))
+        error = np.where(hit_right, u[right], np.where(hit_left, u[left], error))
+        out[~(hit_left | hit_right) & (span > gap)] = np.nan
+        out[(grid < t[0]) | (grid > t[-1])] = np.nan
+        values[name] = out
+        errors[name] = error
+    return grid, values, errors
+
+
+class StreamAligner:
+    """
+    实时对齐器：作为读数监听器挂到多台设备上，保存最近 horizon 秒的读数，按需对齐
+    监听回调只做追加，对齐计算在调用 aligned() 的线程中进行
+    """
+
+    def __init__(self, horizon: float = 60.0, si: bool = False):
+        """si 为 True 时使用基本单位数值（如 V、A），否则使用显示单位数值"""
+        self.horizon = horizon
+        self.si = si
+        self._buffers: Dict[str, Deque[Tuple[float, Optional[float], Optional[float]]]] = {}
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def attach(self, device, name: str):
+        """挂到 Com_DM40A / ProcessMeter 上，name 为对齐结果中的序列名称"""
+        buffer = collections.deque()
+        horizon = self.horizon
+        si = self.si
+
+        def listener(reading):
+            value = reading.value
+            if si and reading.measurement is not None:
+                value = reading.measurement.si_value
+            buffer.append((reading.timestamp, value, reading.uncertainty))
+            while buffer and buffer[0][0] < reading.timestamp - horizon:
+                buffer.popleft()
+
+        with self._lock:
+            self._buffers[name] = buffer
+            self._listeners[name] = (device, listener)
+        device.add_listener(listener)
+        return listener
+
+    def detach(self, name: str):
+        with self._lock:
+            self._buffers.pop(name, None)
+            entry = self._listeners.pop(name, None)
+        if entry:
+            device, listener = entry
+            device.remove_listener(listener)
+
+    def aligned(self, step: Optional[float] = None, window: Optional[float] = None,
+                max_gap: Optional[float] = None):
+        """对齐最近 window 秒（默认全部缓存）的读数，返回值同 align()"""
+        with self._lock:
+            snapshot = {name: list(buffer) for name, buffer in self._buffers.items()}
+        streams, uncertainties = {}, {}
+        start = None
+        if window is not None and snapshot:
+            latest = min((samples[-1][0] for samples in snapshot.values() if samples), default=None)
+            if latest is not None:
+                start = latest - window
+        for name, samples in snapshot.items():
+            streams[name] = ([s[0] for s in samples], [s[1] for s in samples])
+            uncertainties[name] = [s[2] for s in samples]
+        return align(streams, step, start=start, max_gap=max_gap, uncertainties=uncertainties)
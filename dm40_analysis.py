@@ -0,0 +1,379 @@
+"""
+DM40A 记录离线分析（numpy 向量化）
+把 CsvRecorder 记录的 CSV 读入 numpy 数组，提供重采样、滑动统计、直方图、跳变/事件检测和频谱分析，
+百万行级别的记录在数秒内处理完毕，避免逐行 Python 循环
+
+    s = Session.load('recordings/dm40_default_20250101_120000.csv')
+    v = s.select(mode='DC Voltage')
+    t, mean = resample(v.t, v.si_value, step=1.0)
+    times, directions = crossings(v.t, v.value, threshold=3300, hysteresis=10)
+    freqs, amplitude = spectrum(v.t, v.value)
+
+命令行:
+    python dm40_analysis.py recordings/*.csv --mode "DC Voltage" --threshold 3300 --hysteresis 10
+"""
+import io
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from dm40_align import align
+from dm40_recorder import CSV_HEADER
+
+# 读入的列: timestamp/overload 直接解析为 float64；可能为空的 value/si_value（超量程）和分类列按字节串读入，
+# 再分别转换为 float64 和分类编码。字节串列定长，超长部分会被截断
+_ROW = np.dtype([('timestamp', 'f8'), ('device_id', 'S64'), ('value', 'S32'), ('unit', 'S16'),
+                 ('mode', 'S32'), ('si_value', 'S32'), ('overload', 'f8')])
+_USECOLS = tuple(CSV_HEADER.index(name) for name in _ROW.names)
+_CHUNK_BYTES = 1 << 24      # 分块解析，限制定长字节串列占用的内存
+
+
+def _read_chunks(path: str) -> Iterator[np.ndarray]:
+    """按块读取 CSV 记录文件，每块为 _ROW 结构数组；块在行尾处切分"""
+    with open(path, 'rb') as f:
+        header = f.readline().decode('utf-8').strip().split(',')
+        if header != CSV_HEADER:
+            raise ValueError(f"不是 DM40 记录文件: {path}")
+        while True:
+            data = f.read(_CHUNK_BYTES)
+            if not data:
+                return
+            data += f.readline()
+            if data.strip():
+                # latin-1 使每个字节原样存入字节串列，分类名称在 _Categories 中按 UTF-8 解码
+                yield np.loadtxt(io.BytesIO(data), dtype=_ROW, delimiter=',', quotechar='"',
+                                 usecols=_USECOLS, ndmin=1, encoding='latin1')
+
+
+def _floats(column: np.ndarray) -> np.ndarray:
+    """字节串数值列 -> float64，空字段为 NaN"""
+    column = column.copy()
+    column[column == b''] = b'nan'
+    return column.astype(np.float64)
+
+
+class _Categories:
+    """分类列编码表，名称按首次出现的顺序编号"""
+
+    def __init__(self):
+        self.codes: Dict[bytes, int] = {}
+
+    def encode(self, column: np.ndarray) -> np.ndarray:
+        """字节串列 -> int32 编码；同一取值在记录中成片出现，只对每段的首个取值做 np.unique"""
+        starts = np.flatnonzero(np.concatenate(([True], column[1:] != column[:-1])))
+        used, first, inverse = np.unique(column[starts], return_index=True, return_inverse=True)
+        # np.unique 按取值排序，按各取值首次出现的位置分配新编码
+        for index in np.argsort(first):
+            self.codes.setdefault(used[index], len(self.codes))
+        lookup = np.array([self.codes[name] for name in used], dtype=np.int32)
+        return np.repeat(lookup[inverse], np.diff(np.append(starts, len(column))))
+
+    def names(self) -> List[str]:
+        return [name.decode('utf-8') for name in self.codes]
+
+
+class Session:
+    """
+    一段记录的列数组
+    t / value / si_value 为 float64（超量程为 NaN），overload 为 bool，
+    device / unit / mode 为分类编码（int32），对应名称见 devices / units / modes
+    """
+
+    def __init__(self, t: np.ndarray, value: np.ndarray, si_value: np.ndarray, overload: np.ndarray,
+                 device: np.ndarray, unit: np.ndarray, mode: np.ndarray,
+                 devices: List[str], units: List[str], modes: List[str]):
+        self.t = t
+        self.value = value
+        self.si_value = si_value
+        self.overload = overload
+        self.device = device
+        self.unit = unit
+        self.mode = mode
+        self.devices = devices
+        self.units = units
+        self.modes = modes
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+    @classmethod
+    def load(cls, *paths: str) -> 'Session':
+        """读取一个或多个 CSV 记录文件（按时间戳排序合并）"""
+        devices, units, modes = _Categories(), _Categories(), _Categories()
+        parts = []
+        for path in paths:
+            for rows in _read_chunks(path):
+                parts.append((rows['timestamp'], _floats(rows['value']), _floats(rows['si_value']),
+                              rows['overload'] != 0, devices.encode(rows['device_id']),
+                              units.encode(rows['unit']), modes.encode(rows['mode'])))
+
+        if not parts:
+            empty = np.empty(0)
+            codes = np.empty(0, dtype=np.int32)
+            return cls(empty, empty, empty, empty.astype(bool), codes, codes, codes, [], [], [])
+
+        columns = [np.concatenate(column) for column in zip(*parts)]
+        if len(paths) > 1:
+            order = np.argsort(columns[0], kind='stable')
+            columns = [column[order] for column in columns]
+        return cls(*columns, devices.names(), units.names(), modes.names())
+
+    def select(self, device: Optional[str] = None, mode: Optional[str] = None, unit: Optional[str] = None,
+               start: Optional[float] = None, end: Optional[float] = None) -> 'Session':
+        """按设备、模式、单位和时间范围筛选"""
+        mask = np.ones(len(self), dtype=bool)
+        for name, names, codes in ((device, self.devices, self.device), (mode, self.modes, self.mode),
+                                   (unit, self.units, self.unit)):
+            if name is not None:
+                mask &= codes == (names.index(name) if name in names else -1)
+        if start is not None:
+            mask &= self.t >= start
+        if end is not None:
+            mask &= self.t <= end
+        return Session(self.t[mask], self.value[mask], self.si_value[mask], self.overload[mask],
+                       self.device[mask], self.unit[mask], self.mode[mask], self.devices, self.units, self.modes)
+
+    def runs(self) -> List[dict]:
+        """设备/模式/单位不变的连续片段（例如每次模式切换之间）"""
+        n = len(self)
+        if n == 0:
+            return []
+        key = np.stack([self.device, self.mode, self.unit], axis=1)
+        starts = np.concatenate(([0], np.flatnonzero(np.any(key[1:] != key[:-1], axis=1)) + 1))
+        ends = np.concatenate((starts[1:], [n]))
+        return [{'start': float(self.t[a]), 'end': float(self.t[b - 1]), 'count': int(b - a),
+                 'device': self.devices[self.device[a]], 'mode': self.modes[self.mode[a]],
+                 'unit': self.units[self.unit[a]]} for a, b in zip(starts, ends)]
+
+    def summary(self) -> dict:
+        """整体统计（显示单位数值，混合了不同模式时只有计数有意义）"""
+        return dict(describe(self.value), overload=int(self.overload.sum()),
+                    start=float(self.t[0]) if len(self) else None, end=float(self.t[-1]) if len(self) else None)
+
+
+def describe(v: np.ndarray) -> dict:
+    """忽略 NaN 的 count/min/max/mean/std/rms"""
+    valid = v[~np.isnan(v)]
+    if len(valid) == 0:
+        return {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None, 'rms': None}
+    return {'count': int(len(valid)), 'min': float(valid.min()), 'max': float(valid.max()),
+            'mean': float(valid.mean()), 'std': float(valid.std()), 'rms': float(np.sqrt(np.mean(valid ** 2)))}
+
+
+# ==================== 重采样 ====================
+
+def resample(t: np.ndarray, v: np.ndarray, step: float, how: str = 'mean',
+             start: Optional[float] = None, end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    重采样到等间隔时间轴，t 须升序
+    - how="mean"/"min"/"max": 每个 [grid, grid + step) 区间内的统计，区间内没有有效读数为 NaN
+    - how="linear": 线性插值（超量程和大于 3 倍中位采样间隔的间隙为 NaN）
+    - how="last": 每个时刻之前最近的读数
+    """
+    if len(t) == 0:
+        return np.empty(0), np.empty(0)
+    start = float(t[0]) if start is None else start
+    end = float(t[-1]) if end is None else end
+    grid = start + step * np.arange(max(int(np.floor((end - start) / step)) + 1, 0))
+    if len(grid) == 0:
+        return grid, np.empty(0)
+    if how == 'linear':
+        _, values, _ = align({'v': (t, v)}, step, start, end)
+        return grid, values['v']
+    if how == 'last':
+        index = np.searchsorted(t, grid, side='right') - 1
+        out = v[np.clip(index, 0, len(v) - 1)].astype(np.float64)
+        out[index < 0] = np.nan
+        return grid, out
+    if how not in ('mean', 'min', 'max'):
+        raise ValueError(f"未知重采样方式: {how}")
+
+    # 只保留 [start, grid[-1] + step) 内的读数，否则 reduceat 的最后一段会一直累计到数组末尾
+    lo, hi = np.searchsorted(t, (start, grid[-1] + step), side='left')
+    t, v = t[lo:hi], v[lo:hi]
+    bounds = np.searchsorted(t, np.append(grid, grid[-1] + step), side='left')
+    counts = np.diff(bounds)
+    valid = ~np.isnan(v)
+    out = np.full(len(grid), np.nan)
+    nonempty = counts > 0
+    if how == 'mean':
+        sums = np.add.reduceat(np.where(valid, v, 0.0), bounds[:-1][nonempty]) if nonempty.any() else np.empty(0)
+        n = np.add.reduceat(valid.astype(np.int64), bounds[:-1][nonempty]) if nonempty.any() else np.empty(0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[nonempty] = np.where(n > 0, sums / np.maximum(n, 1), np.nan)
+    elif nonempty.any():
+        reduce = np.fmin if how == 'min' else np.fmax
+        out[nonempty] = reduce.reduceat(v, bounds[:-1][nonempty])
+    return grid, out
+
+
+# ==================== 滑动统计 ====================
+
+def rolling(v: np.ndarray, window: int) -> Dict[str, np.ndarray]:
+    """
+    以最近 window 个样本为窗口的滑动 mean/std/min/max（忽略 NaN），结果与输入等长，前 window-1 个为 NaN
+    mean/std 用累加和 O(n) 计算；min/max 为 O(n × window)，大窗口请先重采样
+    """
+    n = len(v)
+    result = {k: np.full(n, np.nan) for k in ('mean', 'std', 'min', 'max')}
+    if window < 1 or n < window:
+        return result
+    valid = ~np.isnan(v)
+    x = np.where(valid, v, 0.0)
+    count = np.convolve(valid, np.ones(window), 'valid')
+    # 先减去均值再累加，降低大数值时平方和相消的误差
+    offset = np.nanmean(v) if valid.any() else 0.0
+    x = np.where(valid, x - offset, 0.0)
+    c1 = np.concatenate(([0.0], np.cumsum(x)))
+    c2 = np.concatenate(([0.0], np.cumsum(x * x)))
+    s1 = c1[window:] - c1[:-window]
+    s2 = c2[window:] - c2[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s1 / count
+        var = np.maximum(s2 / count - mean * mean, 0.0)
+    empty = count == 0
+    mean[empty] = np.nan
+    var[empty] = np.nan
+    result['mean'][window - 1:] = mean + offset
+    result['std'][window - 1:] = np.sqrt(var)
+    view = np.lib.stride_tricks.sliding_window_view(v, window)
+    with np.errstate(invalid='ignore'):
+        result['min'][window - 1:] = np.fmin.reduce(view, axis=1)
+        result['max'][window - 1:] = np.fmax.reduce(view, axis=1)
+    return result
+
+
+# ==================== 直方图 ====================
+
+def histogram(v: np.ndarray, bins: int = 50, range: Optional[Tuple[float, float]] = None
+              ) -> Tuple[np.ndarray, np.ndarray]:
+    """读数分布 (各区间计数, 区间边界)，忽略 NaN"""
+    return np.histogram(v[~np.isnan(v)], bins=bins, range=range)
+
+
+# ==================== 跳变与事件 ====================
+
+def crossings(t: np.ndarray, v: np.ndarray, threshold: float, hysteresis: float = 0.0,
+              direction: str = 'both') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    带迟滞的阈值穿越检测（施密特触发器）
+    高于 threshold + hysteresis/2 为高、低于 threshold - hysteresis/2 为低，中间保持之前的状态
+    返回: (穿越时刻, 方向 +1 上升 / -1 下降)；穿越时刻在相邻两个读数间按阈值线性插值
+    direction: "both" / "rising" / "falling"
+    """
+    n = len(v)
+    if n < 2:
+        return np.empty(0), np.empty(0, dtype=np.int8)
+    state = np.full(n, np.nan)
+    with np.errstate(invalid='ignore'):
+        state[v > threshold + hysteresis / 2] = 1.0
+        state[v < threshold - hysteresis / 2] = 0.0
+    # 中间区域（以及超量程）沿用上一个确定的状态
+    known = ~np.isnan(state)
+    last = np.maximum.accumulate(np.where(known, np.arange(n), -1))
+    filled = np.where(last >= 0, state[np.maximum(last, 0)], np.nan)
+    change = np.diff(filled)
+    index = np.flatnonzero(np.nan_to_num(change) != 0) + 1
+    signs = change[index - 1].astype(np.int8)
+    if direction == 'rising':
+        index, signs = index[signs > 0], signs[signs > 0]
+    elif direction == 'falling':
+        index, signs = index[signs < 0], signs[signs < 0]
+    # 状态在 index 处确定，穿越发生在上一个读数与该读数之间
+    t0, t1, v0, v1 = t[index - 1], t[index], v[index - 1], v[index]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.clip((threshold - v0) / (v1 - v0), 0.0, 1.0)
+    times = np.where(np.isfinite(fraction), t0 + fraction * (t1 - t0), t1)
+    return times, signs
+
+
+def events(t: np.ndarray, mask: np.ndarray, v: Optional[np.ndarray] = None,
+           min_duration: float = 0.0) -> Dict[str, np.ndarray]:
+    """
+    mask 为 True 的连续片段，例如 events(t, v > 500, v) 找出所有过流区间
+    返回列数组: start / end / duration / count（以及给出 v 时的 min / max）
+    duration 为片段首末读数的时间差，小于 min_duration 的片段被丢弃
+    """
+    m = np.concatenate(([False], np.asarray(mask, dtype=bool), [False]))
+    edges = np.flatnonzero(m[1:] != m[:-1])
+    starts, stops = edges[0::2], edges[1::2]    # stops 为片段后一个下标
+    result = {'start': t[starts], 'end': t[stops - 1], 'count': stops - starts}
+    result['duration'] = result['end'] - result['start']
+    if v is not None:
+        # 交错排列起点与终点，reduceat 的偶数项即各片段自身的统计；最后一个片段到数组末尾时去掉终点
+        bounds = np.empty(2 * len(starts), dtype=np.int64)
+        bounds[0::2], bounds[1::2] = starts, stops
+        if len(bounds) and bounds[-1] == len(v):
+            bounds = bounds[:-1]
+        for key, reduce in (('min', np.fmin), ('max', np.fmax)):
+            result[key] = reduce.reduceat(v, bounds)[0::2] if len(bounds) else np.empty(0)
+    keep = result['duration'] >= min_duration
+    return {key: value[keep] for key, value in result.items()}
+
+
+# ==================== 频谱 ====================
+
+def spectrum(t: np.ndarray, v: np.ndarray, step: Optional[float] = None,
+             window: str = 'hann') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    单边幅度谱: 先线性插值到等间隔时间轴（默认中位采样间隔），去除均值后加窗做 rfft
+    返回 (频率 Hz, 幅度)，幅度与输入同单位（正弦波的峰值）；NaN 由相邻有效读数插值填补
+    """
+    valid = ~np.isnan(v)
+    t, v = t[valid], v[valid]
+    if len(t) < 4:
+        return np.empty(0), np.empty(0)
+    if step is None:
+        step = float(np.median(np.diff(t)))
+    grid = t[0] + step * np.arange(int((t[-1] - t[0]) / step) + 1)
+    x = np.interp(grid, t, v)
+    x = x - x.mean()
+    w = np.hanning(len(x)) if window == 'hann' else np.ones(len(x))
+    amplitude = np.abs(np.fft.rfft(x * w)) * 2 / w.sum()
+    return np.fft.rfftfreq(len(x), step), amplitude
+
+
+def dominant_frequency(freqs: np.ndarray, amplitude: np.ndarray) -> Optional[Tuple[float, float]]:
+    """幅度最大的非零频率 (频率, 幅度)"""
+    if len(freqs) < 2:
+        return None
+    i = int(np.argmax(amplitude[1:])) + 1
+    return float(freqs[i]), float(amplitude[i])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DM40 记录离线分析")
+    parser.add_argument('paths', nargs='+', help='CsvRecorder 记录文件')
+    parser.add_argument('--device', help='只分析该设备')
+    parser.add_argument('--mode', help='只分析该模式，例如 "DC Voltage"')
+    parser.add_argument('--threshold', type=float, help='阈值穿越检测的阈值（显示单位）')
+    parser.add_argument('--hysteresis', type=float, default=0.0, help='阈值穿越迟滞')
+    parser.add_argument('--bins', type=int, default=10, help='直方图区间数')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    session = Session.load(*args.paths)
+    print(f"读取 {len(session)} 行，用时 {time.perf_counter() - started:.2f}s")
+    session = session.select(device=args.device, mode=args.mode)
+    runs = session.runs()
+    print(f"片段 {len(runs)} 个:")
+    for run in runs[:10]:
+        print(f"  {run['device']} {run['mode']} ({run['unit']}): {run['count']} 个读数, "
+              f"{run['end'] - run['start']:.1f}s")
+    print("统计:", session.summary())
+
+    started = time.perf_counter()
+    counts, bin_edges = histogram(session.value, args.bins)
+    print("直方图:")
+    for count, low, high in zip(counts, bin_edges[:-1], bin_edges[1:]):
+        print(f"  [{low:12.4g}, {high:12.4g}) {count}")
+    if args.threshold is not None:
+        times, signs = crossings(session.t, session.value, args.threshold, args.hysteresis)
+        print(f"阈值穿越: 上升 {int((signs > 0).sum())} 次, 下降 {int((signs < 0).sum())} 次")
+    peak = dominant_frequency(*spectrum(session.t, session.value))
+    if peak:
+        print(f"主频: {peak[0]:.4g} Hz, 幅度 {peak[1]:.4g}")
+    print(f"分析用时 {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,263 @@
+"""
+DM40A 触发捕获（预触发缓冲）
+环形缓冲区持续保存最近 pre 秒的读数，触发条件满足时冻结触发前 pre 秒和触发后 post 秒的读数，
+保存为快照，用于捕捉浪涌电流、通断模式触点抖动等偶发瞬态
+
+作为读数监听器挂到 Com_DM40A / ProcessMeter 上，每个读数只做追加和一次条件判定；
+触发时交换缓冲区而不复制，快照写文件在后台线程完成，不影响采集
+
+触发条件示例（可直接用 JSON 描述）:
+    {"op": ">", "threshold": 500, "mode": "DC Current", "pre": 2, "post": 3}
+    {"op": "overload", "mode": "Continuity", "pre": 0.5, "post": 1}    通断模式开路
+    {"op": "step", "threshold": 50, "pre": 1, "post": 1}               相邻读数跳变超过 50
+"""
+import collections
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Deque, List, Optional, Tuple
+
+from dm40_rules import Rule
+
+# 相邻读数比较的触发条件: op -> trigger(prev, v, threshold)
+_EDGE_OPS = {
+    'step': lambda prev, v, t: abs(v - prev) >= t,
+    'rise': lambda prev, v, t: v - prev >= t,
+    'fall': lambda prev, v, t: prev - v >= t,
+}
+
+# 缓冲区中的样本: (时间戳, 数值, 单位, 模式)，超量程时数值为 None
+Sample = Tuple[float, Optional[float], str, str]
+
+_snapshot_ids = itertools.count(1)
+
+
+class Snapshot:
+    """一次触发冻结的读数窗口"""
+
+    def __init__(self, device_id: str, reason: str, trigger_time: float, samples: List[Sample],
+                 pre: float, post: float):
+        self.id = next(_snapshot_ids)
+        self.device_id = device_id
+        self.reason = reason
+        self.trigger_time = trigger_time
+        self.samples = samples
+        self.pre = pre
+        self.post = post
+
+    def summary(self) -> dict:
+        """不含样本的摘要，用于列表和推送"""
+        values = [s[1] for s in self.samples if s[1] is not None]
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'reason': self.reason,
+            'trigger_time': self.trigger_time,
+            'pre': self.pre,
+            'post': self.post,
+            'count': len(self.samples),
+            'min': min(values) if values else None,
+            'max': max(values) if values else None,
+            'unit': self.samples[-1][2] if self.samples else '',
+            'mode': self.samples[-1][3] if self.samples else '',
+        }
+
+    def to_dict(self) -> dict:
+        return dict(self.summary(), samples=[list(s) for s in self.samples])
+
+
+class SnapshotWriter:
+    """
+    快照文件写入器：快照放入有界队列，由后台线程写成 JSON
+    队列满时丢弃并计数，不阻塞采集
+    """
+
+    def __init__(self, directory: str, max_queue: int = 100):
+        self.directory = directory
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def __call__(self, snapshot: Snapshot):
+        try:
+            self._queue.put_nowait(snapshot)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        while True:
+            snapshot = self._queue.get()
+            stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(snapshot.trigger_time))
+            path = os.path.join(self.directory, f'capture_{snapshot.device_id}_{stamp}_{snapshot.id}.json')
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot.to_dict(), f, ensure_ascii=False)
+            except OSError as e:
+                print(f"快照保存失败 ({path}): {e}")
+
+
+class TriggeredCapture:
+    """
+    单台设备的触发捕获
+    - op: dm40_rules 的比较运算符（">"、"<"、"outside"、"overload" 等，条件由不满足变为满足时触发），
+          或 "step"/"rise"/"fall"（相邻读数变化达到 threshold 时触发）
+    - mode: 只在该模式下判定触发，None 表示任意模式
+    - pre/post: 触发前/后保留的秒数
+    - holdoff: 快照完成后至少间隔多少秒才允许再次触发
+    - single: 为 True 时只捕获一次，之后停止判定（缓冲区仍持续记录）
+    """
+
+    def __init__(self, device_id: str = '', op: str = 'step', threshold: float = 0.0, low: float = 0.0,
+                 high: float = 0.0, mode: Optional[str] = None, pre: float = 2.0, post: float = 2.0,
+                 holdoff: float = 0.0, single: bool = False, max_snapshots: int = 20):
+        if op in _EDGE_OPS:
+            self._level = None
+        else:
+            self._level = Rule('capture', op, threshold, low, high, mode=mode)   # 未知运算符抛出 ValueError
+        if pre < 0 or post < 0:
+            raise ValueError("pre/post 不能为负")
+        self.device_id = device_id
+        self.op = op
+        self.threshold = float(threshold)
+        self.low = float(low)
+        self.high = float(high)
+        self.mode = mode
+        self.pre = float(pre)
+        self.post = float(post)
+        self.holdoff = float(holdoff)
+        self.single = single
+        self.snapshots: Deque[Snapshot] = collections.deque(maxlen=max_snapshots)
+        self._listeners: List[Callable[[Snapshot], None]] = []
+        self._buffer: Deque[Sample] = collections.deque()
+        self._armed = True
+        self._manual: Optional[str] = None
+        self._pending: Optional[Tuple[str, float, Deque[Sample]]] = None     # (原因, 触发时间, 冻结的样本)
+        self._last_value: Optional[float] = None
+        self._last_true = False
+        self._holdoff_until = 0.0
+        self.triggers = 0
+
+    @classmethod
+    def from_dict(cls, spec: dict, device_id: str = '') -> 'TriggeredCapture':
+        return cls(device_id=device_id, **spec)
+
+    def to_dict(self) -> dict:
+        return {
+            'op': self.op, 'threshold': self.threshold, 'low': self.low, 'high': self.high,
+            'mode': self.mode, 'pre': self.pre, 'post': self.post, 'holdoff': self.holdoff,
+            'single': self.single, 'max_snapshots': self.snapshots.maxlen,
+        }
+
+    def status(self) -> dict:
+        """当前配置、状态和快照摘要"""
+        state = 'capturing' if self._pending is not None else ('armed' if self._armed else 'stopped')
+        return {
+            'config': self.to_dict(),
+            'state': state,
+            'triggers': self.triggers,
+            'buffered': len(self._buffer),
+            'snapshots': [s.summary() for s in list(self.snapshots)],
+        }
+
+    def add_listener(self, listener: Callable[[Snapshot], None]):
+        """快照完成时调用 listener(snapshot)（在采集线程中调用，必须很快）"""
+        self._listeners.append(listener)
+
+    def get_snapshot(self, snapshot_id: int) -> Optional[Snapshot]:
+        for snapshot in list(self.snapshots):
+            if snapshot.id == snapshot_id:
+                return snapshot
+        return None
+
+    def trigger(self, reason: str = 'manual'):
+        """手动触发，在下一个读数到达时生效（可从任意线程调用）"""
+        self._manual = reason
+
+    def arm(self):
+        """重新开始判定触发"""
+        self._last_true = False
+        self._armed = True
+
+    def disarm(self):
+        self._armed = False
+
+    def __call__(self, reading):
+        timestamp, value = reading.timestamp, reading.value
+        buffer = self._buffer
+        buffer.append((timestamp, value, reading.unit, reading.mode))
+        if self._pending is None:
+            # 只保留 pre 秒；捕获期间新缓冲区不裁剪，快照完成后统一裁剪
+            horizon = timestamp - self.pre
+            while buffer and buffer[0][0] < horizon:
+                buffer.popleft()
+        else:
+            reason, trigger_time, frozen = self._pending
+            if timestamp - trigger_time >= self.post:
+                self._finish(reason, trigger_time, frozen)
+
+        reason = self._check(reading)
+        if reason is None and self._manual is not None and self._pending is None:
+            reason, self._manual = self._manual, None
+        elif reason is not None and timestamp < self._holdoff_until:
+            reason = None
+        if reason and self._pending is None:
+            self.triggers += 1
+            # 交换缓冲区: 冻结的部分包含触发读数，之后的读数写入新缓冲区
+            self._pending = (reason, timestamp, buffer)
+            self._buffer = collections.deque()
+            if self.post <= 0:
+                self._finish(reason, timestamp, buffer)
+
+    def _check(self, reading) -> Optional[str]:
+        """判定当前读数是否触发，返回触发原因"""
+        if not self._armed or (self.mode is not None and reading.mode != self.mode):
+            self._last_value = None
+            self._last_true = False
+            return None
+        value = reading.value
+        if self._level is not None:
+            overload = reading.measurement is not None and reading.measurement.overload
+            if value is None and not (overload and self.op == 'overload'):
+                return None
+            now_true = self._level.trigger(value)
+            fired = now_true and not self._last_true
+            self._last_true = now_true
+            return f'{self.op} {self._describe()}' if fired else None
+        prev, self._last_value = self._last_value, value
+        if prev is None or value is None:
+            return None
+        if _EDGE_OPS[self.op](prev, value, self.threshold):
+            return f'{self.op} {prev} -> {value}'
+        return None
+
+    def _describe(self) -> str:
+        if self.op in ('outside', 'inside'):
+            return f'[{self.low}, {self.high}]'
+        if self.op == 'overload':
+            return ''
+        return str(self.threshold)
+
+    def _finish(self, reason: str, trigger_time: float, frozen: Deque[Sample]):
+        """触发后 post 秒已到: 合并冻结部分与之后的读数生成快照"""
+        self._pending = None
+        start = trigger_time - self.pre
+        samples = [s for s in frozen if s[0] >= start]
+        samples.extend(self._buffer)
+        horizon = self._buffer[-1][0] - self.pre if self._buffer else trigger_time
+        while self._buffer and self._buffer[0][0] < horizon:
+            self._buffer.popleft()
+        snapshot = Snapshot(self.device_id, reason.strip(), trigger_time, samples, self.pre, self.post)
+        self.snapshots.append(snapshot)
+        self._holdoff_until = trigger_time + self.post + self.holdoff
+        if self.single:
+            self._armed = False
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"快照监听器出错: {e}")
@@ -0,0 +1,233 @@
+"""
+DM40A 派生通道（虚拟万用表）
+由其他读数来源实时计算的通道，例如一台表测电压、一台表测电流时的功率 P = V × I，
+以及对功率/电流梯形积分得到的能量/电荷量。派生通道继承 ReadingPublisher，
+与 Com_DM40A 一样支持监听器、统计、记录器，可直接放入 web_server 的设备注册表
+
+    p = power(meter_v, meter_i)            # W
+    e = energy(p)                          # Wh
+    q = charge(meter_i)                    # mAh
+    p.add_listener(print)
+
+计算均使用基本单位数值（V、A、W）；各输入的读数按时间戳对齐:
+第一个输入的每个读数等到其他输入都有更晚的读数后，对其他输入做线性插值再计算，
+超过 max_gap 秒仍等不到时改用最近读数（零阶保持）
+"""
+import collections
+import threading
+from typing import Callable, Deque, List, Optional, Sequence, Tuple
+
+from dm40_protocol import UNIT_SI
+from dm40ble import ReadingPublisher
+
+
+def _si_value(reading) -> Optional[float]:
+    """读数的基本单位数值，超量程为 None"""
+    if reading.measurement is not None:
+        return reading.measurement.si_value
+    if reading.value is None:
+        return None
+    return reading.value * UNIT_SI.get(reading.unit, (reading.unit, 1.0))[1]
+
+
+class _VirtualMeter(ReadingPublisher):
+    """派生通道基类: 挂在输入上的监听器驱动计算，不需要启动/停止采集"""
+
+    def __init__(self, inputs: Sequence[ReadingPublisher], unit: str, mode: str):
+        super().__init__()
+        self.inputs = list(inputs)
+        self.unit = unit
+        self.mode = mode
+        self._lock = threading.Lock()   # 输入可能在不同线程中分发（共享事件循环、工作进程监督线程）
+        self._attached: List[Tuple[ReadingPublisher, Callable]] = []
+
+    @property
+    def description(self) -> str:
+        names = ', '.join(getattr(i, 'device_id', None) or type(i).__name__ for i in self.inputs)
+        return f"{self.mode}({names})"
+
+    def _attach(self, source: ReadingPublisher, listener: Callable):
+        source.add_listener(listener)
+        self._attached.append((source, listener))
+
+    # 与 Com_DM40A 一致的控制接口，派生通道随输入自动运行
+    def run(self, loop_ms=1000, adaptive: bool = False, **poller_options):
+        pass
+
+    def stop(self):
+        """从输入上摘除监听器"""
+        for source, listener in self._attached:
+            source.remove_listener(listener)
+        self._attached.clear()
+
+    def get_state(self) -> int:
+        return 1 if self._attached else 0
+
+    def set_mode(self, mode: int):
+        pass
+
+    def boost(self, duration: Optional[float] = None):
+        for source in self.inputs:
+            if hasattr(source, 'boost'):
+                source.boost(duration)
+
+    def set_subscriber_count(self, count: Optional[int]):
+        pass
+
+    def call(self, method: str, *args, timeout: float = 5.0, **kwargs):
+        raise RuntimeError(f"派生通道不支持 {method}")
+
+
+class DerivedChannel(_VirtualMeter):
+    """
+    逐点组合多个输入: func(第一个输入的数值, 其他输入在同一时刻的插值, ...)
+    在第一个输入的采样时刻发布，时间误差取各输入误差的较大值
+    """
+
+    def __init__(self, inputs: Sequence[ReadingPublisher], func: Callable[..., float], unit: str, mode: str,
+                 max_gap: float = 1.0):
+        if len(inputs) < 1:
+            raise ValueError("至少需要一个输入")
+        super().__init__(inputs, unit, mode)
+        self.func = func
+        self.max_gap = max_gap
+        self._pending: Deque[Tuple[float, Optional[float], Optional[float]]] = collections.deque()
+        # 其他输入最近的读数 (时间戳, 基本单位数值, 时间误差)，保留到最早的待计算时刻之前一个
+        self._history: List[Deque[Tuple[float, Optional[float], Optional[float]]]] = \
+            [collections.deque() for _ in inputs[1:]]
+        self._attach(inputs[0], self._on_driver)
+        for index in range(1, len(inputs)):
+            self._attach(inputs[index], self._make_listener(index - 1))
+
+    def _on_driver(self, reading):
+        with self._lock:
+            self._pending.append((reading.timestamp, _si_value(reading), reading.uncertainty))
+            self._process(reading.timestamp)
+
+    def _make_listener(self, index: int):
+        def listener(reading):
+            with self._lock:
+                history = self._history[index]
+                history.append((reading.timestamp, _si_value(reading), reading.uncertainty))
+                self._process(reading.timestamp)
+                # 第一个输入停止时避免无限增长: 只保留最早待计算时刻（或 max_gap 秒）之前的一个读数
+                horizon = self._pending[0][0] if self._pending else reading.timestamp - self.max_gap
+                while len(history) > 1 and history[1][0] <= horizon:
+                    history.popleft()
+        return listener
+
+    def _process(self, now: float):
+        """计算所有已能对齐的待计算读数"""
+        while self._pending:
+            t, value, uncertainty = self._pending[0]
+            others = []
+            for history in self._history:
+                sample = self._interpolate(history, t, now)
+                if sample is False:
+                    return      # 等待该输入更晚的读数
+                others.append(sample)
+            self._pending.popleft()
+            for history in self._history:
+                while len(history) > 1 and history[1][0] <= t:
+                    history.popleft()
+            if value is None or any(o is None for o in others):
+                self._publish(None, self.unit, self.mode, timestamp=t)
+                continue
+            errors = [e for e in [uncertainty] + [o[1] for o in others] if e is not None]
+            try:
+                result = self.func(value, *(o[0] for o in others))
+            except (ArithmeticError, ValueError):
+                result = None
+            self._publish(result, self.unit, self.mode, timestamp=t,
+                          uncertainty=max(errors) if errors else None)
+
+    def _interpolate(self, history, t: float, now: float):
+        """
+        输入在 t 时刻的 (数值, 时间误差)；数值未知（超量程、没有读数）时为 None，
+        需要等待更晚的读数时返回 False
+        """
+        before = after = None
+        for sample in history:
+            if sample[0] <= t:
+                before = sample
+            else:
+                after = sample
+                break
+        if after is None:
+            if now - t < self.max_gap:
+                return False
+            # 等待超时: 零阶保持
+            if before is None or t - before[0] > self.max_gap or before[1] is None:
+                return None
+            return before[1], before[2]
+        if before is None:
+            return None if after[0] - t > self.max_gap or after[1] is None else (after[1], after[2])
+        if before[1] is None or after[1] is None or after[0] - before[0] > self.max_gap:
+            return None
+        span = after[0] - before[0]
+        value = before[1] + (after[1] - before[1]) * (t - before[0]) / span if span > 0 else after[1]
+        errors = [e for e in (before[2], after[2]) if e is not None]
+        return value, max(errors) if errors else None
+
+
+class IntegratorChannel(_VirtualMeter):
+    """
+    对输入做梯形积分: 累计值 += scale × (v0 + v1) / 2 × dt（基本单位数值，dt 为秒）
+    相邻读数间隔超过 max_gap 或任一端超量程时跳过该区间
+    """
+
+    def __init__(self, source: ReadingPublisher, unit: str, mode: str, scale: float = 1.0, max_gap: float = 5.0):
+        super().__init__([source], unit, mode)
+        self.scale = scale
+        self.max_gap = max_gap
+        self.total = 0.0
+        self.skipped = 0.0      # 因间隙或超量程未计入的时长（秒）
+        self._last: Optional[Tuple[float, Optional[float]]] = None
+        self._attach(source, self._on_reading)
+
+    def reset(self):
+        """累计值清零"""
+        with self._lock:
+            self.total = 0.0
+            self.skipped = 0.0
+            self._last = None
+
+    def _on_reading(self, reading):
+        with self._lock:
+            t, value = reading.timestamp, _si_value(reading)
+            if self._last is not None:
+                t0, v0 = self._last
+                dt = t - t0
+                if dt <= 0:
+                    return
+                if v0 is None or value is None or dt > self.max_gap:
+                    self.skipped += dt
+                else:
+                    self.total += self.scale * (v0 + value) / 2 * dt
+            self._last = (t, value)
+            self._publish(self.total, self.unit, self.mode, timestamp=t, uncertainty=reading.uncertainty)
+
+
+# ==================== 常用派生通道 ====================
+
+def power(voltage: ReadingPublisher, current: ReadingPublisher, max_gap: float = 1.0) -> DerivedChannel:
+    """功率 P = V × I（W），在电压表的采样时刻计算"""
+    return DerivedChannel([voltage, current], lambda v, i: v * i, 'W', 'Power', max_gap)
+
+
+def energy(power_source: ReadingPublisher, max_gap: float = 5.0) -> IntegratorChannel:
+    """能量（Wh），power_source 为功率通道"""
+    return IntegratorChannel(power_source, 'Wh', 'Energy', 1 / 3600, max_gap)
+
+
+def charge(current: ReadingPublisher, max_gap: float = 5.0) -> IntegratorChannel:
+    """电荷量（mAh），current 为电流表"""
+    return IntegratorChannel(current, 'mAh', 'Charge', 1000 / 3600, max_gap)
+
+
+# 类型名 -> (工厂函数, 输入个数)，供 web_server 按 JSON 创建
+CHANNEL_TYPES = {
+    'power': (power, 2),
+    'energy': (energy, 1),
+    'charge': (charge, 1),
+}
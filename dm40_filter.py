@@ -0,0 +1,61 @@
+"""
+DM40A 读数变化检测 / 死区过滤
+用于读数监听器的输出过滤：界面和网络只传输有意义的变化，记录器等仍可接收全部读数
+"""
+from typing import Optional
+
+
+class ChangeFilter:
+    """
+    读数过滤器，以下任一条件满足时放行:
+    - 首个读数，或模式/单位发生变化
+    - 与上次放行的读数相差超过 deadband（change_only=False 时不比较数值，全部放行）
+    - 距上次放行超过 heartbeat 秒（None 表示不发送心跳）
+    """
+
+    def __init__(self, deadband: float = 0.0, change_only: bool = True, heartbeat: Optional[float] = None):
+        self.deadband = deadband
+        self.change_only = change_only
+        self.heartbeat = heartbeat
+        self.passed = 0
+        self.suppressed = 0
+        self.reset()
+
+    def reset(self):
+        self._last_value = None
+        self._last_unit = None
+        self._last_mode = None
+        self._last_time = None
+
+    def accept(self, reading) -> bool:
+        """判断读数是否放行，reading 为 dm40ble.Reading"""
+        if self._should_pass(reading):
+            self._last_value = reading.value
+            self._last_unit = reading.unit
+            self._last_mode = reading.mode
+            self._last_time = reading.timestamp
+            self.passed += 1
+            return True
+        self.suppressed += 1
+        return False
+
+    def _should_pass(self, reading) -> bool:
+        if self._last_time is None or reading.mode != self._last_mode or reading.unit != self._last_unit:
+            return True
+        if not self.change_only:
+            return True
+        # 心跳对超量程读数同样适用，持续 OL 的表与停止推送的数据流可以区分
+        if self.heartbeat is not None and reading.timestamp - self._last_time >= self.heartbeat:
+            return True
+        if reading.value is None or self._last_value is None:
+            return reading.value is not self._last_value
+        return abs(reading.value - self._last_value) > self.deadband
+
+    def to_dict(self) -> dict:
+        return {
+            'deadband': self.deadband,
+            'change_only': self.change_only,
+            'heartbeat': self.heartbeat,
+            'passed': self.passed,
+            'suppressed': self.suppressed,
+        }
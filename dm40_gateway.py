@@ -0,0 +1,311 @@
+"""
+DM40A 远程采集网关与汇聚服务
+
+网关 (Gateway) 部署在靠近万用表的机器上，本地采集后把读数按设备打包成
+带序号、压缩的数据块，通过 TCP 发送到汇聚服务 (Collector)；汇聚服务合并多个网关的数据流。
+
+数据块帧格式:
+    uint32 帧长度 | uint16 头长度 | 头 (JSON) | 数据 (zlib 压缩的 dm40_wire 帧，数值为 float64)
+头字段:
+    {"type": "block", "gateway": 网关ID, "session": 会话ID, "device": 设备ID, "seq": 块序号, "count": 样本数}
+连接建立后网关先发送 {"type": "hello", "gateway": 网关ID, "session": 会话ID}，汇聚服务回复
+{"type": "resume", "last": {设备ID: 本会话已收到的最大块序号}}，网关据此补发断线期间缓存的数据块。
+会话ID 在网关每次启动时随机生成，块序号从 1 重新开始；汇聚服务发现会话变化时重置该数据流的序号。
+
+本地测试（两个终端）:
+    python dm40_gateway.py collector --port 9050 --record merged.csv
+    python dm40_gateway.py gateway --id bench1 --collector 127.0.0.1:9050 --device m1=sim:// --device m2=sim://
+"""
+import asyncio
+import json
+import math
+import struct
+import uuid
+import zlib
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+import dm40_wire
+from dm40ble import Com_DM40A
+
+_FRAME = struct.Struct('>IH')
+
+
+def encode_frame(header: dict, body: bytes = b'') -> bytes:
+    """打包一帧"""
+    head = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return _FRAME.pack(_FRAME.size - 4 + len(head) + len(body), len(head)) + head + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[dict, bytes]:
+    """读取一帧，返回 (头, 数据)"""
+    length, head_len = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    payload = await reader.readexactly(length - (_FRAME.size - 4))
+    return json.loads(payload[:head_len].decode('utf-8')), payload[head_len:]
+
+
+class Gateway:
+    """
+    采集网关
+    - 每台设备的读数先进入待发送缓冲，每 batch_interval 秒或满 max_batch 个样本打包为一个数据块
+    - 最近 retain_blocks 个数据块保留在内存中，由发送循环逐块发送并等待 drain()；断线重连后按汇聚服务
+      回复的序号补发。汇聚服务跟不上时发送暂停，缓存超过 retain_blocks 后最旧的块被丢弃（汇聚服务记为序号缺口），
+      内存占用有上限
+    """
+
+    def __init__(self, gateway_id: str, collector_host: str, collector_port: int,
+                 batch_interval: float = 0.5, max_batch: int = 500, retain_blocks: int = 1000,
+                 compress_level: int = 6):
+        self.gateway_id = gateway_id
+        self.collector_host = collector_host
+        self.collector_port = collector_port
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self.compress_level = compress_level
+        self.session = uuid.uuid4().hex[:8]     # 本次运行的会话ID，网关重启后块序号重新开始
+        self.devices: Dict[str, Com_DM40A] = {}
+        self._pending: Dict[str, List[tuple]] = {}
+        self._next_seq: Dict[str, int] = {}
+        self._retained = deque(maxlen=retain_blocks)    # (device_id, seq, frame)
+        self._new_block = asyncio.Event()
+        self._stop = asyncio.Event()
+        self.sent_blocks = 0
+        self.sent_bytes = 0
+
+    def add_device(self, device_id: str, device: Com_DM40A):
+        """添加本地设备"""
+        self.devices[device_id] = device
+        self._pending[device_id] = []
+        self._next_seq[device_id] = 1
+
+        def listener(reading):
+            overload = reading.measurement is not None and reading.measurement.overload
+            pending = self._pending[device_id]
+            pending.append((reading.timestamp, math.inf if overload else reading.value, reading.unit, reading.mode))
+            if len(pending) >= self.max_batch:
+                self._flush_device(device_id)
+
+        device.add_listener(listener)
+
+    async def run(self, loop_ms: int = 200, adaptive: bool = False):
+        """启动所有设备的采集，并保持与汇聚服务的连接，直到 stop()"""
+        for device_id, device in self.devices.items():
+            if not await device.start(loop_ms, adaptive):
+                print(f"设备 {device_id} 启动失败")
+        flusher = asyncio.create_task(self._flush_loop())
+        try:
+            await self._connection_loop()
+        finally:
+            flusher.cancel()
+            self._flush_all()
+            for device in self.devices.values():
+                await device.astop()
+
+    def stop(self):
+        self._stop.set()
+
+    async def _connection_loop(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                reader, writer = await asyncio.open_connection(self.collector_host, self.collector_port)
+            except OSError as e:
+                print(f"连接汇聚服务失败: {e}，{backoff:.0f} 秒后重试")
+                await self._sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            print(f"已连接汇聚服务: {self.collector_host}:{self.collector_port}")
+            try:
+                writer.write(encode_frame({'type': 'hello', 'gateway': self.gateway_id, 'session': self.session}))
+                await writer.drain()
+                header, _ = await read_frame(reader)
+                sent = dict(header.get('last', {})) if header.get('type') == 'resume' else {}
+                # 汇聚服务不再发送数据，读取只用于发现断开
+                stop_task = asyncio.create_task(self._stop.wait())
+                read_task = asyncio.create_task(reader.read())
+                send_task = asyncio.create_task(self._send_loop(writer, sent))
+                done, _ = await asyncio.wait({stop_task, read_task, send_task}, return_when=asyncio.FIRST_COMPLETED)
+                for task in (stop_task, read_task, send_task):
+                    task.cancel()
+                if send_task in done:
+                    send_task.result()
+            except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+                print(f"汇聚服务连接中断: {e}")
+            finally:
+                writer.close()
+
+    async def _send_loop(self, writer: asyncio.StreamWriter, sent: Dict[str, int]):
+        """
+        按序发送缓存中汇聚服务尚未收到的数据块（sent: 设备ID -> 已收到的最大块序号），没有新块时等待
+        每块发送后等待 drain()，汇聚服务跟不上时新块只进入缓存，不会堆积在连接的发送缓冲中
+        """
+        while True:
+            self._new_block.clear()
+            backlog = [(device_id, seq, frame) for device_id, seq, frame in list(self._retained)
+                       if seq > sent.get(device_id, 0)]
+            for device_id, seq, frame in backlog:
+                await self._send(writer, frame)
+                sent[device_id] = seq
+            if not backlog:
+                await self._new_block.wait()
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            self._flush_all()
+
+    def _flush_all(self):
+        for device_id in self.devices:
+            self._flush_device(device_id)
+
+    def _flush_device(self, device_id: str):
+        samples = self._pending[device_id]
+        if not samples:
+            return
+        self._pending[device_id] = []
+        seq = self._next_seq[device_id]
+        self._next_seq[device_id] = seq + 1
+        body = zlib.compress(dm40_wire.encode(samples, precise=True), self.compress_level)
+        frame = encode_frame({'type': 'block', 'gateway': self.gateway_id, 'session': self.session,
+                              'device': device_id, 'seq': seq, 'count': len(samples)}, body)
+        self._retained.append((device_id, seq, frame))
+        self._new_block.set()
+
+    async def _send(self, writer: asyncio.StreamWriter, frame: bytes):
+        writer.write(frame)
+        await writer.drain()
+        self.sent_blocks += 1
+        self.sent_bytes += len(frame)
+
+
+class Collector:
+    """
+    汇聚服务，接收多个网关的数据块并合并
+    listener(source, timestamp, value, unit, mode, overload)，source 为 "网关ID/设备ID"
+    """
+
+    def __init__(self):
+        self._listeners: List[Callable] = []
+        # source -> {"session", "last_seq", "blocks", "samples", "gaps", "duplicates", "restarts"}
+        self.streams: Dict[str, dict] = {}
+
+    def add_listener(self, listener: Callable):
+        self._listeners.append(listener)
+
+    def _stream(self, source: str) -> dict:
+        if source not in self.streams:
+            self.streams[source] = {'session': None, 'last_seq': 0, 'blocks': 0, 'samples': 0, 'gaps': 0,
+                                    'duplicates': 0, 'restarts': 0}
+        return self.streams[source]
+
+    def handle_block(self, header: dict, body: bytes):
+        """处理一个数据块: 去重、记录序号缺口、解码并分发样本"""
+        source = f"{header['gateway']}/{header['device']}"
+        stream = self._stream(source)
+        session = header.get('session')
+        if session != stream['session']:
+            # 网关重启: 新会话的块序号从 1 开始
+            if stream['session'] is not None:
+                stream['restarts'] += 1
+            stream['session'] = session
+            stream['last_seq'] = 0
+        seq = header['seq']
+        if seq <= stream['last_seq']:
+            stream['duplicates'] += 1
+            return
+        if seq > stream['last_seq'] + 1:
+            stream['gaps'] += seq - stream['last_seq'] - 1
+        stream['last_seq'] = seq
+        stream['blocks'] += 1
+        schema = dm40_wire.schema()['modes']
+        samples = dm40_wire.decode(zlib.decompress(body))
+        stream['samples'] += len(samples)
+        for timestamp, value, code in samples:
+            entry = schema.get(str(code), {'mode': 'Unknown', 'unit': ''})
+            overload = value is not None and math.isinf(value)
+            for listener in self._listeners:
+                listener(source, timestamp, None if overload else value, entry['unit'], entry['mode'], overload)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername')
+        try:
+            header, _ = await read_frame(reader)
+            if header.get('type') != 'hello':
+                return
+            gateway_id, session = header['gateway'], header.get('session')
+            print(f"网关已连接: {gateway_id} {peer}")
+            prefix = f"{gateway_id}/"
+            # 只回报同一会话的序号，网关重启后从头补发
+            last = {source[len(prefix):]: stream['last_seq'] for source, stream in self.streams.items()
+                    if source.startswith(prefix) and stream['session'] == session}
+            writer.write(encode_frame({'type': 'resume', 'last': last}))
+            await writer.drain()
+            while True:
+                header, body = await read_frame(reader)
+                if header.get('type') == 'block':
+                    self.handle_block(header, body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            print(f"网关已断开: {peer}")
+
+    async def serve(self, host: str = '0.0.0.0', port: int = 9050):
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"汇聚服务已启动: {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+    from dm40_transport import transport_from_url
+
+    parser = argparse.ArgumentParser(description="DM40A 远程采集网关 / 汇聚服务")
+    sub = parser.add_subparsers(dest='role', required=True)
+
+    gw = sub.add_parser('gateway', help='运行采集网关')
+    gw.add_argument('--id', required=True, help='网关 ID')
+    gw.add_argument('--collector', required=True, help='汇聚服务地址 host:port')
+    gw.add_argument('--device', action='append', required=True,
+                    help='设备，格式 设备ID=传输URL，例如 m1=ble://D7:ED:DF:91:FC:4D 或 m1=sim://')
+    gw.add_argument('--interval', type=int, default=200, help='采样间隔(ms)')
+    gw.add_argument('--batch', type=float, default=0.5, help='打包间隔(秒)')
+
+    col = sub.add_parser('collector', help='运行汇聚服务')
+    col.add_argument('--host', default='0.0.0.0')
+    col.add_argument('--port', type=int, default=9050)
+    col.add_argument('--record', help='合并后的数据写入 CSV 文件')
+
+    args = parser.parse_args()
+
+    if args.role == 'gateway':
+        host, _, port = args.collector.rpartition(':')
+        gateway = Gateway(args.id, host, int(port), batch_interval=args.batch)
+        for spec in args.device:
+            device_id, _, url = spec.partition('=')
+            gateway.add_device(device_id, Com_DM40A(transport=transport_from_url(url)))
+        coro = gateway.run(args.interval)
+    else:
+        collector = Collector()
+        if args.record:
+            from dm40_recorder import CsvRecorder
+            recorder = CsvRecorder(args.record)
+            collector.add_listener(lambda source, t, v, unit, mode, overload:
+                                   recorder.write(t, v, unit, mode, overload=overload, device_id=source))
+        else:
+            collector.add_listener(lambda source, t, v, unit, mode, overload:
+                                   print(f"[{source}] {'OL' if overload else v} {unit} ({mode})"))
+        coro = collector.serve(args.host, args.port)
+
+    try:
+        asyncio.run(coro)
+    except KeyboardInterrupt:
+        print("\n手动停止")
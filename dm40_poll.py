@@ -0,0 +1,84 @@
+"""
+DM40A 自适应轮询速率控制
+根据命令往返时间 (RTT) 确定最快采样间隔；信号平稳或无人订阅时逐步降速，
+出现突变或报警时加速，以减少蓝牙空口占用和万用表耗电
+"""
+import time
+from typing import Optional
+
+
+class AdaptivePoller:
+    """
+    轮询间隔控制器
+    - 最短间隔: max(min_interval, rtt_factor × 平滑 RTT)
+    - 平稳: 连续 flat_count 个读数变化不超过 flat_tolerance 后，间隔每 flat_count 个读数翻倍，直至 max_interval
+    - 突变: 相对上一读数变化超过 transient_ratio 时，在 boost_duration 内使用最短间隔
+    - 无订阅者: 使用 idle_interval
+    """
+
+    def __init__(self, base_interval: float = 1.0, min_interval: float = 0.05, max_interval: float = 2.0,
+                 idle_interval: Optional[float] = None, rtt_factor: float = 1.2, flat_tolerance: float = 0.0,
+                 flat_count: int = 10, transient_ratio: float = 0.05, boost_duration: float = 2.0):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.idle_interval = idle_interval if idle_interval is not None else self.max_interval
+        self.rtt_factor = rtt_factor
+        self.flat_tolerance = flat_tolerance
+        self.flat_count = flat_count
+        self.transient_ratio = transient_ratio
+        self.boost_duration = boost_duration
+        self.rtt = None
+        self.subscribers = None     # None 表示未知（不按订阅者降速）
+        self._last_value = None
+        self._flat_streak = 0
+        self._boost_until = 0.0
+
+    def record_rtt(self, rtt: float):
+        """记录一次命令往返时间（秒），指数平滑"""
+        self.rtt = rtt if self.rtt is None else 0.875 * self.rtt + 0.125 * rtt
+
+    def observe(self, value: Optional[float]):
+        """记录一个读数，判断平稳/突变"""
+        if value is None:
+            return
+        last = self._last_value
+        self._last_value = value
+        if last is None:
+            return
+        delta = abs(value - last)
+        if delta <= self.flat_tolerance:
+            self._flat_streak += 1
+            return
+        self._flat_streak = 0
+        if delta > self.transient_ratio * max(abs(last), 1e-9):
+            self.boost()
+
+    def boost(self, duration: Optional[float] = None):
+        """在 duration 秒内以最短间隔采样（突变、报警触发时调用）"""
+        until = time.monotonic() + (self.boost_duration if duration is None else duration)
+        self._boost_until = max(self._boost_until, until)
+
+    def set_subscribers(self, count: Optional[int]):
+        """设置当前订阅者数量"""
+        self.subscribers = count
+
+    @property
+    def floor(self) -> float:
+        """由 RTT 决定的最短间隔"""
+        if self.rtt is None:
+            return self.min_interval
+        return max(self.min_interval, self.rtt * self.rtt_factor)
+
+    def next_interval(self) -> float:
+        """下一次采样间隔（秒）"""
+        floor = self.floor
+        if time.monotonic() < self._boost_until:
+            return floor
+        if self.subscribers == 0:
+            return max(floor, self.idle_interval)
+        interval = self.base_interval
+        if self._flat_streak >= self.flat_count:
+            doublings = self._flat_streak // self.flat_count
+            interval = min(self.max_interval, interval * (2 ** min(doublings, 16)))
+        return max(floor, interval)
@@ -0,0 +1,224 @@
+"""
+DM40A 通信协议: 命令帧生成、响应帧校验与解码、测量模型
+不依赖蓝牙库，可用于离线解析和测试
+
+测量响应帧（按帧尾定位）:
+- 字节5:  模式字节，见 MODE_TABLE
+- 字节-8: 标志/比例字节
+    bit0    符号（1 = 负）
+    bit1-3  小数点位置码，见 DECIMALS_BY_CODE
+    bit4-7  量程码（仅作为元数据，不参与换算）
+- 字节-7: 状态字节，见 STATUS_HOLD / STATUS_OVERLOAD（位定义为推测，待实测确认），
+          原样保存在 Measurement.status 中，默认不参与超量程判断
+- 字节-3, -2: 原始读数（小端 16 位），0xFFFF 视为超量程 (OL)
+"""
+import math
+from typing import NamedTuple, Optional
+
+# 模式字节 -> (单位, 模式名称)
+MODE_TABLE = {
+    0x30: ('mV', 'DC Voltage'),
+    0x31: ('mV', 'AC Voltage'),
+    0x39: ('mA', 'DC Current'),
+    0x3a: ('mA', 'AC Current'),
+    0x32: ('Ω', 'Resistance'),
+    0x33: ('nF', 'Capacitance'),
+    0x34: ('Hz', 'Frequency'),
+    0x35: ('°C', 'Temperature'),
+    0x36: ('V', 'Diode'),
+    0x37: ('Ω', 'Continuity'),
+}
+
+# 模式名（对应 Com_DM40A.set_<模式名>_mode）-> 模式字节
+MODE_BYTES = {
+    'dc_voltage': 0x30,
+    'ac_voltage': 0x31,
+    'dc_current': 0x39,
+    'ac_current': 0x3a,
+    'resistance': 0x32,
+    'capacitance': 0x33,
+    'frequency': 0x34,
+    'temperature': 0x35,
+    'diode': 0x36,
+    'continuity': 0x37,
+}
+
+# 显示单位 -> (基本单位, 换算系数)
+UNIT_SI = {
+    'mV': ('V', 1e-3),
+    'V': ('V', 1.0),
+    'mA': ('A', 1e-3),
+    'A': ('A', 1.0),
+    'Ω': ('Ω', 1.0),
+    'nF': ('F', 1e-9),
+    'Hz': ('Hz', 1.0),
+    '°C': ('°C', 1.0),
+    # 派生通道（dm40_derived）
+    'W': ('W', 1.0),
+    'Wh': ('Wh', 1.0),
+    'mAh': ('Ah', 1e-3),
+}
+
+# 小数点位置码 -> 小数位数
+DECIMALS_BY_CODE = {
+    2: 2,   # 0x14 / 0x15
+    3: 0,   # 0x16 / 0x17
+    4: 1,   # 0x18 / 0x19 / 0x28 / 0x29
+}
+
+STATUS_HOLD = 0x01
+STATUS_OVERLOAD = 0x02
+RAW_OVERLOAD = 0xFFFF
+
+# 测量响应帧最短长度（需要能访问字节5和字节-8）
+MIN_FRAME_LEN = 9
+
+
+class Measurement(NamedTuple):
+    """解码后的一次测量"""
+    value: Optional[float]      # 显示单位下的数值，超量程时为 None
+    unit: str                   # 显示单位，如 mV
+    mode: str                   # 模式名称，如 DC Voltage
+    si_value: Optional[float]   # 基本单位下的数值，超量程时为 None
+    base_unit: str              # 基本单位，如 V
+    decimals: int               # 显示小数位数
+    resolution: float           # 基本单位下的分辨率
+    range_code: int             # 量程码
+    negative: bool
+    overload: bool
+    hold: bool
+    raw: int                    # 原始 16 位读数
+    mode_byte: int
+    status: int = 0             # 原始状态字节（元数据）
+
+
+def decode_measurement(response: bytes, status_overload: bool = False) -> Optional[Measurement]:
+    """
+    解码测量响应帧，帧过短时返回 None
+    只有原始读数为 0xFFFF 时判为超量程；status_overload=True 时状态字节的 STATUS_OVERLOAD 位也判为超量程
+    （该位尚未在实机上确认，默认关闭）
+    """
+    if response is None or len(response) < MIN_FRAME_LEN:
+        return None
+    flags = response[-8]
+    status = response[-7]
+    mode_byte = response[5]
+    raw = response[-3] | response[-2] << 8
+
+    negative = bool(flags & 0x01)
+    decimals = DECIMALS_BY_CODE.get((flags >> 1) & 0x07, 0)
+    range_code = flags >> 4
+    overload = raw == RAW_OVERLOAD or (status_overload and bool(status & STATUS_OVERLOAD))
+    hold = bool(status & STATUS_HOLD)
+
+    if mode_byte in MODE_TABLE:
+        unit, mode = MODE_TABLE[mode_byte]
+    else:
+        unit, mode = f'0x{mode_byte:02x}', 'Unknown'
+    base_unit, factor = UNIT_SI.get(unit, (unit, 1.0))
+
+    if overload:
+        value = si_value = None
+    else:
+        value = round(raw / 10 ** decimals, 2)
+        if negative:
+            value = -value
+        si_value = value * factor
+    return Measurement(
+        value=value,
+        unit=unit,
+        mode=mode,
+        si_value=si_value,
+        base_unit=base_unit,
+        decimals=decimals,
+        resolution=factor / 10 ** decimals,
+        range_code=range_code,
+        negative=negative,
+        overload=overload,
+        hold=hold,
+        raw=raw,
+        mode_byte=mode_byte,
+        status=status,
+    )
+
+
+def format_measurement(m: Measurement) -> str:
+    """按显示精度格式化，超量程显示 OL"""
+    if m.overload:
+        return f'OL {m.unit}'
+    if m.value is None or math.isnan(m.value):
+        return f'--- {m.unit}'
+    return f'{m.value:.{m.decimals}f} {m.unit}'
+
+
+def _checksum(data: bytes) -> int:
+    """校验和: 使全部字节之和为 0 (mod 256)"""
+    return -sum(data) & 0xFF
+
+
+def encode_measurement_frame(mode_byte: int, value: Optional[float], decimals: int = 1,
+                             range_code: int = 1, hold: bool = False) -> bytes:
+    """
+    按 decode_measurement 的字段布局生成测量响应帧（用于模拟器、回环测试和数据回放）
+    value 为 None 时生成超量程 (OL) 帧
+    """
+    code = {d: c for c, d in DECIMALS_BY_CODE.items()}.get(decimals, 3)
+    if value is None:
+        raw, negative = RAW_OVERLOAD, False
+    else:
+        raw = min(int(round(abs(value) * 10 ** decimals)), RAW_OVERLOAD - 1)
+        negative = value < 0
+    flags = (range_code & 0x0F) << 4 | code << 1 | int(negative)
+    status = STATUS_HOLD if hold else 0
+    body = bytes([0xaf, 0x05, 0x03, 0x09, 0x0c, mode_byte, 0, 0, 0, 0,
+                  flags, status, 0, 0, 0, raw & 0xFF, raw >> 8])
+    return body + bytes([_checksum(body)])
+
+
+# ==================== 命令帧 ====================
+# 帧格式: AF 05 03 <命令> <负载长度> <负载...> <校验和>，校验和使全部字节之和为 0 (mod 256)
+
+FRAME_HEADER = b'\xaf\x05\x03'
+FRAME_OVERHEAD = len(FRAME_HEADER) + 3      # 命令 + 长度 + 校验和
+
+CMD_MODE = 0x06     # 设置模式，负载 1 字节模式字节，应答回显命令
+CMD_READ = 0x09     # 读取测量值，无负载，应答负载见 decode_measurement
+
+
+def build_command(cmd: int, payload: bytes = b'') -> bytes:
+    """生成命令帧，自动填写负载长度和校验和"""
+    if not 0 <= cmd <= 0xFF:
+        raise ValueError(f"命令字节超出范围: {cmd}")
+    if len(payload) > 0xFF:
+        raise ValueError(f"负载过长: {len(payload)} 字节")
+    body = FRAME_HEADER + bytes([cmd, len(payload)]) + bytes(payload)
+    return body + bytes([_checksum(body)])
+
+
+# 预生成的命令帧（不可变 bytes，发送时不再分配）
+READ_COMMAND = build_command(CMD_READ)
+MODE_COMMANDS = {name: build_command(CMD_MODE, bytes([mode_byte])) for name, mode_byte in MODE_BYTES.items()}
+
+
+def frame_length(data: bytes) -> Optional[int]:
+    """按帧头中的负载长度计算整帧长度，数据不足 5 字节或帧头不符时返回 None"""
+    if len(data) < len(FRAME_HEADER) + 2 or not data.startswith(FRAME_HEADER):
+        return None
+    return data[len(FRAME_HEADER) + 1] + FRAME_OVERHEAD
+
+
+def check_response(cmd: bytes, response: bytes) -> Optional[str]:
+    """
+    检查应答帧是否符合 cmd 对应的帧格式: 帧头、命令字节、长度和校验和
+    符合时返回 None，否则返回错误说明
+    """
+    expected = frame_length(response)
+    if expected is None:
+        return f"帧头错误: {bytes(response[:5]).hex()}"
+    if len(response) != expected:
+        return f"长度错误: 应为 {expected} 字节，实际 {len(response)} 字节"
+    if response[3] != cmd[3]:
+        return f"命令不符: 发送 0x{cmd[3]:02x}，应答 0x{response[3]:02x}"
+    if sum(response) & 0xFF:
+        return f"校验和错误: {bytes(response).hex()}"
+    return None
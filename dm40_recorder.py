@@ -0,0 +1,69 @@
+"""
+DM40A 读数记录器
+以全分辨率把读数写入 CSV 文件（不经过界面的变化过滤），供离线分析使用
+CSV 列: timestamp, device_id, value, unit, mode, si_value, base_unit, overload
+si_value 为基本单位（V/A/Ω/F/Hz/°C）下的数值，可直接作为 float64 数组分析
+"""
+import csv
+import threading
+import time
+from typing import Optional
+
+from dm40_protocol import UNIT_SI
+
+CSV_HEADER = ['timestamp', 'device_id', 'value', 'unit', 'mode', 'si_value', 'base_unit', 'overload']
+
+
+class CsvRecorder:
+    """CSV 读数记录器，可作为 Com_DM40A 的读数监听器"""
+
+    def __init__(self, path: str, device_id: str = '', flush_interval: float = 1.0):
+        self.path = path
+        self.device_id = device_id
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if self._file.tell() == 0:
+            self._writer.writerow(CSV_HEADER)
+        self._last_flush = time.monotonic()
+
+    def __call__(self, reading):
+        """监听器入口，reading 为 dm40ble.Reading"""
+        m = reading.measurement
+        if m is None:
+            self.write(reading.timestamp, reading.value, reading.unit, reading.mode)
+        else:
+            self.write(reading.timestamp, reading.value, reading.unit, reading.mode,
+                       m.si_value, m.base_unit, m.overload)
+
+    def write(self, timestamp: float, value: Optional[float], unit: str, mode: str,
+              si_value: Optional[float] = None, base_unit: str = '', overload: bool = False,
+              device_id: Optional[str] = None):
+        """写入一行；未给出 si_value 时按单位换算，device_id 默认为构造时指定的设备"""
+        if si_value is None and value is not None and unit in UNIT_SI:
+            base_unit, factor = UNIT_SI[unit]
+            si_value = value * factor
+        with self._lock:
+            if self._file.closed:
+                return
+            self._writer.writerow([f'{timestamp:.6f}', self.device_id if device_id is None else device_id,
+                                   '' if value is None else value, unit, mode,
+                                   '' if si_value is None else repr(si_value), base_unit, int(overload)])
+            self.count += 1
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
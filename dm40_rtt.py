@@ -0,0 +1,85 @@
+"""
+DM40A 命令超时估计
+按 TCP 重传超时算法 (RFC 6298) 根据实测往返时间 (RTT) 计算每类命令的超时:
+    SRTT   <- (1 - alpha) * SRTT + alpha * RTT
+    RTTVAR <- (1 - beta) * RTTVAR + beta * |SRTT - RTT|
+    RTO     = SRTT + max(G, K * RTTVAR)，限制在 [min_rto, max_rto]
+超时后 RTO 加倍（指数退避），下一次有效采样后恢复；重发后收到的应答不计入 RTT（Karn 算法）
+"""
+from typing import NamedTuple
+
+
+class TimeoutClass(NamedTuple):
+    """一类命令的超时参数"""
+    initial: float      # 尚无 RTT 采样时的超时（秒）
+    min_rto: float
+    max_rto: float
+    retries: int        # 超时后立即重发的次数
+
+
+# 命令类别 -> 超时参数
+# 读数命令应答快且可重复发送；模式切换时万用表需要重新配置，超时下限较高
+COMMAND_CLASSES = {
+    'read': TimeoutClass(initial=1.0, min_rto=0.05, max_rto=2.0, retries=1),
+    'mode': TimeoutClass(initial=2.0, min_rto=0.5, max_rto=5.0, retries=1),
+    'custom': TimeoutClass(initial=1.0, min_rto=0.1, max_rto=3.0, retries=0),
+}
+
+# 命令字节 (帧第 4 字节) -> 命令类别
+_CLASS_BY_CMD = {0x09: 'read', 0x06: 'mode'}
+
+
+def command_class(cmd: bytes) -> str:
+    """根据命令帧判断命令类别"""
+    if len(cmd) >= 4:
+        return _CLASS_BY_CMD.get(cmd[3], 'custom')
+    return 'custom'
+
+
+class RttEstimator:
+    """单类命令的 SRTT/RTTVAR 估计与重传超时"""
+
+    def __init__(self, initial: float = 1.0, min_rto: float = 0.05, max_rto: float = 2.0,
+                 alpha: float = 0.125, beta: float = 0.25, k: float = 4.0, granularity: float = 0.01):
+        self.initial = initial
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self._backoff = 1
+
+    @classmethod
+    def for_class(cls, timeout_class: TimeoutClass) -> 'RttEstimator':
+        return cls(timeout_class.initial, timeout_class.min_rto, timeout_class.max_rto)
+
+    def sample(self, rtt: float):
+        """记录一次有效的 RTT（秒）"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.samples += 1
+        self._backoff = 1
+
+    def backoff(self):
+        """发生超时，RTO 加倍"""
+        self._backoff = min(self._backoff * 2, 64)
+
+    @property
+    def rto(self) -> float:
+        """当前重传超时（秒）"""
+        if self.srtt is None:
+            base = self.initial
+        else:
+            base = max(self.min_rto, self.srtt + max(self.granularity, self.k * self.rttvar))
+        return min(self.max_rto, base * self._backoff)
+
+    def to_dict(self) -> dict:
+        return {'srtt': self.srtt, 'rttvar': self.rttvar, 'rto': self.rto, 'samples': self.samples}
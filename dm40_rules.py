@@ -0,0 +1,275 @@
+"""
+DM40A 阈值/报警规则引擎
+在每个读数上内联判定（带迟滞和持续时间），报警动作（日志、Webhook、Socket.IO 等）
+交给后台线程异步执行，不阻塞采集循环
+
+规则示例（可直接用 JSON 描述）:
+    {"id": "overcurrent", "mode": "DC Current", "op": ">", "threshold": 500,
+     "duration": 0.2, "hysteresis": 10, "actions": ["log", "socketio"]}
+    {"id": "open", "mode": "Continuity", "op": "overload", "actions": ["log"]}
+    {"id": "window", "device": "bench1", "op": "outside", "low": 4.75, "high": 5.25,
+     "actions": ["webhook:ops"]}
+
+Webhook 目标只能在服务器端用 ActionDispatcher.register_webhook("ops", "http://...") 配置，
+规则中按名称引用，避免通过接口让服务器请求任意地址
+"""
+import json
+import queue
+import threading
+import urllib.parse
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 触发条件和恢复条件: op -> (trigger(v, rule), release(v, rule))
+# 恢复条件向安全侧偏移 hysteresis，避免在阈值附近来回跳变
+_OPS = {
+    '>': (lambda v, r: v > r.threshold, lambda v, r: v <= r.threshold - r.hysteresis),
+    '>=': (lambda v, r: v >= r.threshold, lambda v, r: v < r.threshold - r.hysteresis),
+    '<': (lambda v, r: v < r.threshold, lambda v, r: v >= r.threshold + r.hysteresis),
+    '<=': (lambda v, r: v <= r.threshold, lambda v, r: v > r.threshold + r.hysteresis),
+    'outside': (lambda v, r: v < r.low or v > r.high,
+                lambda v, r: r.low + r.hysteresis <= v <= r.high - r.hysteresis),
+    'inside': (lambda v, r: r.low <= v <= r.high,
+               lambda v, r: v < r.low - r.hysteresis or v > r.high + r.hysteresis),
+    # 超量程 (OL)，例如通断模式开路；超量程读数的 value 为 None
+    'overload': (lambda v, r: v is None, lambda v, r: v is not None),
+}
+
+
+class Rule:
+    """单条规则，构造时编译判定函数"""
+
+    def __init__(self, id: str, op: str, threshold: float = 0.0, low: float = 0.0, high: float = 0.0,
+                 duration: float = 0.0, hysteresis: float = 0.0, device: Optional[str] = None,
+                 mode: Optional[str] = None, actions: Optional[List[str]] = None, message: str = ''):
+        if op not in _OPS:
+            raise ValueError(f"未知比较运算符: {op}")
+        self.id = id
+        self.op = op
+        self.threshold = float(threshold)
+        self.low = float(low)
+        self.high = float(high)
+        self.duration = float(duration)
+        self.hysteresis = float(hysteresis)
+        self.device = device
+        self.mode = mode
+        self.actions = list(actions or ['log'])
+        self.message = message
+        trigger, release = _OPS[op]
+        # 绑定为单参数闭包，判定时不再查表
+        self.trigger = lambda v: trigger(v, self)
+        self.release = lambda v: release(v, self)
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'Rule':
+        return cls(**spec)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id, 'op': self.op, 'threshold': self.threshold, 'low': self.low, 'high': self.high,
+            'duration': self.duration, 'hysteresis': self.hysteresis, 'device': self.device,
+            'mode': self.mode, 'actions': self.actions, 'message': self.message,
+        }
+
+
+class _RuleState:
+    """规则在某台设备上的判定状态"""
+    __slots__ = ('since', 'active')
+
+    def __init__(self):
+        self.since = None   # 条件开始满足的时间
+        self.active = False
+
+
+class ActionDispatcher:
+    """
+    报警动作分发器：事件放入有界队列，由后台线程执行
+    队列满时丢弃事件并计数，保证采集循环永不阻塞
+    动作名: "log"、"webhook:<名称>"（名称须先用 register_webhook() 配置），以及通过 register() 注册的自定义动作
+    """
+
+    def __init__(self, max_queue: int = 1000, webhook_timeout: float = 3.0):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._handlers: Dict[str, Callable[[dict], None]] = {'log': self._log}
+        self._webhooks: Dict[str, str] = {}
+        self._webhook_timeout = webhook_timeout
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def register(self, name: str, handler: Callable[[dict], None]):
+        """注册自定义动作，handler(event)"""
+        self._handlers[name] = handler
+
+    def register_webhook(self, name: str, url: str):
+        """配置 Webhook 目标，规则中以 "webhook:<name>" 引用；只允许 http/https"""
+        if urllib.parse.urlparse(url).scheme not in ('http', 'https'):
+            raise ValueError(f"Webhook 只支持 http/https: {url}")
+        self._webhooks[name] = url
+
+    def validate(self, action: str):
+        """检查动作是否可执行，未知动作或未配置的 Webhook 抛出 ValueError"""
+        if action.startswith('webhook:'):
+            if action[len('webhook:'):] not in self._webhooks:
+                raise ValueError(f"未配置的 Webhook: {action[len('webhook:'):]}")
+        elif action not in self._handlers:
+            raise ValueError(f"未知报警动作: {action}")
+
+    def submit(self, actions: List[str], event: dict):
+        try:
+            self._queue.put_nowait((actions, event))
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        while True:
+            actions, event = self._queue.get()
+            for action in actions:
+                try:
+                    if action.startswith('webhook:'):
+                        url = self._webhooks.get(action[len('webhook:'):])
+                        if url is None:
+                            print(f"未配置的 Webhook: {action}")
+                        else:
+                            self._webhook(url, event)
+                    elif action in self._handlers:
+                        self._handlers[action](event)
+                    else:
+                        print(f"未知报警动作: {action}")
+                except Exception as e:
+                    print(f"报警动作执行失败 ({action}): {e}")
+
+    @staticmethod
+    def _log(event: dict):
+        state = '触发' if event['state'] == 'triggered' else '恢复'
+        print(f"[报警{state}] {event['rule_id']} @ {event['device_id']}: "
+              f"{event['value']} {event['unit']} ({event['mode']}) {event['message']}")
+
+    def _webhook(self, url: str, event: dict):
+        import urllib.request
+
+        req = urllib.request.Request(url, data=json.dumps(event).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(req, timeout=self._webhook_timeout):
+            pass
+
+
+class RuleEngine:
+    """
+    规则引擎
+    规则按 (设备, 模式) 建立索引，每个读数只判定相关规则
+    索引列表写时复制，采集线程判定时无需加锁
+    """
+
+    def __init__(self, dispatcher: Optional[ActionDispatcher] = None):
+        self.dispatcher = dispatcher or ActionDispatcher()
+        self._rules: Dict[str, Rule] = {}
+        self._index: Dict[Tuple[Optional[str], Optional[str]], List[Rule]] = {}
+        self._states: Dict[Tuple[str, str], _RuleState] = {}
+        self._event_listeners: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+
+    def add_rule(self, rule: Rule) -> Rule:
+        """添加或替换规则，动作不可执行时抛出 ValueError"""
+        for action in rule.actions:
+            self.dispatcher.validate(action)
+        with self._lock:
+            self._remove(rule.id)
+            self._rules[rule.id] = rule
+            key = (rule.device, rule.mode)
+            self._index[key] = self._index.get(key, []) + [rule]
+        return rule
+
+    def remove_rule(self, rule_id: str) -> bool:
+        with self._lock:
+            return self._remove(rule_id)
+
+    def _remove(self, rule_id: str) -> bool:
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return False
+        key = (rule.device, rule.mode)
+        self._index[key] = [r for r in self._index[key] if r is not rule]
+        for key in [k for k in list(self._states) if k[0] == rule_id]:
+            del self._states[key]
+        return True
+
+    def rules(self) -> List[Rule]:
+        return list(self._rules.values())
+
+    def has_rules(self, device_id: str) -> bool:
+        """是否有规则适用于该设备（包括不限设备的规则）"""
+        return any(rule.device in (None, device_id) for rule in list(self._rules.values()))
+
+    def add_event_listener(self, listener: Callable[[dict], None]):
+        """同步事件监听（在采集线程中调用，必须很快，例如通知轮询控制器加速）"""
+        self._event_listeners.append(listener)
+
+    def attach(self, device, device_id: str) -> Callable:
+        """作为读数监听器挂到 Com_DM40A 上，返回监听函数以便移除"""
+        def listener(reading):
+            overload = reading.measurement is not None and reading.measurement.overload
+            self.evaluate(device_id, reading.value, reading.unit, reading.mode, reading.timestamp, overload)
+        device.add_listener(listener)
+        return listener
+
+    def detach(self, device, device_id: str, listener: Callable):
+        """移除 attach() 返回的监听函数，并清除该设备的判定状态（包括触发中的报警）"""
+        device.remove_listener(listener)
+        with self._lock:
+            for key in [k for k in list(self._states) if k[1] == device_id]:
+                del self._states[key]
+
+    def evaluate(self, device_id: str, value: Optional[float], unit: str, mode: str, timestamp: float,
+                 overload: bool = False):
+        """对一个读数判定所有相关规则；超量程读数 (value 为 None) 只参与 overload 规则"""
+        if value is None and not overload:
+            return
+        index = self._index
+        for key in ((None, None), (None, mode), (device_id, None), (device_id, mode)):
+            rules = index.get(key)
+            if not rules:
+                continue
+            for rule in rules:
+                if value is None and rule.op != 'overload':
+                    continue
+                self._evaluate_rule(rule, device_id, value, unit, mode, timestamp)
+
+    def _evaluate_rule(self, rule: Rule, device_id: str, value: Optional[float], unit: str, mode: str, timestamp: float):
+        key = (rule.id, device_id)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _RuleState()
+
+        if not state.active:
+            if rule.trigger(value):
+                if state.since is None:
+                    state.since = timestamp
+                if timestamp - state.since >= rule.duration:
+                    state.active = True
+                    self._emit(rule, 'triggered', device_id, value, unit, mode, timestamp)
+            else:
+                state.since = None
+        elif rule.release(value):
+            state.active = False
+            state.since = None
+            self._emit(rule, 'cleared', device_id, value, unit, mode, timestamp)
+
+    def _emit(self, rule: Rule, state: str, device_id: str, value: Optional[float], unit: str, mode: str, timestamp: float):
+        event = {
+            'rule_id': rule.id,
+            'device_id': device_id,
+            'state': state,
+            'value': value,
+            'unit': unit,
+            'mode': mode,
+            'timestamp': timestamp,
+            'message': rule.message,
+        }
+        for listener in self._event_listeners:
+            listener(event)
+        self.dispatcher.submit(rule.actions, event)
+
+    def active_alarms(self) -> List[dict]:
+        """当前处于触发状态的报警"""
+        return [{'rule_id': rule_id, 'device_id': device_id}
+                for (rule_id, device_id), state in list(self._states.items()) if state.active]
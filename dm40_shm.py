@@ -0,0 +1,342 @@
+"""
+DM40A 共享内存读数环形缓冲区
+单写者/多读者，定长读数记录，基于 multiprocessing.shared_memory，跨进程传递读数无需序列化、不经过 socket
+本机其他进程（记录器、分析脚本、Notebook）可按名称打开缓冲区，各自维护读取位置:
+
+    reader = ShmReader('dm40_default')
+    for record in reader.follow():
+        print(record.value, record.unit)
+
+命令行查看: python dm40_shm.py dm40_default
+
+内存布局（小端）:
+    [0:16]   魔数 "DM40" | uint16 版本 | uint16 记录长度 | uint32 容量 | 填充
+    [16:24]  int64   已写入的最大序号 write_seq（序号从 1 开始）
+    [24:32]  float64 写者心跳（time.monotonic）
+    [32:40]  int32   写者状态（同 Com_DM40A.get_state）| int32 写者进程 PID
+    [40:48]  float64 创建时间（time.time），同名缓冲区被重建时读者据此重新打开
+    [64:]    capacity 条记录，序号 seq 的记录位于槽 seq % capacity
+
+记录写入顺序: 先把记录的序号置为 -1，写入内容，最后写入序号（类似 seqlock）；
+读者在复制前后各读一次序号，两次都等于期望序号才认为记录有效，否则说明该槽已被覆盖。
+"""
+import math
+import os
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from dm40_protocol import Measurement
+
+MAGIC = b'DM40'
+VERSION = 3
+
+_LAYOUT = struct.Struct('<4sHHI4x')
+_SEQ = struct.Struct('<q')
+_HEARTBEAT = struct.Struct('<d')
+_STATE = struct.Struct('<ii')
+_CREATED = struct.Struct('<d')
+_WRITE_SEQ_OFFSET = 16
+_HEARTBEAT_OFFSET = 24
+_STATE_OFFSET = 32
+_CREATED_OFFSET = 40
+HEADER_SIZE = 64
+
+# 记录: seq | timestamp | value | si_value | resolution | mode_byte | decimals | range_code | flags | raw
+#       | unit | mode | base_unit | uncertainty | mono
+# value/si_value/uncertainty/mono 为 NaN 表示无数值；flags 见 FLAG_*
+_RECORD = struct.Struct('<qddddBBBBH2x8s24s8sdd')
+RECORD_SIZE = _RECORD.size
+
+FLAG_MEASUREMENT = 0x01     # 带完整测量信息
+FLAG_OVERLOAD = 0x02
+FLAG_HOLD = 0x04
+FLAG_NEGATIVE = 0x08
+
+
+class ShmRecord(NamedTuple):
+    """从环形缓冲区读出的一条读数"""
+    seq: int
+    timestamp: float
+    value: Optional[float]
+    unit: str
+    mode: str
+    measurement: Optional[Measurement]
+    uncertainty: Optional[float] = None     # 时间戳误差（秒）
+    mono: Optional[float] = None            # 采样时刻（time.monotonic，本机各进程共用同一时钟）
+
+
+def _text(raw: bytes) -> str:
+    return raw.rstrip(b'\0').decode('utf-8', errors='ignore')
+
+
+def _nan_if_none(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def _none_if_nan(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _attach(name: str, track: bool) -> shared_memory.SharedMemory:
+    """
+    打开已存在的共享内存
+    track=False 时不登记到本进程的 resource_tracker，否则进程退出时会把写者的缓冲区一并删除
+    （用于与写者无父子关系的独立读者进程）
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=track)
+    shm = shared_memory.SharedMemory(name=name)
+    if not track:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class ShmRing:
+    """
+    共享内存读数环形缓冲区
+    - ShmRing(capacity=N, create=True) 创建（name 不指定时自动生成），由创建者负责 unlink()；
+      replace=True 时删除同名的残留缓冲区（例如上次异常退出未清理）后重建
+    - ShmRing(name) 按名称打开已存在的缓冲区，独立读者进程传 track=False
+    同一时间只能有一个写者；写者重启后从 write_seq 继续编号，读者不会看到序号回退
+    读者之间互不影响，各自的读取位置见 ShmReader
+    """
+
+    def __init__(self, name: Optional[str] = None, capacity: int = 4096, create: bool = False,
+                 replace: bool = False, track: bool = True):
+        if create:
+            size = HEADER_SIZE + capacity * RECORD_SIZE
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                if not replace:
+                    raise
+                stale = _attach(name, track=True)
+                stale.close()
+                stale.unlink()
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._buf = self._shm.buf
+            _LAYOUT.pack_into(self._buf, 0, MAGIC, VERSION, RECORD_SIZE, capacity)
+            _SEQ.pack_into(self._buf, _WRITE_SEQ_OFFSET, 0)
+            _HEARTBEAT.pack_into(self._buf, _HEARTBEAT_OFFSET, 0.0)
+            _STATE.pack_into(self._buf, _STATE_OFFSET, 0, os.getpid())
+            _CREATED.pack_into(self._buf, _CREATED_OFFSET, time.time())
+            for slot in range(capacity):
+                _SEQ.pack_into(self._buf, HEADER_SIZE + slot * RECORD_SIZE, -1)
+        else:
+            self._shm = _attach(name, track)
+            self._buf = self._shm.buf
+            magic, version, record_size, capacity = _LAYOUT.unpack_from(self._buf, 0)
+            if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+                self._shm.close()
+                raise ValueError(f"不是 DM40 读数缓冲区或版本不兼容: {name}")
+        self.capacity = capacity
+        self.owner = create
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    # ==================== 头部 ====================
+
+    @property
+    def write_seq(self) -> int:
+        """已写入的最大序号，尚未写入时为 0"""
+        return _SEQ.unpack_from(self._buf, _WRITE_SEQ_OFFSET)[0]
+
+    @property
+    def heartbeat(self) -> float:
+        """写者最近一次心跳的 time.monotonic() 时间，从未心跳时为 0"""
+        return _HEARTBEAT.unpack_from(self._buf, _HEARTBEAT_OFFSET)[0]
+
+    @property
+    def state(self) -> int:
+        return _STATE.unpack_from(self._buf, _STATE_OFFSET)[0]
+
+    @property
+    def pid(self) -> int:
+        return _STATE.unpack_from(self._buf, _STATE_OFFSET)[1]
+
+    @property
+    def created(self) -> float:
+        """创建时间，用于识别同名缓冲区是否已被重建"""
+        return _CREATED.unpack_from(self._buf, _CREATED_OFFSET)[0]
+
+    def beat(self, state: int):
+        """写者心跳，同时更新写者状态"""
+        _STATE.pack_into(self._buf, _STATE_OFFSET, state, os.getpid())
+        _HEARTBEAT.pack_into(self._buf, _HEARTBEAT_OFFSET, time.monotonic())
+
+    # ==================== 写入 ====================
+
+    def write(self, timestamp: float, value: Optional[float], unit: str, mode: str,
+              measurement: Optional[Measurement] = None, uncertainty: Optional[float] = None,
+              mono: Optional[float] = None) -> int:
+        """写入一条读数，返回序号"""
+        seq = self.write_seq + 1
+        offset = HEADER_SIZE + (seq % self.capacity) * RECORD_SIZE
+        if measurement is None:
+            fields = (math.nan, math.nan, 0, 0, 0, 0, 0, b'')
+        else:
+            m = measurement
+            flags = (FLAG_MEASUREMENT | FLAG_OVERLOAD * m.overload | FLAG_HOLD * m.hold
+                     | FLAG_NEGATIVE * m.negative)
+            fields = (_nan_if_none(m.si_value), m.resolution, m.mode_byte, m.decimals, m.range_code,
+                      flags, m.raw, m.base_unit.encode('utf-8')[:8])
+        si_value, resolution, mode_byte, decimals, range_code, flags, raw, base_unit = fields
+        _SEQ.pack_into(self._buf, offset, -1)
+        _RECORD.pack_into(self._buf, offset, -1, timestamp, _nan_if_none(value), si_value, resolution,
+                          mode_byte, decimals, range_code, flags, raw,
+                          unit.encode('utf-8')[:8], mode.encode('utf-8')[:24], base_unit,
+                          _nan_if_none(uncertainty), _nan_if_none(mono))
+        _SEQ.pack_into(self._buf, offset, seq)
+        _SEQ.pack_into(self._buf, _WRITE_SEQ_OFFSET, seq)
+        return seq
+
+    def __call__(self, reading) -> int:
+        """作为读数监听器使用，reading 为 dm40ble.Reading"""
+        return self.write(reading.timestamp, reading.value, reading.unit, reading.mode, reading.measurement,
+                          reading.uncertainty, reading.mono)
+
+    # ==================== 读取 ====================
+
+    def read_since(self, last_seq: int, max_count: Optional[int] = None) -> Tuple[List[ShmRecord], int]:
+        """
+        读取序号大于 last_seq 的记录
+        返回: (记录列表, 丢失条数)；读者落后超过一圈或读取期间记录被覆盖时计入丢失
+        """
+        head = self.write_seq
+        first = max(last_seq + 1, head - self.capacity + 1)
+        lost = max(0, first - last_seq - 1)
+        if max_count is not None:
+            head = min(head, first + max_count - 1)
+        records = []
+        for seq in range(first, head + 1):
+            offset = HEADER_SIZE + (seq % self.capacity) * RECORD_SIZE
+            fields = _RECORD.unpack_from(self._buf, offset)
+            if fields[0] != seq or _SEQ.unpack_from(self._buf, offset)[0] != seq:
+                lost += 1
+                continue
+            records.append(self._record(fields))
+        return records, lost
+
+    @staticmethod
+    def _record(fields: tuple) -> ShmRecord:
+        (seq, timestamp, value, si_value, resolution, mode_byte, decimals, range_code, flags, raw,
+         unit, mode, base_unit, uncertainty, mono) = fields
+        value = _none_if_nan(value)
+        unit, mode = _text(unit), _text(mode)
+        measurement = None
+        if flags & FLAG_MEASUREMENT:
+            measurement = Measurement(
+                value=value, unit=unit, mode=mode, si_value=_none_if_nan(si_value),
+                base_unit=_text(base_unit), decimals=decimals, resolution=resolution,
+                range_code=range_code, negative=bool(flags & FLAG_NEGATIVE),
+                overload=bool(flags & FLAG_OVERLOAD), hold=bool(flags & FLAG_HOLD),
+                raw=raw, mode_byte=mode_byte)
+        return ShmRecord(seq, timestamp, value, unit, mode, measurement, _none_if_nan(uncertainty),
+                         _none_if_nan(mono))
+
+    # ==================== 释放 ====================
+
+    def close(self):
+        """解除映射（不删除共享内存）"""
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """删除共享内存（仅创建者调用）"""
+        self._shm.unlink()
+
+
+class ShmReader:
+    """
+    共享内存缓冲区的独立读者，维护自己的读取位置
+    - start="latest" 只读之后的新读数，"oldest" 从缓冲区中最早的读数开始
+    - 读者落后超过一圈（被写者套圈）时跳到最早的有效记录，lost 累计丢失条数，laps 累计被套圈次数
+    - 写者以同名重建缓冲区（例如 Web 服务重启）后，follow() 空闲时会自动重新打开
+    """
+
+    def __init__(self, name: str, start: str = 'latest', track: bool = False):
+        self.name = name
+        self.start = start
+        self.track = track
+        self.lost = 0
+        self.laps = 0
+        self.ring = ShmRing(name, track=track)
+        self.last_seq = self._start_seq()
+
+    def _start_seq(self) -> int:
+        head = self.ring.write_seq
+        return head if self.start == 'latest' else max(0, head - self.ring.capacity)
+
+    @property
+    def backlog(self) -> int:
+        """尚未读取的读数条数"""
+        return self.ring.write_seq - self.last_seq
+
+    def read(self, max_count: Optional[int] = None) -> List[ShmRecord]:
+        """读取新读数（不阻塞），没有新读数时返回空列表"""
+        if self.ring.write_seq - self.last_seq > self.ring.capacity:
+            self.laps += 1
+        records, lost = self.ring.read_since(self.last_seq, max_count)
+        self.lost += lost
+        if records:
+            self.last_seq = records[-1].seq
+        elif lost:
+            self.last_seq = self.ring.write_seq
+        return records
+
+    def reopen_if_replaced(self) -> bool:
+        """同名缓冲区已被重建时重新打开并从头读取，返回是否重新打开"""
+        try:
+            ring = ShmRing(self.name, track=self.track)
+        except (FileNotFoundError, ValueError):
+            return False
+        if ring.created == self.ring.created:
+            ring.close()
+            return False
+        self.ring.close()
+        self.ring = ring
+        self.last_seq = 0
+        return True
+
+    def follow(self, poll_interval: float = 0.02, reopen_interval: float = 1.0) -> Iterator[ShmRecord]:
+        """持续读取新读数的迭代器"""
+        idle_since = time.monotonic()
+        while True:
+            records = self.read()
+            if records:
+                idle_since = time.monotonic()
+                yield from records
+                continue
+            if time.monotonic() - idle_since >= reopen_interval:
+                self.reopen_if_replaced()
+                idle_since = time.monotonic()
+            time.sleep(poll_interval)
+
+    def close(self):
+        self.ring.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查看 DM40A 共享内存读数缓冲区")
+    parser.add_argument('name', help='缓冲区名称，例如 dm40_default')
+    parser.add_argument('--oldest', action='store_true', help='从缓冲区中最早的读数开始')
+    args = parser.parse_args()
+
+    reader = ShmReader(args.name, start='oldest' if args.oldest else 'latest')
+    print(f"已打开 {args.name}: 容量 {reader.ring.capacity}，写者 PID {reader.ring.pid}，序号 {reader.ring.write_seq}")
+    try:
+        for record in reader.follow():
+            value = 'OL' if record.measurement is not None and record.measurement.overload else record.value
+            print(f"#{record.seq} {record.timestamp:.3f} {value} {record.unit} ({record.mode})"
+                  + (f" 丢失 {reader.lost}" if reader.lost else ''))
+    except KeyboardInterrupt:
+        print("\n手动停止")
+    finally:
+        reader.close()
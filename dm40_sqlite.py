@@ -0,0 +1,176 @@
+"""
+DM40A SQLite 读数存储（可选后端）
+单文件保存所有设备的全分辨率读数，适合没有时序数据库的场合
+
+    store = SqliteStore('dm40.db')
+    store.attach(meter, 'm1')
+    result = store.query('m1', start, end, resolution=60)   # 每分钟 min/max/mean/count
+
+- 写入: 监听器只把读数放入有界队列（队列满时丢弃并计数），后台线程每批（batch_size 行或
+  flush_interval 秒）用一个事务 executemany 写入，采集循环永不等待磁盘
+- 读取: WAL 模式下读与写互不阻塞，每次查询打开一个只读连接、用完即关闭（请求线程不会遗留连接）；
+  (device, ts) 索引使按设备的时间范围查询和按设备清理过期读数都只扫描命中的行
+"""
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+import urllib.request
+from typing import Optional, Set
+
+from dm40_storage import COLUMNS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    device TEXT NOT NULL,
+    ts REAL NOT NULL,
+    value REAL,
+    unit TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    si_value REAL,
+    overload INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS readings_device_ts ON readings (device, ts);
+"""
+
+INSERT_SQL = "INSERT INTO readings (device, ts, value, unit, mode, si_value, overload) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+# 原始读数，列与 dm40_storage.COLUMNS 一致
+RAW_SQL = """
+SELECT ts, value, value, value, value IS NOT NULL, overload, unit, mode
+FROM readings WHERE device = ? AND ts >= ? AND ts <= ? ORDER BY ts LIMIT ?
+"""
+
+# 按 width 秒分桶汇总，桶起始时间与 TieredStore 一致（Unix 时间戳按宽度取整）
+AGGREGATE_SQL = """
+SELECT CAST(ts / :width AS INTEGER) * :width AS bucket, MIN(value), MAX(value), AVG(value), COUNT(value),
+       SUM(overload), unit, mode
+FROM readings WHERE device = :device AND ts >= :start AND ts <= :end
+GROUP BY bucket, unit, mode ORDER BY bucket
+"""
+
+# 按设备删除，走 (device, ts) 索引而不是全表扫描
+PRUNE_SQL = "DELETE FROM readings WHERE device = ? AND ts < ?"
+DEVICES_SQL = "SELECT DISTINCT device FROM readings"
+
+
+class SqliteStore:
+    """
+    SQLite 读数存储
+    - batch_size / flush_interval: 每个写事务最多的行数 / 最长的攒批时间（秒）
+    - retention: 读数保留秒数，None 表示永久保留；由写线程每 prune_interval 秒删除一次过期读数
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000, flush_interval: float = 1.0, max_queue: int = 100000,
+                 retention: Optional[float] = None, prune_interval: float = 3600.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        # 先同步建表并切换到 WAL，之后的只读连接可立即查询
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    # ==================== 写入 ====================
+
+    def attach(self, device, device_id: str):
+        """作为读数监听器挂到 Com_DM40A / ProcessMeter 上，返回监听函数以便移除"""
+        def listener(reading):
+            m = reading.measurement
+            self.append(device_id, reading.timestamp, reading.value, reading.unit, reading.mode,
+                        m.si_value if m is not None else None, m is not None and m.overload)
+        device.add_listener(listener)
+        return listener
+
+    def append(self, device_id: str, timestamp: float, value: Optional[float], unit: str, mode: str,
+               si_value: Optional[float] = None, overload: bool = False):
+        """放入写队列，不等待写入"""
+        try:
+            self._queue.put_nowait((device_id, timestamp, value, unit, mode, si_value, int(overload)))
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA synchronous=NORMAL")   # WAL 下只在检查点同步，断电最多丢失最近的事务
+        next_prune = time.monotonic()
+        devices: Set[str] = set()
+        if self.retention is not None:
+            devices.update(row[0] for row in conn.execute(DEVICES_SQL))
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                with conn:
+                    conn.executemany(INSERT_SQL, batch)
+                self.written += len(batch)
+                devices.update(row[0] for row in batch)
+            except sqlite3.Error as e:
+                self.failed += len(batch)
+                print(f"SQLite 写入失败 ({self.path}): {e}")
+            if self.retention is not None and time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + self.prune_interval
+                try:
+                    with conn:
+                        cutoff = time.time() - self.retention
+                        conn.executemany(PRUNE_SQL, [(device, cutoff) for device in devices])
+                except sqlite3.Error as e:
+                    print(f"SQLite 清理过期读数失败 ({self.path}): {e}")
+        conn.close()
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中的读数后停止写线程"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ==================== 查询 ====================
+
+    def _reader(self) -> sqlite3.Connection:
+        """打开只读连接，由调用者关闭"""
+        uri = 'file:' + urllib.request.pathname2url(os.path.abspath(self.path)) + '?mode=ro'
+        return sqlite3.connect(uri, uri=True, timeout=5.0)
+
+    def query(self, device_id: str, start: float, end: float, resolution: float = 0.0,
+              limit: int = 100000) -> dict:
+        """
+        返回格式与 TieredStore.query 相同: {"resolution", "columns", "rows"}
+        resolution 为 0 时返回原始读数（最多 limit 行），否则返回与 [start, end] 有重叠的 resolution 秒汇总桶
+        """
+        with contextlib.closing(self._reader()) as conn:
+            if resolution <= 0:
+                rows = conn.execute(RAW_SQL, (device_id, start, end, limit)).fetchall()
+                return {'resolution': 0.0, 'columns': COLUMNS, 'rows': [list(r) for r in rows]}
+            first = start - start % resolution
+            rows = conn.execute(AGGREGATE_SQL, {'width': resolution, 'device': device_id,
+                                                'start': first, 'end': end}).fetchall()
+        return {'resolution': resolution, 'columns': COLUMNS, 'rows': [list(r) for r in rows]}
+
+    def status(self) -> dict:
+        return {'path': self.path, 'written': self.written, 'queued': self._queue.qsize(),
+                'dropped': self.dropped, 'failed': self.failed}
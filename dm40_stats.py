@@ -0,0 +1,263 @@
+"""
+DM40A 读数统计引擎
+增量计算 MIN/MAX/AVG/RMS/标准差 以及 REL 相对值，每个读数 O(1) 均摊开销
+- 累计统计: Welford 算法
+- 滑动窗口: Welford 增删 + 单调队列求窗口最小/最大值
+- 稳定判断: 滑动窗口内的标准差和线性回归斜率（增量维护的求和项）
+"""
+import math
+import threading
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+
+class RunningStats:
+    """Welford 累计统计，支持增加和移除样本"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def remove(self, x: float):
+        """移除一个样本（用于滑动窗口，不维护 min/max）"""
+        if self.count <= 1:
+            self.count = 0
+            self.mean = 0.0
+            self._m2 = 0.0
+            return
+        self.count -= 1
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self._m2 = max(0.0, self._m2 - delta * (x - self.mean))
+
+    @property
+    def variance(self) -> float:
+        """总体方差"""
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def rms(self) -> float:
+        """均方根: sqrt(mean² + variance)"""
+        return math.sqrt(self.mean * self.mean + self.variance) if self.count else 0.0
+
+    def as_dict(self) -> dict:
+        if not self.count:
+            return {'count': 0, 'min': None, 'max': None, 'avg': None, 'rms': None, 'stddev': None}
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'avg': self.mean,
+            'rms': self.rms,
+            'stddev': self.stddev,
+        }
+
+
+class WindowStats:
+    """最近 window 秒内的滑动窗口统计"""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._stats = RunningStats()
+        self._samples = deque()   # (timestamp, value)
+        self._min_q = deque()     # 单调递增，队首为窗口最小值
+        self._max_q = deque()     # 单调递减，队首为窗口最大值
+
+    def reset(self):
+        self._stats.reset()
+        self._samples.clear()
+        self._min_q.clear()
+        self._max_q.clear()
+
+    def add(self, timestamp: float, x: float):
+        self._samples.append((timestamp, x))
+        self._stats.add(x)
+        while self._min_q and self._min_q[-1][1] > x:
+            self._min_q.pop()
+        self._min_q.append((timestamp, x))
+        while self._max_q and self._max_q[-1][1] < x:
+            self._max_q.pop()
+        self._max_q.append((timestamp, x))
+        self._expire(timestamp)
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        samples = self._samples
+        while samples and samples[0][0] <= cutoff:
+            t, x = samples.popleft()
+            self._stats.remove(x)
+            if self._min_q and self._min_q[0][0] <= t:
+                self._min_q.popleft()
+            if self._max_q and self._max_q[0][0] <= t:
+                self._max_q.popleft()
+
+    def as_dict(self) -> dict:
+        result = self._stats.as_dict()
+        if self._samples:
+            result['min'] = self._min_q[0][1]
+            result['max'] = self._max_q[0][1]
+        result['window'] = self.window
+        return result
+
+
+class StabilityDetector:
+    """
+    读数稳定判断
+    最近 window 秒内的读数同时满足以下条件时视为稳定:
+    - 已覆盖完整的 window 秒且至少 min_samples 个读数
+    - 标准差 <= tolerance
+    - 线性回归斜率在 window 秒内造成的漂移 |slope| * window <= tolerance
+    每个读数 O(1) 均摊更新；时间和数值以窗口建立时的首个样本为原点，避免大数相减损失精度
+    """
+
+    def __init__(self, tolerance: float, window: float = 1.0, min_samples: int = 3):
+        self.tolerance = tolerance
+        self.window = window
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        self._stats = RunningStats()
+        self._samples = deque()   # (t, v)，相对原点
+        self._origin = None       # (timestamp, value)
+        self._first = None        # 首个样本的时间戳
+        self._st = self._sv = self._stt = self._stv = 0.0
+
+    def update(self, timestamp: float, value: float) -> bool:
+        """加入一个读数，返回当前是否稳定"""
+        if self._origin is None:
+            self._origin = (timestamp, value)
+            self._first = timestamp
+        t = timestamp - self._origin[0]
+        v = value - self._origin[1]
+        self._samples.append((t, v))
+        self._stats.add(v)
+        self._st += t
+        self._sv += v
+        self._stt += t * t
+        self._stv += t * v
+        cutoff = t - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            ot, ov = self._samples.popleft()
+            self._stats.remove(ov)
+            self._st -= ot
+            self._sv -= ov
+            self._stt -= ot * ot
+            self._stv -= ot * ov
+        return self.stable_at(timestamp)
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    @property
+    def mean(self) -> Optional[float]:
+        """窗口内均值"""
+        return self._stats.mean + self._origin[1] if self._samples else None
+
+    @property
+    def stddev(self) -> float:
+        return self._stats.stddev
+
+    @property
+    def slope(self) -> float:
+        """窗口内线性回归斜率（单位/秒）"""
+        n = len(self._samples)
+        denominator = n * self._stt - self._st * self._st
+        if n < 2 or denominator <= 0:
+            return 0.0
+        return (n * self._stv - self._st * self._sv) / denominator
+
+    def stable_at(self, timestamp: float) -> bool:
+        if self._first is None or timestamp - self._first < self.window or self.count < self.min_samples:
+            return False
+        return self.stddev <= self.tolerance and abs(self.slope) * self.window <= self.tolerance
+
+
+class StatsEngine:
+    """
+    统计引擎：累计统计 + 多个滑动窗口 + REL 相对值
+    测量模式变化时自动清零；可作为 Com_DM40A 的读数监听器
+    """
+
+    def __init__(self, windows: Iterable[float] = (10, 60)):
+        self._total = RunningStats()
+        self._windows = [WindowStats(w) for w in windows]
+        self._lock = threading.Lock()
+        self.mode = ''
+        self.unit = ''
+        self.last = None
+        self.reference = None
+
+    def reset(self):
+        """清零所有统计（保留 REL 参考值）"""
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._total.reset()
+        for w in self._windows:
+            w.reset()
+        self.last = None
+
+    def set_reference(self, value: Optional[float] = None) -> Optional[float]:
+        """设置 REL 参考值，默认取当前读数；传 None 且无读数时清除参考值"""
+        with self._lock:
+            self.reference = value if value is not None else self.last
+            return self.reference
+
+    def clear_reference(self):
+        with self._lock:
+            self.reference = None
+
+    def update(self, value: Optional[float], unit: str, mode: str, timestamp: float):
+        """加入一个读数"""
+        if value is None:
+            return
+        with self._lock:
+            if mode != self.mode or unit != self.unit:
+                self._reset()
+                self.reference = None
+                self.mode = mode
+                self.unit = unit
+            self.last = value
+            self._total.add(value)
+            for w in self._windows:
+                w.add(timestamp, value)
+
+    def __call__(self, reading):
+        """监听器入口，reading 为 dm40ble.Reading"""
+        self.update(reading.value, reading.unit, reading.mode, reading.timestamp)
+
+    def snapshot(self) -> Dict:
+        """当前统计结果"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'unit': self.unit,
+                'last': self.last,
+                'rel': None if self.reference is None or self.last is None else self.last - self.reference,
+                'reference': self.reference,
+                'total': self._total.as_dict(),
+                'windows': [w.as_dict() for w in self._windows],
+            }
@@ -0,0 +1,189 @@
+"""
+DM40A 分级保留存储
+原始读数只保留最近 raw_retention 秒，同时逐级汇总为 1 秒、1 分钟的 min/max/mean/count 桶，
+各级按自己的保留时长淘汰，用有限内存保存数月的趋势数据
+
+    store = TieredStore(raw_retention=600, tiers=((1.0, 86400), (60.0, 90 * 86400)))
+    meter.add_listener(store)
+    result = store.query(start, end, resolution=30)     # 自动选用 1 秒桶
+
+汇总是增量的: 每个读数只更新当前 1 秒桶，1 秒桶结束时并入当前 1 分钟桶，依此类推；
+查询从满足分辨率要求的最粗一级返回，若该级已淘汰了所需时间段则改用保留更久的更粗一级
+"""
+import bisect
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+# 返回行的列: 桶起始时间（原始读数为读数时间）、最小值、最大值、平均值、有效读数个数、超量程个数、单位、模式
+COLUMNS = ['timestamp', 'min', 'max', 'mean', 'count', 'overload', 'unit', 'mode']
+Row = Tuple[float, Optional[float], Optional[float], Optional[float], int, int, str, str]
+
+DEFAULT_TIERS = ((1.0, 86400.0), (60.0, 90 * 86400.0))
+
+
+class _Series:
+    """按时间排序的行列表，淘汰旧行时批量删除以摊销开销"""
+
+    def __init__(self, retention: float):
+        self.retention = retention
+        self.times: List[float] = []
+        self.rows: List[Row] = []
+
+    def append(self, row: Row):
+        self.times.append(row[0])
+        self.rows.append(row)
+
+    def trim(self, now: float):
+        index = bisect.bisect_left(self.times, now - self.retention)
+        if index >= max(256, len(self.times) // 8):
+            del self.times[:index]
+            del self.rows[:index]
+
+    def covers(self, start: float, now: float) -> bool:
+        return start >= now - self.retention
+
+    def range(self, start: float, end: float, now: float, width: float = 0.0) -> List[Row]:
+        """起始时间在 [start - width, end] 内的行，即与 [start, end] 有重叠的桶"""
+        start = max(start, now - self.retention)
+        lo = bisect.bisect_right(self.times, start - width) if width else bisect.bisect_left(self.times, start)
+        hi = bisect.bisect_right(self.times, end)
+        return self.rows[lo:hi]
+
+
+class _Bucket:
+    """正在累计的桶"""
+    __slots__ = ('start', 'unit', 'mode', 'min', 'max', 'sum', 'count', 'overload')
+
+    def __init__(self, start: float, unit: str, mode: str):
+        self.start = start
+        self.unit = unit
+        self.mode = mode
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.count = 0
+        self.overload = 0
+
+    def add(self, low: Optional[float], high: Optional[float], total: float, count: int, overload: int):
+        if count:
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+            self.sum += total
+            self.count += count
+        self.overload += overload
+
+    def row(self) -> Row:
+        mean = self.sum / self.count if self.count else None
+        return (self.start, self.min, self.max, mean, self.count, self.overload, self.unit, self.mode)
+
+
+class TieredStore:
+    """
+    单台设备的分级存储，可作为 Com_DM40A / ProcessMeter 的读数监听器
+    - raw_retention: 原始读数保留秒数
+    - tiers: ((桶宽度秒, 保留秒数), ...)，宽度递增且每级是上一级的整数倍
+    模式或单位变化时当前桶提前结束，不同模式的读数不会混在一个桶里
+    """
+
+    def __init__(self, raw_retention: float = 600.0, tiers: Sequence[Tuple[float, float]] = DEFAULT_TIERS):
+        widths = [float(w) for w, _ in tiers]
+        for finer, coarser in zip(widths, widths[1:]):
+            ratio = coarser / finer
+            if coarser <= finer or abs(ratio - round(ratio)) > 1e-9:
+                raise ValueError(f"桶宽度须递增且为上一级的整数倍: {widths}")
+        if any(w <= 0 for w in widths):
+            raise ValueError(f"桶宽度须为正: {widths}")
+        self.widths = widths
+        self._raw = _Series(raw_retention)
+        self._series = [_Series(retention) for _, retention in tiers]
+        self._open: List[Optional[_Bucket]] = [None] * len(tiers)
+        self._now = 0.0
+        self._first: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def __call__(self, reading):
+        """监听器入口，reading 为 dm40ble.Reading"""
+        overload = reading.measurement is not None and reading.measurement.overload
+        self.append(reading.timestamp, reading.value, reading.unit, reading.mode, overload)
+
+    def append(self, timestamp: float, value: Optional[float], unit: str, mode: str, overload: bool = False):
+        """追加一个读数并更新各级汇总"""
+        valid = 0 if value is None else 1
+        with self._lock:
+            self._now = max(self._now, timestamp)
+            if self._first is None:
+                self._first = timestamp
+            self._raw.append((timestamp, value, value, value, valid, int(overload), unit, mode))
+            self._raw.trim(self._now)
+            self._add(0, timestamp, unit, mode, value, value, value or 0.0, valid, int(overload))
+
+    def _add(self, level: int, timestamp: float, unit: str, mode: str, low, high, total, count, overload):
+        """把读数或下一级结束的桶并入第 level 级当前桶"""
+        if level >= len(self.widths):
+            return
+        width = self.widths[level]
+        start = timestamp - timestamp % width
+        bucket = self._open[level]
+        if bucket is not None and start < bucket.start and bucket.unit == unit and bucket.mode == mode:
+            start = bucket.start    # 稍晚到达的旧读数并入当前桶，已结束的桶不再修改
+        if bucket is not None and (bucket.start != start or bucket.unit != unit or bucket.mode != mode):
+            self._close(level)
+            bucket = None
+        if bucket is None:
+            bucket = self._open[level] = _Bucket(start, unit, mode)
+        bucket.add(low, high, total, count, overload)
+
+    def _close(self, level: int):
+        bucket = self._open[level]
+        self._open[level] = None
+        series = self._series[level]
+        series.append(bucket.row())
+        series.trim(self._now)
+        self._add(level + 1, bucket.start, bucket.unit, bucket.mode, bucket.min, bucket.max, bucket.sum,
+                  bucket.count, bucket.overload)
+
+    def covers(self, start: float) -> bool:
+        """从 start 开始的读数是否都由本存储接收且仍保留在某一级中（否则需要查询持久化后端）"""
+        levels = [self._raw] + self._series
+        return self._first is not None and start >= self._first and levels[-1].covers(start, self._now)
+
+    def _select_tier(self, start: float, resolution: float) -> int:
+        """
+        选择查询使用的级别: -1 为原始读数，0.. 为 tiers 的下标
+        取宽度不超过 resolution 的最粗一级；该级保留时长不足以覆盖 start 时改用更粗且能覆盖的一级
+        """
+        levels = [self._raw] + self._series
+        widths = [0.0] + self.widths
+        chosen = 0
+        for index, width in enumerate(widths):
+            if width <= resolution:
+                chosen = index
+        while chosen < len(levels) - 1 and not levels[chosen].covers(start, self._now):
+            chosen += 1
+        return chosen - 1
+
+    def query(self, start: float, end: float, resolution: float = 0.0) -> dict:
+        """
+        返回与 [start, end] 有重叠的行（见 COLUMNS），包括尚未结束的当前桶
+        resolution 为要求的时间分辨率（秒），0 表示原始读数
+        """
+        with self._lock:
+            level = self._select_tier(start, resolution)
+            if level < 0:
+                rows = self._raw.range(start, end, self._now)
+                width = 0.0
+            else:
+                width = self.widths[level]
+                rows = self._series[level].range(start, end, self._now, width)
+                bucket = self._open[level]
+                if bucket is not None and start - width < bucket.start <= end:
+                    rows = rows + [bucket.row()]
+        return {'resolution': width, 'columns': COLUMNS, 'rows': rows}
+
+    def status(self) -> dict:
+        """各级保存的行数与保留时长"""
+        with self._lock:
+            tiers = [{'resolution': 0.0, 'retention': self._raw.retention, 'rows': len(self._raw.rows)}]
+            tiers.extend({'resolution': width, 'retention': series.retention, 'rows': len(series.rows)}
+                         for width, series in zip(self.widths, self._series))
+        return {'latest': self._now or None, 'tiers': tiers}
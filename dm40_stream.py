@@ -0,0 +1,87 @@
+"""
+DM40A 带序号的样本环形缓冲区
+用于 WebSocket 客户端断线重连后补发缺失样本，缺口过大时返回降采样快照
+"""
+import threading
+import uuid
+from typing import List, Optional, Tuple
+
+# 样本: (seq, timestamp, value, unit, mode, overload)，超量程样本 value 为 None、overload 为 True
+Sample = Tuple[int, float, Optional[float], str, str, bool]
+
+
+class SampleRing:
+    """
+    固定容量的样本环形缓冲区，序号从 1 开始连续递增
+    stream_id 标识本缓冲区，设备重连或服务器重启后序号重新开始，客户端据此判断序号是否可比
+    """
+
+    def __init__(self, capacity: int = 6000):
+        self.stream_id = uuid.uuid4().hex[:8]
+        self._capacity = capacity
+        self._buf: List[Optional[Sample]] = [None] * capacity
+        self._next_seq = 1
+        self._lock = threading.Lock()
+
+    @property
+    def last_seq(self) -> int:
+        """最新样本序号，没有样本时为 0"""
+        return self._next_seq - 1
+
+    @property
+    def first_seq(self) -> int:
+        """缓冲区中最早样本的序号"""
+        return max(1, self._next_seq - self._capacity)
+
+    def append(self, timestamp: float, value: Optional[float], unit: str, mode: str, overload: bool = False) -> int:
+        """追加样本，返回分配的序号"""
+        with self._lock:
+            seq = self._next_seq
+            self._buf[seq % self._capacity] = (seq, timestamp, value, unit, mode, overload)
+            self._next_seq = seq + 1
+            return seq
+
+    def since(self, last_seq: int, max_count: Optional[int] = None) -> Optional[List[Sample]]:
+        """
+        返回序号大于 last_seq 的所有样本
+        last_seq 已被覆盖、超出当前序号（服务器重启）或缺失数量超过 max_count 时返回 None
+        """
+        with self._lock:
+            first, last = self.first_seq, self.last_seq
+            if last_seq > last or last_seq < first - 1:
+                return None
+            if max_count is not None and last - last_seq > max_count:
+                return None
+            return [self._buf[seq % self._capacity] for seq in range(last_seq + 1, last + 1)]
+
+    def latest(self, count: Optional[int] = None) -> List[Sample]:
+        """返回最近 count 个样本（默认全部）"""
+        with self._lock:
+            first, last = self.first_seq, self.last_seq
+            if count is not None:
+                first = max(first, last - count + 1)
+            return [self._buf[seq % self._capacity] for seq in range(first, last + 1)]
+
+
+def downsample(samples: List[Sample], max_points: int) -> List[Sample]:
+    """
+    按时间顺序分桶降采样，每个桶保留最小值和最大值样本，保留尖峰
+    无数值的样本（value 为 None）不参与比较；桶内有超量程样本时另外保留第一个超量程样本
+    """
+    if len(samples) <= max_points:
+        return list(samples)
+    buckets = max(1, max_points // 2)
+    size = len(samples) / buckets
+    result = []
+    for b in range(buckets):
+        bucket = samples[int(b * size):int((b + 1) * size)]
+        kept = {}
+        valid = [s for s in bucket if s[2] is not None]
+        if valid:
+            for s in (min(valid, key=lambda s: s[2]), max(valid, key=lambda s: s[2])):
+                kept[s[0]] = s
+        overload = next((s for s in bucket if s[5]), None)
+        if overload is not None:
+            kept[overload[0]] = overload
+        result.extend(kept[seq] for seq in sorted(kept))
+    return result
@@ -0,0 +1,261 @@
+"""
+DM40A 测试计划执行器
+按声明式测试计划依次切换模式、等待读数稳定、判定上下限，可在多台万用表上并行执行同一计划，
+并记录每一步的耗时（模式切换 / 稳定等待 / 采样），用于找出并优化最慢的步骤
+
+计划示例（JSON）:
+    {"name": "PCB-A",
+     "stop_on_fail": false,
+     "steps": [
+        {"name": "VCC", "mode": "dc_voltage", "low": 3.2, "high": 3.4, "unit": "V", "window": 0.3},
+        {"name": "R12", "mode": "resistance", "low": 990, "high": 1010, "samples": 3},
+        {"name": "开路", "mode": "continuity", "expect_overload": true, "stable": false}
+     ]}
+
+- mode 为模式名（Com_DM40A.set_<模式名>_mode），与上一步相同时不再发送切换命令
+- unit 指定时上下限按该单位理解，与读数统一换算到基本单位比较（如 V 与 mV）
+- stable=false 时切换后直接取读数，不等待稳定（适合通断等数字判定）；模式字节与本步不符的旧读数被丢弃
+- expect_overload=true 时超量程 (OL) 判为通过，否则 OL 判为失败；OL 读数不会“稳定”，此时不等待稳定
+
+命令行:
+    python dm40_testplan.py plan.json --device m1=sim:// --device m2=ble://D7:ED:DF:91:FC:4D -o result.json
+"""
+import asyncio
+import json
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from dm40_protocol import MODE_BYTES, MODE_TABLE, UNIT_SI
+from dm40ble import Com_DM40A
+
+
+class Step:
+    """测试计划中的一步"""
+
+    def __init__(self, name: str, mode: str, low: Optional[float] = None, high: Optional[float] = None,
+                 unit: Optional[str] = None, tolerance: Optional[float] = None, window: float = 0.5,
+                 timeout: float = 10.0, samples: int = 1, stable: bool = True, expect_overload: bool = False):
+        if mode not in MODE_BYTES:
+            raise ValueError(f"未知模式: {mode}")
+        if unit is not None and unit not in UNIT_SI:
+            raise ValueError(f"未知单位: {unit}")
+        self.name = name
+        self.mode = mode
+        self.low = None if low is None else float(low)
+        self.high = None if high is None else float(high)
+        self.unit = unit
+        self.tolerance = tolerance
+        self.window = float(window)
+        self.timeout = float(timeout)
+        self.samples = max(1, int(samples))
+        self.stable = stable
+        self.expect_overload = expect_overload
+        self.mode_byte = MODE_BYTES[mode]
+        self.mode_name = MODE_TABLE[self.mode_byte][1]
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'Step':
+        return cls(**spec)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name, 'mode': self.mode, 'low': self.low, 'high': self.high, 'unit': self.unit,
+            'tolerance': self.tolerance, 'window': self.window, 'timeout': self.timeout,
+            'samples': self.samples, 'stable': self.stable, 'expect_overload': self.expect_overload,
+        }
+
+    def judge(self, value: Optional[float], unit: str, overload: bool) -> bool:
+        """判定读数是否通过"""
+        if overload or value is None:
+            return overload and self.expect_overload
+        if self.expect_overload:
+            return False
+        low, high = self.low, self.high
+        if self.unit is not None and unit in UNIT_SI:
+            base, factor = UNIT_SI[unit]
+            limit_base, limit_factor = UNIT_SI[self.unit]
+            if base != limit_base:
+                return False
+            value = value * factor
+            low = None if low is None else low * limit_factor
+            high = None if high is None else high * limit_factor
+        return (low is None or value >= low) and (high is None or value <= high)
+
+
+class TestPlan:
+    """测试计划"""
+
+    def __init__(self, name: str, steps: List[Step], stop_on_fail: bool = False):
+        self.name = name
+        self.steps = steps
+        self.stop_on_fail = stop_on_fail
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'TestPlan':
+        return cls(spec.get('name', ''), [Step.from_dict(s) for s in spec['steps']],
+                   spec.get('stop_on_fail', False))
+
+    @classmethod
+    def load(cls, path: str) -> 'TestPlan':
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'stop_on_fail': self.stop_on_fail, 'steps': [s.to_dict() for s in self.steps]}
+
+
+class StepResult(NamedTuple):
+    """单步结果，耗时单位为秒"""
+    name: str
+    mode: str
+    value: Optional[float]
+    unit: str
+    overload: bool
+    passed: bool
+    switch_time: float      # 模式切换命令耗时（未切换为 0）
+    settle_time: float      # 等待读数稳定耗时
+    sample_time: float      # 额外采样耗时
+    total_time: float
+    error: str = ''
+
+
+class PlanResult:
+    """一台万用表执行一次计划的结果"""
+
+    def __init__(self, device_id: str, plan: str):
+        self.device_id = device_id
+        self.plan = plan
+        self.steps: List[StepResult] = []
+        self.started = time.time()
+        self.duration = 0.0
+
+    @property
+    def passed(self) -> bool:
+        return bool(self.steps) and all(s.passed for s in self.steps)
+
+    def slowest(self, count: int = 3) -> List[StepResult]:
+        """耗时最长的步骤"""
+        return sorted(self.steps, key=lambda s: s.total_time, reverse=True)[:count]
+
+    def to_dict(self) -> dict:
+        return {'device_id': self.device_id, 'plan': self.plan, 'passed': self.passed,
+                'started': self.started, 'duration': self.duration,
+                'steps': [s._asdict() for s in self.steps]}
+
+
+async def _read_mode(device: Com_DM40A, mode_byte: int, deadline: float):
+    """读取直到模式字节与 mode_byte 相符（丢弃模式切换前的旧读数），超过 deadline 返回 None"""
+    while time.monotonic() < deadline:
+        measurement = await device.get_measurement()
+        if measurement is not None and measurement.mode_byte == mode_byte:
+            return measurement
+    return None
+
+
+async def run_plan(device: Com_DM40A, plan: TestPlan, device_id: str = '') -> PlanResult:
+    """在一台已连接的万用表上执行计划（在设备所在的事件循环中调用）"""
+    result = PlanResult(device_id, plan.name)
+    start = time.monotonic()
+    # 缓存的读数可能已过时（例如在面板上切换过模式），第一步总是发送模式切换命令
+    current_mode = None
+
+    for step in plan.steps:
+        t0 = time.monotonic()
+        switch_time = settle_time = sample_time = 0.0
+        value, unit, overload, error = None, '', False, ''
+        try:
+            if step.mode_byte != current_mode:
+                if not await getattr(device, f'set_{step.mode}_mode')():
+                    raise RuntimeError('模式切换无应答')
+                current_mode = step.mode_byte
+            t1 = time.monotonic()
+            switch_time = t1 - t0
+
+            # 切换应答后立即开始读取，稳定判断本身就是连续读数；期望 OL 时读数没有数值，无法判断稳定
+            if step.stable and not step.expect_overload:
+                reading = await device.wait_stable(step.tolerance, step.window, step.timeout, step.mode_name)
+                if reading is None:
+                    raise RuntimeError('读数未稳定')
+                measurement, value = reading.measurement, reading.value
+            else:
+                measurement = await _read_mode(device, step.mode_byte, t1 + step.timeout)
+                if measurement is None:
+                    raise RuntimeError('无读数')
+                value = measurement.value
+            t2 = time.monotonic()
+            settle_time = t2 - t1
+
+            values = [value]
+            for _ in range(step.samples - 1):
+                m = await device.get_measurement()
+                if m is not None and m.mode_byte == step.mode_byte:
+                    values.append(m.value)
+            sample_time = time.monotonic() - t2
+
+            unit = measurement.unit if measurement else ''
+            overload = any(v is None for v in values) or (measurement is not None and measurement.overload)
+            value = None if overload else sum(values) / len(values)
+        except Exception as e:
+            error = str(e)
+            current_mode = None     # 出错后万用表的模式不确定，下一步重新切换
+        passed = not error and step.judge(value, unit, overload)
+        result.steps.append(StepResult(step.name, step.mode, value, unit, overload, passed,
+                                       switch_time, settle_time, sample_time, time.monotonic() - t0, error))
+        if not passed and plan.stop_on_fail:
+            break
+
+    result.duration = time.monotonic() - start
+    return result
+
+
+async def run_parallel(devices: Dict[str, Com_DM40A], plan: TestPlan) -> Dict[str, PlanResult]:
+    """在多台已连接的万用表上同时执行同一计划，各设备的通信互不等待"""
+    results = await asyncio.gather(*(run_plan(device, plan, device_id) for device_id, device in devices.items()))
+    return {r.device_id: r for r in results}
+
+
+def format_report(result: PlanResult) -> str:
+    """文本报告: 每步结果与耗时，以及最慢的步骤"""
+    lines = [f"[{result.device_id}] {result.plan}: {'通过' if result.passed else '失败'}  "
+             f"总耗时 {result.duration:.2f}s",
+             f"  {'步骤':<10}{'读数':>14}  {'结果':<4}{'切换':>8}{'稳定':>8}{'采样':>8}{'合计':>8}"]
+    for s in result.steps:
+        reading = 'OL' if s.overload else ('-' if s.value is None else f'{s.value:.4g} {s.unit}')
+        lines.append(f"  {s.name:<10}{reading:>14}  {'✓' if s.passed else '✗':<4}"
+                     f"{s.switch_time:>8.3f}{s.settle_time:>8.3f}{s.sample_time:>8.3f}{s.total_time:>8.3f}"
+                     + (f"  {s.error}" if s.error else ''))
+    slowest = ', '.join(f"{s.name} {s.total_time:.2f}s" for s in result.slowest())
+    lines.append(f"  最慢步骤: {slowest}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    from dm40_transport import transport_from_url
+
+    parser = argparse.ArgumentParser(description="DM40A 测试计划执行器")
+    parser.add_argument('plan', help='测试计划 JSON 文件')
+    parser.add_argument('--device', action='append', required=True,
+                        help='设备，格式 设备ID=传输URL，例如 m1=ble://D7:ED:DF:91:FC:4D 或 m1=sim://')
+    parser.add_argument('-o', '--output', help='结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    async def main():
+        plan = TestPlan.load(args.plan)
+        devices = {}
+        for spec in args.device:
+            device_id, _, url = spec.partition('=')
+            devices[device_id] = Com_DM40A(transport=transport_from_url(url))
+        await asyncio.gather(*(device.connect() for device in devices.values()))
+        try:
+            return await run_parallel(devices, plan)
+        finally:
+            await asyncio.gather(*(device.disconnect() for device in devices.values()))
+
+    results = asyncio.run(main())
+    for r in results.values():
+        print(format_report(r))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump([r.to_dict() for r in results.values()], f, ensure_ascii=False, indent=2)
+    exit(0 if all(r.passed for r in results.values()) else 1)
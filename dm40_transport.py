@@ -0,0 +1,323 @@
+"""
+DM40A 传输层
+协议层（命令、帧、解码）只通过 Transport 接口收发字节，可运行在不同传输之上:
+- BleakTransport:    蓝牙直连（默认）
+- TcpTransport:      通过 TCP 桥接访问远端网关上的万用表
+- LoopbackTransport: 内存回环，配合 MeterSimulator 全速运行协议层，用于测试
+
+TCP 桥接帧格式: 2 字节大端长度 + 原始数据（每个 BLE 写入/通知为一帧）
+
+bleak 只在 BleakTransport 首次连接时导入，协议层、回放、模拟器和离线工具不需要安装蓝牙库。
+
+运行 TCP 桥接（在靠近万用表的机器上）:
+    python dm40_transport.py --address D7:ED:DF:91:FC:4D --port 9040
+"""
+import abc
+import asyncio
+import math
+import struct
+import time
+from typing import Callable, Optional
+
+from dm40_protocol import encode_measurement_frame
+
+DEFAULT_DEVICE_ADDR = "EB31784A-359B-AAF1-E798-76064EA680CD"
+WRITE_UUID = "0000fff1-0000-1000-8000-00805f9b34fb"
+READ_UUID = "0000fff2-0000-1000-8000-00805f9b34fb"
+
+_LENGTH = struct.Struct('>H')
+
+
+class Transport(abc.ABC):
+    """传输层接口: 连接、断开、写入，以及通过接收回调上报收到的数据"""
+
+    def __init__(self):
+        self._receive_handler: Optional[Callable[[bytes], None]] = None
+
+    def set_receive_handler(self, handler: Callable[[bytes], None]):
+        """设置接收回调 handler(data)，在事件循环线程中调用"""
+        self._receive_handler = handler
+
+    def _deliver(self, data: bytes):
+        if self._receive_handler:
+            self._receive_handler(data)
+
+    @property
+    @abc.abstractmethod
+    def is_connected(self) -> bool:
+        """是否已连接"""
+
+    @property
+    def description(self) -> str:
+        """用于日志的描述"""
+        return self.__class__.__name__
+
+    @abc.abstractmethod
+    async def connect(self):
+        """建立连接，失败时抛出异常"""
+
+    @abc.abstractmethod
+    async def disconnect(self):
+        """断开连接"""
+
+    @abc.abstractmethod
+    async def write(self, data: bytes):
+        """发送一帧数据"""
+
+
+class BleakTransport(Transport):
+    """蓝牙传输，通过写特征值发送命令，通知特征值接收响应"""
+
+    def __init__(self, device_addr: str = DEFAULT_DEVICE_ADDR,
+                 write_uuid: str = WRITE_UUID, read_uuid: str = READ_UUID):
+        super().__init__()
+        self.device_addr = device_addr
+        self.write_uuid = write_uuid
+        self.read_uuid = read_uuid
+        self._client = None     # bleak.BleakClient
+        self._rx_char = None
+        self._tx_char = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    @property
+    def description(self) -> str:
+        return self.device_addr
+
+    async def connect(self):
+        from bleak import BleakClient, BleakScanner
+
+        device = await BleakScanner.find_device_by_address(self.device_addr)
+        if not device:
+            raise Exception(f"未找到设备: {self.device_addr}")
+
+        print(f"找到设备: {self.device_addr}")
+        self._client = BleakClient(device)
+        print("开始连接:{}".format(self.device_addr))
+        await self._client.connect()
+        print("连接成功:{}".format(self.device_addr))
+
+        for service in self._client.services:
+            for char in service.characteristics:
+                if self.read_uuid == char.uuid:
+                    self._rx_char = char
+                if self.write_uuid == char.uuid:
+                    self._tx_char = char
+
+        if not self._rx_char or not self._tx_char:
+            raise Exception("未找到所需的特征值")
+
+        print("设置通知:{}".format(self._rx_char.uuid))
+        await self._client.start_notify(self._rx_char.uuid, self._notification_handler)
+
+    async def disconnect(self):
+        if self.is_connected:
+            await self._client.stop_notify(self._rx_char.uuid)
+            await self._client.disconnect()
+
+    async def write(self, data: bytes):
+        await self._client.write_gatt_char(self._tx_char.uuid, data)
+
+    def _notification_handler(self, sender, data: bytearray):
+        """接收数据回调函数"""
+        self._deliver(bytes(data))
+
+
+class TcpTransport(Transport):
+    """TCP 桥接传输，连接到 run_tcp_bridge 提供的服务"""
+
+    def __init__(self, host: str, port: int):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    @property
+    def description(self) -> str:
+        return f"tcp://{self.host}:{self.port}"
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def disconnect(self):
+        if self._read_task:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self._writer = None
+
+    async def write(self, data: bytes):
+        await _write_frame(self._writer, data)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                self._deliver(await _read_frame(self._reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if self._writer:
+                self._writer.close()
+
+
+class LoopbackTransport(Transport):
+    """
+    内存回环传输
+    写入的命令交给 responder(cmd) 处理，返回的响应经 delay 秒后作为通知上报（None 表示不响应）
+    """
+
+    def __init__(self, responder: Optional[Callable[[bytes], Optional[bytes]]] = None, delay: float = 0.0):
+        super().__init__()
+        self.responder = responder or MeterSimulator()
+        self.delay = delay
+        self._connected = False
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @property
+    def description(self) -> str:
+        return "loopback"
+
+    async def connect(self):
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    async def write(self, data: bytes):
+        response = self.responder(bytes(data))
+        if response is None:
+            return
+        loop = asyncio.get_running_loop()
+        if self.delay > 0:
+            loop.call_later(self.delay, self._deliver, response)
+        else:
+            loop.call_soon(self._deliver, response)
+
+
+class MeterSimulator:
+    """
+    万用表模拟器，作为 LoopbackTransport 的 responder
+    - 模式设置命令 (0x06): 切换模式并回显命令作为应答
+    - 读数命令 (0x09): 返回 source(mode_byte, t) 生成的测量帧，source 返回 None 表示超量程
+    """
+
+    def __init__(self, source: Optional[Callable[[int, float], Optional[float]]] = None,
+                 mode_byte: int = 0x30, decimals: int = 1):
+        self.source = source or (lambda mode_byte, t: round(1000 + 100 * math.sin(t), 1))
+        self.mode_byte = mode_byte
+        self.decimals = decimals
+        self._start = time.monotonic()
+
+    def __call__(self, cmd: bytes) -> Optional[bytes]:
+        if len(cmd) >= 4 and cmd[3] == 0x06:
+            if len(cmd) >= 6:
+                self.mode_byte = cmd[5]
+            return cmd
+        if len(cmd) >= 4 and cmd[3] == 0x09:
+            value = self.source(self.mode_byte, time.monotonic() - self._start)
+            return encode_measurement_frame(self.mode_byte, value, self.decimals)
+        return None
+
+
+def transport_from_url(url: str) -> Transport:
+    """
+    根据 URL 创建传输层
+    - "ble://<地址>" 或直接写蓝牙地址: BleakTransport
+    - "tcp://<主机>:<端口>":           TcpTransport
+    - "loopback://" / "sim://":        LoopbackTransport + MeterSimulator
+    """
+    scheme, sep, rest = url.partition('://')
+    if not sep:
+        return BleakTransport(url)
+    if scheme == 'ble':
+        return BleakTransport(rest or DEFAULT_DEVICE_ADDR)
+    if scheme == 'tcp':
+        host, _, port = rest.rpartition(':')
+        return TcpTransport(host or '127.0.0.1', int(port))
+    if scheme in ('loopback', 'sim'):
+        return LoopbackTransport()
+    raise ValueError(f"不支持的传输: {url}")
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+async def _write_frame(writer: asyncio.StreamWriter, data: bytes):
+    writer.write(_LENGTH.pack(len(data)) + data)
+    await writer.drain()
+
+
+async def run_tcp_bridge(transport: Transport, host: str = '0.0.0.0', port: int = 9040):
+    """
+    把本地传输（通常是 BleakTransport）通过 TCP 暴露出去，同一时间只服务一个客户端
+    客户端写入的帧转发给万用表，万用表的通知转发给客户端
+    """
+    await transport.connect()
+    active = {'writer': None}
+
+    def forward(data: bytes):
+        writer = active['writer']
+        if writer is not None and not writer.is_closing():
+            writer.write(_LENGTH.pack(len(data)) + data)
+
+    transport.set_receive_handler(forward)
+
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername')
+        if active['writer'] is not None:
+            print(f"拒绝连接（已有客户端）: {peer}")
+            writer.close()
+            return
+        print(f"客户端已连接: {peer}")
+        active['writer'] = writer
+        try:
+            while True:
+                await transport.write(await _read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            active['writer'] = None
+            writer.close()
+            print(f"客户端已断开: {peer}")
+
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"TCP 桥接已启动: {transport.description} -> {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await transport.disconnect()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DM40A 蓝牙-TCP 桥接")
+    parser.add_argument('--address', default=DEFAULT_DEVICE_ADDR, help='万用表蓝牙地址')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9040)
+    parser.add_argument('--simulate', action='store_true', help='使用模拟器代替真实万用表')
+    args = parser.parse_args()
+
+    local = LoopbackTransport() if args.simulate else BleakTransport(args.address)
+    try:
+        asyncio.run(run_tcp_bridge(local, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n手动停止")
@@ -0,0 +1,78 @@
+"""
+DM40A 实时数据紧凑二进制编码
+列式打包: 时间戳(float64) + 数值(float32) + 模式码(uint8)，浏览器端可直接用 TypedArray 解码
+"""
+import math
+import struct
+from typing import Iterable, List, Optional, Tuple
+
+from dm40_protocol import MODE_TABLE
+
+# 帧格式（小端）:
+#   [0:4]   uint32  样本数 n
+#   [4]     uint8   标志位，bit0 = 数值为 float64（默认 float32）
+#   [5:8]   保留（填充，使后续 float64 数组 8 字节对齐）
+#   [8:]    float64[n] 时间戳 | float32/float64[n] 数值(NaN 表示无数据，+Inf 表示超量程 OL) | uint8[n] 模式码
+_HEADER = struct.Struct('<IB3x')
+FLAG_FLOAT64 = 0x01
+
+# dm40_derived 派生通道的 (单位, 模式)，模式码排在 MODE_TABLE 之后
+DERIVED_MODES = (
+    ('W', 'Power'),
+    ('Wh', 'Energy'),
+    ('mAh', 'Charge'),
+)
+
+# 模式码 0 表示无数据，1..N 依次对应 MODE_TABLE 和 DERIVED_MODES 中的 (单位, 模式)，255 表示未知模式
+# 已分配的模式码不能改变（网关与采集端、浏览器可能运行不同版本），新模式只能追加在末尾
+MODE_CODE_NONE = 0
+MODE_CODE_UNKNOWN = 255
+MODE_CODES = {pair[::-1]: code for code, pair in enumerate((*MODE_TABLE.values(), *DERIVED_MODES), start=1)}
+
+
+def schema() -> dict:
+    """模式/单位字典，订阅时发送给客户端一次"""
+    modes = {str(MODE_CODE_NONE): {'mode': '', 'unit': ''},
+             str(MODE_CODE_UNKNOWN): {'mode': 'Unknown', 'unit': ''}}
+    for (mode, unit), code in MODE_CODES.items():
+        modes[str(code)] = {'mode': mode, 'unit': unit}
+    return {'version': 1, 'header_bytes': _HEADER.size, 'modes': modes}
+
+
+def mode_code(mode: str, unit: str) -> int:
+    """(模式, 单位) -> 模式码"""
+    if not mode:
+        return MODE_CODE_NONE
+    return MODE_CODES.get((mode, unit), MODE_CODE_UNKNOWN)
+
+
+def encode(samples: Iterable[Tuple[float, Optional[float], str, str]], precise: bool = False) -> bytes:
+    """
+    打包样本
+    参数: samples - [(timestamp, value, unit, mode), ...]，超量程读数的 value 传 math.inf
+          precise - 数值使用 float64（用于网关转发等需要无损的场合）
+    """
+    samples = list(samples)
+    n = len(samples)
+    timestamps = [s[0] for s in samples]
+    values = [math.nan if s[1] is None else s[1] for s in samples]
+    codes = [mode_code(s[3], s[2]) for s in samples]
+    return b''.join((
+        _HEADER.pack(n, FLAG_FLOAT64 if precise else 0),
+        struct.pack(f'<{n}d', *timestamps),
+        struct.pack(f'<{n}{"d" if precise else "f"}', *values),
+        bytes(codes),
+    ))
+
+
+def decode(payload: bytes) -> List[Tuple[float, Optional[float], int]]:
+    """解包样本，返回 [(timestamp, value, mode_code), ...]（主要用于调试）"""
+    n, flags = _HEADER.unpack_from(payload)
+    value_type, value_size = ('d', 8) if flags & FLAG_FLOAT64 else ('f', 4)
+    offset = _HEADER.size
+    timestamps = struct.unpack_from(f'<{n}d', payload, offset)
+    offset += 8 * n
+    values = struct.unpack_from(f'<{n}{value_type}', payload, offset)
+    offset += value_size * n
+    codes = payload[offset:offset + n]
+    return [(t, None if math.isnan(v) else v, c) for t, v, c in zip(timestamps, values, codes)]
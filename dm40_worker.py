@@ -0,0 +1,464 @@
+"""
+DM40A 多进程采集
+每台万用表（或每组万用表）运行在独立的工作进程中，读数经共享内存环形缓冲区 (dm40_shm) 传回主进程。
+某台设备的阻塞回调或蓝牙后端故障只影响所在进程，主进程的监督线程检测到进程退出或心跳超时后自动重启。
+
+主进程中的 ProcessMeter 与 Com_DM40A 接口一致（监听器、统计、当前数据、run/stop、boost 等），
+可直接放入 web_server 的设备注册表。
+
+用法:
+    pool = WorkerPool()
+    m1 = pool.add_meter('m1', 'ble://D7:ED:DF:91:FC:4D')
+    m2 = pool.add_meter('m2', 'sim://', group='bench')     # 同组设备共用一个进程
+    m1.add_listener(print)
+    pool.start(200)
+    m1.call('set_dc_voltage_mode')
+"""
+import asyncio
+import itertools
+import multiprocessing
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from dm40_shm import ShmRing
+from dm40ble import Com_DM40A, ReadingPublisher
+
+
+class ProcessMeter(ReadingPublisher):
+    """工作进程中万用表的主进程代理，读数从共享内存缓冲区取出后在监督线程中分发给监听器"""
+
+    def __init__(self, pool: 'WorkerPool', device_id: str, url: str, group: str, ring: ShmRing):
+        super().__init__()
+        self.pool = pool
+        self.device_id = device_id
+        self.url = url
+        self.group = group
+        self.ring = ring
+        self.lost = 0                   # 读者落后或记录被覆盖而丢失的读数
+        self._last_seq = ring.write_seq
+        self._mode = 0
+
+    @property
+    def description(self) -> str:
+        return f"{self.url} (进程组 {self.group})"
+
+    def run(self, loop_ms=1000, adaptive: bool = False, **poller_options):
+        """启动所在进程组（已启动时忽略）"""
+        self.pool.start_group(self.group, loop_ms, adaptive, **poller_options)
+
+    def stop(self):
+        """停止所在进程组（同组的其他设备一并停止）"""
+        self.pool.stop_group(self.group)
+
+    def get_state(self) -> int:
+        """同 Com_DM40A.get_state，进程未运行时为 0"""
+        if not self.pool.is_group_alive(self.group):
+            return 0
+        return self.ring.state
+
+    def set_mode(self, mode: int):
+        """设置模式（兼容旧代码）"""
+        self._mode = mode
+
+    def boost(self, duration: Optional[float] = None):
+        self.pool.send(self.group, ('call', None, self.device_id, 'boost', (duration,), {}))
+
+    def set_subscriber_count(self, count: Optional[int]):
+        self.pool.send(self.group, ('call', None, self.device_id, 'set_subscriber_count', (count,), {}))
+
+    def call(self, method: str, *args, timeout: float = 5.0, **kwargs) -> Any:
+        """
+        在工作进程中调用该设备的 Com_DM40A 方法（协程方法会被等待），返回结果
+        例如 meter.call('set_dc_voltage_mode')
+        """
+        return self.pool.call(self.group, self.device_id, method, args, timeout, kwargs)
+
+    def _drain(self):
+        """取出新读数并分发（监督线程调用）"""
+        records, lost = self.ring.read_since(self._last_seq)
+        if lost:
+            self.lost += lost
+        if records:
+            self._last_seq = records[-1].seq
+        elif lost:
+            self._last_seq = self.ring.write_seq
+        for r in records:
+            self._publish(r.value, r.unit, r.mode, r.measurement, r.timestamp, r.mono, r.uncertainty)
+
+
+class _Group:
+    """一个工作进程及其设备"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.meters: List[ProcessMeter] = []
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.options: Optional[dict] = None     # 启动参数，None 表示未启动
+        self.started_at = 0.0
+        self.restarts = 0
+        self.backoff = 0.0
+        self.restart_at: Optional[float] = None
+
+
+class WorkerPool:
+    """
+    工作进程池与监督器
+    - add_meter() 登记设备，同一 group 的设备运行在同一进程
+    - 工作进程默认以 spawn 方式启动（主进程通常有 Flask/Socket.IO 等多个线程，fork 不安全）
+    - 监督线程轮询各缓冲区分发读数，并检查进程存活和心跳；
+      进程退出、心跳超过 heartbeat_timeout 秒或设备进入错误状态时终止并重启该进程组，
+      重启间隔从 restart_backoff 秒开始指数退避（最长 max_backoff 秒），稳定运行 stable_time 秒后复位
+    """
+
+    def __init__(self, ring_capacity: int = 4096, poll_interval: float = 0.02,
+                 heartbeat_interval: float = 0.5, heartbeat_timeout: float = 5.0,
+                 restart_backoff: float = 1.0, max_backoff: float = 30.0, stable_time: float = 30.0,
+                 start_method: str = 'spawn'):
+        self.ring_capacity = ring_capacity
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self.stable_time = stable_time
+        self._context = multiprocessing.get_context(start_method)
+        self._groups: Dict[str, _Group] = {}
+        self._lock = threading.RLock()
+        self._calls: Dict[int, list] = {}   # 请求号 -> [Event, ok, 结果]
+        self._call_ids = itertools.count(1)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_meter(self, device_id: str, url: str, group: Optional[str] = None) -> ProcessMeter:
+        """登记设备，url 格式同 transport_from_url；group 默认为 device_id（独占一个进程）"""
+        group = group or device_id
+        with self._lock:
+            entry = self._groups.setdefault(group, _Group(group))
+            if entry.options is not None:
+                raise RuntimeError(f"进程组 {group} 已启动，不能再添加设备")
+            ring = ShmRing(capacity=self.ring_capacity, create=True)
+            meter = ProcessMeter(self, device_id, url, group, ring)
+            entry.meters.append(meter)
+        return meter
+
+    def remove_meter(self, meter: ProcessMeter):
+        """移除设备并释放其缓冲区；所在进程组仍有其他设备且正在运行时重启该组"""
+        with self._lock:
+            group = self._groups.get(meter.group)
+            if group is None or meter not in group.meters:
+                return
+            running = group.options is not None
+            if running:
+                self._terminate(group)
+            group.meters.remove(meter)
+            meter.ring.close()
+            meter.ring.unlink()
+            if not group.meters:
+                del self._groups[group.name]
+            elif running:
+                self._spawn(group)
+
+    def meters(self) -> List[ProcessMeter]:
+        with self._lock:
+            return [m for g in self._groups.values() for m in g.meters]
+
+    # ==================== 生命周期 ====================
+
+    def start(self, loop_ms: int = 1000, adaptive: bool = False, **poller_options):
+        """启动所有进程组"""
+        for name in list(self._groups):
+            self.start_group(name, loop_ms, adaptive, **poller_options)
+
+    def start_group(self, name: str, loop_ms: int = 1000, adaptive: bool = False, **poller_options):
+        with self._lock:
+            group = self._groups[name]
+            if group.options is not None:
+                return
+            group.options = dict(loop_ms=loop_ms, adaptive=adaptive, poller_options=poller_options)
+            group.backoff = self.restart_backoff
+            self._spawn(group)
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._supervise, name='dm40-supervisor', daemon=True)
+                self._thread.start()
+
+    def stop_group(self, name: str, timeout: float = 5.0):
+        with self._lock:
+            group = self._groups.get(name)
+            if group is None or group.options is None:
+                return
+            group.options = None
+            group.restart_at = None
+            self._terminate(group, timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """停止所有进程组和监督线程"""
+        for name in list(self._groups):
+            self.stop_group(name, timeout)
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self):
+        """停止并释放所有共享内存"""
+        self.stop()
+        with self._lock:
+            for group in self._groups.values():
+                for meter in group.meters:
+                    meter.ring.close()
+                    meter.ring.unlink()
+            self._groups.clear()
+
+    def is_group_alive(self, name: str) -> bool:
+        group = self._groups.get(name)
+        return group is not None and group.process is not None and group.process.is_alive()
+
+    def status(self) -> Dict[str, dict]:
+        """各进程组状态"""
+        now = time.monotonic()
+        with self._lock:
+            return {name: {
+                'pid': g.process.pid if g.process else None,
+                'alive': self.is_group_alive(name),
+                'restarts': g.restarts,
+                'devices': {m.device_id: {'state': m.ring.state, 'lost': m.lost,
+                                          'heartbeat_age': now - m.ring.heartbeat if m.ring.heartbeat else None}
+                            for m in g.meters},
+            } for name, g in self._groups.items()}
+
+    # ==================== 命令 ====================
+
+    def send(self, name: str, message: tuple):
+        """向进程组发送命令（进程未运行时丢弃）"""
+        with self._lock:
+            group = self._groups.get(name)
+            if group is None or group.conn is None:
+                return
+            try:
+                group.conn.send(message)
+            except (OSError, EOFError):
+                pass
+
+    def call(self, name: str, device_id: str, method: str, args: tuple = (), timeout: float = 5.0,
+             kwargs: Optional[dict] = None) -> Any:
+        """远程调用并等待结果，失败时抛出 RuntimeError，超时抛出 TimeoutError"""
+        call_id = next(self._call_ids)
+        pending = [threading.Event(), False, None]
+        self._calls[call_id] = pending
+        try:
+            if not self.is_group_alive(name):
+                raise RuntimeError(f"进程组 {name} 未运行")
+            self.send(name, ('call', call_id, device_id, method, tuple(args), kwargs or {}))
+            if not pending[0].wait(timeout):
+                raise TimeoutError(f"调用 {device_id}.{method} 超时")
+        finally:
+            self._calls.pop(call_id, None)
+        if not pending[1]:
+            raise RuntimeError(pending[2])
+        return pending[2]
+
+    # ==================== 监督 ====================
+
+    def _spawn(self, group: _Group):
+        parent_conn, child_conn = self._context.Pipe()
+        specs = [(m.device_id, m.url, m.ring.name) for m in group.meters]
+        options = group.options
+        process = self._context.Process(
+            target=_worker_main, name=f'dm40-{group.name}', daemon=True,
+            args=(specs, child_conn, options['loop_ms'], options['adaptive'], options['poller_options'],
+                  self.heartbeat_interval))
+        process.start()
+        child_conn.close()
+        group.process = process
+        group.conn = parent_conn
+        group.started_at = time.monotonic()
+        group.restart_at = None
+        print(f"工作进程已启动: {group.name} (PID {process.pid})")
+
+    def _terminate(self, group: _Group, timeout: float = 5.0):
+        process, conn = group.process, group.conn
+        if process is not None:
+            if process.is_alive() and conn is not None:
+                try:
+                    conn.send(('stop',))
+                except (OSError, EOFError):
+                    pass
+                process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(1.0)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        if conn is not None:
+            conn.close()
+        group.process = None
+        group.conn = None
+
+    def _supervise(self):
+        next_check = 0.0
+        while not self._stop.is_set():
+            with self._lock:
+                groups = list(self._groups.values())
+            for group in groups:
+                for meter in group.meters:
+                    meter._drain()
+                self._receive(group)
+            now = time.monotonic()
+            if now >= next_check:
+                next_check = now + self.heartbeat_interval
+                for group in groups:
+                    self._check(group, now)
+            self._stop.wait(self.poll_interval)
+
+    def _receive(self, group: _Group):
+        conn = group.conn
+        try:
+            while conn is not None and conn.poll():
+                kind, call_id, ok, result = conn.recv()
+                pending = self._calls.get(call_id)
+                if kind == 'result' and pending is not None:
+                    pending[1], pending[2] = ok, result
+                    pending[0].set()
+        except (OSError, EOFError):
+            pass
+
+    def _check(self, group: _Group, now: float):
+        with self._lock:
+            if group.options is None:
+                return
+            if group.process is None:
+                if group.restart_at is not None and now >= group.restart_at:
+                    group.restarts += 1
+                    self._spawn(group)
+                return
+            reason = None
+            if not group.process.is_alive():
+                reason = f"进程退出 (退出码 {group.process.exitcode})"
+            elif now - group.started_at > self.heartbeat_timeout:
+                stale = [m.device_id for m in group.meters if now - m.ring.heartbeat > self.heartbeat_timeout]
+                if stale:
+                    reason = f"心跳超时 {stale}"
+            if reason is None:
+                return
+            if now - group.started_at >= self.stable_time:
+                group.backoff = self.restart_backoff
+            print(f"工作进程 {group.name} 异常: {reason}，{group.backoff:g} 秒后重启")
+            self._terminate(group, timeout=0.5)
+            group.restart_at = now + group.backoff
+            group.backoff = min(group.backoff * 2, self.max_backoff)
+
+
+# ==================== 工作进程 ====================
+
+def _worker_main(specs, conn, loop_ms, adaptive, poller_options, heartbeat_interval):
+    """工作进程入口"""
+    try:
+        code = asyncio.run(_worker(specs, conn, loop_ms, adaptive, poller_options, heartbeat_interval))
+    except KeyboardInterrupt:
+        code = 0
+    raise SystemExit(code)
+
+
+async def _worker(specs, conn, loop_ms, adaptive, poller_options, heartbeat_interval) -> int:
+    from dm40_transport import transport_from_url
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    devices: Dict[str, Com_DM40A] = {}
+    rings: Dict[str, ShmRing] = {}
+    for device_id, url, ring_name in specs:
+        ring = ShmRing(ring_name)
+        device = Com_DM40A(transport=transport_from_url(url))
+        device.add_listener(ring)
+        devices[device_id] = device
+        rings[device_id] = ring
+
+    async def handle(message):
+        if message[0] == 'stop':
+            stop.set()
+            return
+        _, call_id, device_id, method, args, kwargs = message
+        try:
+            result = getattr(devices[device_id], method)(*args, **kwargs)
+            if asyncio.iscoroutine(result):
+                result = await result
+            reply = ('result', call_id, True, result)
+        except Exception as e:
+            reply = ('result', call_id, False, f"{type(e).__name__}: {e}")
+        if call_id is not None:
+            conn.send(reply)
+
+    def read_commands():
+        # 主进程退出时管道关闭，工作进程随之停止
+        try:
+            while True:
+                message = conn.recv()
+                asyncio.run_coroutine_threadsafe(handle(message), loop)
+        except (EOFError, OSError):
+            loop.call_soon_threadsafe(stop.set)
+
+    threading.Thread(target=read_commands, daemon=True).start()
+
+    async def heartbeat():
+        while True:
+            for device_id, device in devices.items():
+                rings[device_id].beat(device.get_state())
+            await asyncio.sleep(heartbeat_interval)
+
+    # 心跳独立运行，连接耗时较长（蓝牙扫描、重试）时不会被误判为卡死
+    beat_task = asyncio.create_task(heartbeat())
+    code = 0
+    try:
+        results = await asyncio.gather(*(device.start(loop_ms, adaptive, **poller_options)
+                                         for device in devices.values()))
+        for device_id, ok in zip(devices, results):
+            if not ok:
+                print(f"设备 {device_id} 启动失败")
+        while not stop.is_set():
+            if any(device.get_state() == -1 for device in devices.values()):
+                # 交给监督器按退避策略重启整个进程
+                code = 1
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        beat_task.cancel()
+        for device in devices.values():
+            await device.astop()
+        for ring in rings.values():
+            ring.beat(0)
+            ring.close()
+    return code
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DM40A 多进程采集")
+    parser.add_argument('--device', action='append', required=True,
+                        help='设备，格式 设备ID=传输URL[@进程组]，例如 m1=sim:// 或 m2=sim://@bench')
+    parser.add_argument('--interval', type=int, default=200, help='采样间隔(ms)')
+    args = parser.parse_args()
+
+    pool = WorkerPool()
+    for spec in args.device:
+        device_id, _, rest = spec.partition('=')
+        url, _, group = rest.partition('@')
+        meter = pool.add_meter(device_id, url, group or None)
+        meter.add_listener(lambda r, device_id=device_id: print(f"[{device_id}] {r.value} {r.unit} ({r.mode})"))
+    pool.start(args.interval)
+    try:
+        while True:
+            time.sleep(5)
+            for name, info in pool.status().items():
+                print(f"进程组 {name}: PID {info['pid']} 重启 {info['restarts']} 次")
+    except KeyboardInterrupt:
+        print("\n手动停止")
+    finally:
+        pool.close()
@@ -1,15 +1,174 @@
 """
 DM40A 蓝牙万用表通信类
 支持多种测量模式：电压、电流、电阻、电容、频率、温度等
+
+同步代码（脚本、Flask 请求处理）通过进程共享的事件循环线程访问设备:
+- Com_DM40A.run()/stop()/call() 在共享事件循环中执行
+- DM40Client 提供带超时的阻塞式接口
 """
 import asyncio
-from bleak import BleakClient, BleakScanner
-from bleak.backends.characteristic import BleakGATTCharacteristic
-from typing import Optional, Callable, Any, Tuple
+import concurrent.futures
+import threading
+from typing import Optional, Callable, Any, Tuple, NamedTuple, Iterable, Union
 import struct
 import time
+from dm40_stats import StabilityDetector, StatsEngine
+from dm40_poll import AdaptivePoller
+from dm40_filter import ChangeFilter
+from dm40_protocol import (MODE_COMMANDS, READ_COMMAND, FRAME_HEADER, Measurement,
+                           build_command, check_response, decode_measurement, frame_length)
+from dm40_rtt import COMMAND_CLASSES, RttEstimator, command_class
+from dm40_transport import Transport, BleakTransport, DEFAULT_DEVICE_ADDR
+
+_shared_loop: Optional[asyncio.AbstractEventLoop] = None
+_shared_loop_lock = threading.Lock()
+
+# 单调时钟 -> 系统时间的偏移，进程启动时确定一次；读数时间戳由单调时钟换算，不受系统时间调整影响
+_WALL_OFFSET = time.time() - time.monotonic()
+
+
+def wall_time(mono: float) -> float:
+    """把 time.monotonic() 时刻换算为系统时间（秒）"""
+    return mono + _WALL_OFFSET
+
+
+def shared_loop() -> asyncio.AbstractEventLoop:
+    """进程共享的事件循环，首次调用时在后台守护线程中启动"""
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='dm40-loop', daemon=True).start()
+            _shared_loop = loop
+        return _shared_loop
+
+
+def run_sync(coro, timeout: Optional[float] = None, loop: Optional[asyncio.AbstractEventLoop] = None) -> Any:
+    """
+    在事件循环（默认共享事件循环）中执行协程并阻塞等待结果
+    超时抛出 TimeoutError 并取消协程；不能在该事件循环自身的线程中调用
+    """
+    loop = loop or shared_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("不能在事件循环线程中同步等待，请使用 await")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError("等待设备操作超时")
+
+
+class Reading(NamedTuple):
+    """
+    一次测量读数，传给读数监听器；超量程 (OL) 时 value 为 None，详情见 measurement
+    直接从万用表读取时 timestamp 为读数命令发出与应答到达的中点（由单调时钟换算为系统时间），
+    uncertainty 为半个往返时间，即采样时刻的最大误差
+    """
+    value: Optional[float]
+    unit: str
+    mode: str
+    timestamp: float
+    measurement: Optional[Measurement] = None
+    mono: Optional[float] = None            # 采样时刻（本进程 time.monotonic）
+    uncertainty: Optional[float] = None     # 采样时刻误差（秒），未知为 None
+
+
+class ReadingPublisher:
+    """
+    读数发布基类: 当前数据、数据更新回调、读数监听器和统计
+    Com_DM40A 以及其他读数来源（如工作进程中的万用表代理）共用
+    """
+
+    def __init__(self):
+        self._current_data = None
+        self._current_unit = ""
+        self._current_mode = ""
+        self._current_measurement: Optional[Measurement] = None
+        self._data_update_callback = None
+        self._data_update_filter: Optional[ChangeFilter] = None
+        self._listeners = []    # [(listener, filter)]
+        self._stats: Optional[StatsEngine] = None
+
+    def set_data_update_callback(self, callback: Callable[[float, str, str], None],
+                                 filter: Optional[ChangeFilter] = None):
+        """设置数据更新回调 (data, unit, mode)，filter 可选，只回调通过过滤的读数"""
+        self._data_update_callback = callback
+        self._data_update_filter = filter
+
+    def add_listener(self, listener: Callable[[Reading], None], filter: Optional[ChangeFilter] = None):
+        """
+        添加读数监听器，每个新读数调用 listener(reading)，可添加多个
+        filter 为该监听器独立的变化/死区过滤器，不设置则接收全部读数
+        """
+        if all(l != listener for l, _ in self._listeners):
+            self._listeners = self._listeners + [(listener, filter)]
+
+    def remove_listener(self, listener: Callable[[Reading], None]):
+        """移除读数监听器"""
+        self._listeners = [(l, f) for l, f in self._listeners if l != listener]
+
+    def _publish(self, data: Optional[float], unit: str, mode: str, measurement: Optional[Measurement] = None,
+                 timestamp: Optional[float] = None, mono: Optional[float] = None,
+                 uncertainty: Optional[float] = None):
+        """更新当前数据并分发给回调和监听器，timestamp 默认为当前时间"""
+        self._current_data = data
+        self._current_unit = unit
+        self._current_mode = mode
+        self._current_measurement = measurement
+        reading = Reading(data, unit, mode, time.time() if timestamp is None else timestamp, measurement,
+                          mono, uncertainty)
+        # 旧回调只接收有效数值，超量程读数通过监听器获取
+        if self._data_update_callback and data is not None:
+            if self._data_update_filter is None or self._data_update_filter.accept(reading):
+                self._data_update_callback(data, unit, mode)
+        for listener, filter in self._listeners:
+            if filter is not None and not filter.accept(reading):
+                continue
+            try:
+                listener(reading)
+            except Exception as e:
+                print(f"监听器错误: {e}")
+
+    def get_current_data(self) -> Tuple[Optional[float], str, str]:
+        """获取最新数据 (value, unit, mode)"""
+        return self._current_data, self._current_unit, self._current_mode
+
+    def get_current_measurement(self) -> Optional[Measurement]:
+        """获取最新的完整测量结果（含基本单位数值、精度、OL/HOLD 标志）"""
+        return self._current_measurement
+
+    # ==================== 统计 ====================
+
+    def enable_stats(self, windows: Iterable[float] = (10, 60)) -> StatsEngine:
+        """启用读数统计（MIN/MAX/AVG/RMS/标准差/REL），windows 为滑动窗口长度（秒）"""
+        if self._stats is None:
+            self._stats = StatsEngine(windows)
+            self.add_listener(self._stats)
+        return self._stats
+
+    def get_stats(self) -> Optional[dict]:
+        """获取统计结果，未启用统计时返回 None"""
+        return self._stats.snapshot() if self._stats else None
+
+    def reset_stats(self):
+        """清零统计"""
+        if self._stats:
+            self._stats.reset()
 
-class Com_DM40A:
+    def set_relative(self, value: Optional[float] = None) -> Optional[float]:
+        """设置 REL 参考值，默认取当前读数"""
+        if self._stats is None:
+            self.enable_stats()
+        return self._stats.set_reference(value)
+
+
+class Com_DM40A(ReadingPublisher):
     # 测量模式常量
     MODE_DC_VOLTAGE = 1      # 直流电压
     MODE_AC_VOLTAGE = 2      # 交流电压
@@ -22,69 +181,132 @@ class Com_DM40A:
     MODE_DIODE = 9           # 二极管
     MODE_CONTINUITY = 10     # 通断
 
-    def __init__(self, device_addr: str = "EB31784A-359B-AAF1-E798-76064EA680CD", max_retry: int = 3):
+    # 状态字节的超量程位尚未实机确认，默认只按原始读数 0xFFFF 判断超量程
+    status_overload = False
+    # 应答帧的长度字节、命令回显和校验和只在模拟器上验证过，默认帧格式不符时只告警并计入 bad_frames，
+    # 仍然使用该应答；用真机抓到的应答确认 check_response 后再设为 True（不符时按无应答处理并重发）
+    strict_frames = False
+    # 应答分段到达时两段之间的最长等待（秒），超过后按已收到的数据处理，长度字节误读时不必等到超时
+    fragment_timeout = 0.1
+
+    def __init__(self, device_addr: str = DEFAULT_DEVICE_ADDR, max_retry: int = 3,
+                 transport: Optional[Transport] = None):
+        """
+        device_addr: 蓝牙地址（未指定 transport 时使用蓝牙直连）
+        transport: 自定义传输层，例如 TcpTransport、LoopbackTransport
+        """
+        super().__init__()
         self._device_addr = device_addr
-        self._client: Optional[BleakClient] = None
-        self._rx_char: Optional[BleakGATTCharacteristic] = None
-        self._tx_char: Optional[BleakGATTCharacteristic] = None
+        self._transport = transport or BleakTransport(device_addr)
+        self._transport.set_receive_handler(self._on_receive)
         self._response_event = asyncio.Event()
         self._response_data = bytearray()
-        self.write_uuid = "0000fff1-0000-1000-8000-00805f9b34fb"
-        self.read_uuid = "0000fff2-0000-1000-8000-00805f9b34fb"
+        self._command_lock = asyncio.Lock()     # 同一时间只有一条命令等待响应
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         self._task = None
-        self._current_data = None
-        self._current_unit = ""
-        self._current_mode = ""
         self._stop_event = asyncio.Event()
-        self._data_update_callback = None
+        self._wake_event = asyncio.Event()      # 停止或加速时唤醒等待中的采集循环
+        self._poller: Optional[AdaptivePoller] = None
+        self._subscribers: Optional[int] = None     # 采样控制器创建前设置的订阅者数量在 start() 时应用
+        self.last_rtt: Optional[float] = None
+        self.last_sample_time: Optional[Tuple[float, float]] = None    # 最近一次应答的 (采样时刻, 误差)
+        self._rx_time = 0.0
+        # 每类命令独立的 RTT 估计，超时按 SRTT/RTTVAR 计算
+        self._rtt = {name: RttEstimator.for_class(c) for name, c in COMMAND_CLASSES.items()}
+        self._settle_until = 0.0    # 模式切换后的稳定期内读数命令不使用过短的超时
+        self.timeouts = 0
+        self.retries = 0
+        self.bad_frames = 0
         self._mode = 0
         self._task_state = 0
         self.max_retry = max_retry
 
-    def run(self, loop_ms=1000):
-        """启动后台任务持续获取数据"""
+    def run(self, loop_ms=1000, adaptive: bool = False, **poller_options):
+        """
+        启动后台任务持续获取数据
+        adaptive=True 时按 RTT、信号变化和订阅者数量自动调整采样间隔（loop_ms 为基准间隔），
+        poller_options 传给 AdaptivePoller
+        在事件循环线程中调用时使用当前事件循环，否则使用进程共享的事件循环
+        """
         try:
             loop = asyncio.get_running_loop()
         except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            import threading
-            def run_loop():
-                loop.run_forever()
-            threading.Thread(target=run_loop, daemon=True).start()
-
-        async def start_operations():
-            if not self._client or not self._client.is_connected:
-                try:
-                    await self.connect()
-                except Exception as e:
-                    self._task_state = -1
-                    print(f"连接失败: {e}")
-                    return
-
-            if self._task_state == 0:
-                self._stop_event.clear()
-                self._task = asyncio.create_task(self._run_task(loop_ms))
-
-        asyncio.run_coroutine_threadsafe(start_operations(), loop)
-
-    def set_data_update_callback(self, callback: Callable[[float, str, str], None]):
-        """设置数据更新回调 (data, unit, mode)"""
-        self._data_update_callback = callback
+            loop = shared_loop()
+
+        asyncio.run_coroutine_threadsafe(self.start(loop_ms, adaptive, **poller_options), loop)
+
+    async def start(self, loop_ms=1000, adaptive: bool = False, **poller_options) -> bool:
+        """在当前事件循环中连接设备并启动采集任务（供异步代码使用），返回是否成功"""
+        self._loop = asyncio.get_running_loop()
+        self._poller = AdaptivePoller(base_interval=loop_ms / 1000, **poller_options) if adaptive else None
+        if self._poller:
+            self._poller.set_subscribers(self._subscribers)
+        if not self._transport.is_connected:
+            try:
+                await self.connect()
+            except Exception as e:
+                self._task_state = -1
+                print(f"连接失败: {e}")
+                return False
+
+        if self._task_state == 0:
+            self._stop_event.clear()
+            self._task = asyncio.create_task(self._run_task(loop_ms))
+        return True
+
+    def boost(self, duration: Optional[float] = None):
+        """临时以最快速率采样（仅自适应模式有效），可从任意线程调用"""
+        if self._poller:
+            self._poller.boost(duration)
+            self._wake()
+
+    def _wake(self):
+        """唤醒等待中的采集循环"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake_event.set)
+
+    def set_subscriber_count(self, count: Optional[int]):
+        """设置数据订阅者数量，自适应模式下无订阅者时降速；可在 run() 之前或连接过程中调用"""
+        self._subscribers = count
+        poller = self._poller
+        if poller:
+            poller.set_subscribers(count)
+            self._wake()
 
     async def _run_task(self, loop_ms=1000):
-        """后台任务主循环"""
+        """
+        后台任务主循环
+        按单调时钟截止时间调度，采样周期不受读取耗时影响；错过的周期直接跳过，不补采
+        """
         self._task_state = 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
         while not self._stop_event.is_set():
             try:
-                data, unit, mode = await self.get_data()
-                if data is not None:
-                    self._current_data = data
-                    self._current_unit = unit
-                    self._current_mode = mode
-                    if self._data_update_callback:
-                        self._data_update_callback(data, unit, mode)
-                await asyncio.sleep(loop_ms/1000)
+                measurement = await self.get_measurement()
+                if measurement is not None:
+                    mono, uncertainty = self.last_sample_time
+                    self._publish(measurement.value, measurement.unit, measurement.mode, measurement,
+                                  wall_time(mono), mono, uncertainty)
+                if self._poller:
+                    if self.last_rtt is not None:
+                        self._poller.record_rtt(self.last_rtt)
+                    self._poller.observe(measurement.value if measurement else None)
+                    interval = self._poller.next_interval()
+                else:
+                    interval = loop_ms / 1000
+                deadline += interval
+                now = loop.time()
+                if deadline < now:
+                    deadline = now
+                if deadline > now:
+                    # 等待期间收到停止或加速请求时立即进入下一轮
+                    try:
+                        await asyncio.wait_for(self._wake_event.wait(), deadline - now)
+                        deadline = loop.time()
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake_event.clear()
             except Exception as e:
                 print(f"任务运行错误: {e}")
                 self._task_state = -1
@@ -93,45 +315,45 @@ class Com_DM40A:
         await self.disconnect()
         self._task_state = 0
 
-    def stop(self):
-        """停止后台任务"""
+    def stop(self, timeout: float = 10.0):
+        """停止后台任务并断开连接（阻塞，在采集所在的事件循环中执行）"""
+        if self._task and self._loop is not None:
+            try:
+                run_sync(self.astop(), timeout, self._loop)
+            except TimeoutError:
+                print("停止采集任务超时")
+        self._task_state = 0
+
+    def call(self, method: str, *args, timeout: float = 5.0, **kwargs) -> Any:
+        """
+        从同步代码调用设备方法，协程方法在设备所在的事件循环中执行并等待结果
+        例如 device.call('set_dc_voltage_mode')；timeout 为同步等待时间，超时抛出 TimeoutError
+        """
+        result = getattr(self, method)(*args, **kwargs)
+        if asyncio.iscoroutine(result):
+            result = run_sync(result, timeout, self._loop)
+        return result
+
+    async def astop(self):
+        """在事件循环中停止采集任务并断开连接（供异步代码使用）"""
         if self._task:
             self._stop_event.set()
-            while self._task_state == 1:
-                time.sleep(0.1)
+            self._wake_event.set()
+            await self._task
+            self._task = None
         self._task_state = 0
 
-    def get_current_data(self) -> Tuple[Optional[float], str, str]:
-        """获取最新数据 (value, unit, mode)"""
-        return self._current_data, self._current_unit, self._current_mode
+    @property
+    def transport(self) -> Transport:
+        """当前传输层"""
+        return self._transport
 
     async def connect(self) -> bool:
-        """连接蓝牙设备"""
+        """连接设备"""
         retry_count = 0
         while retry_count < self.max_retry:
             try:
-                device = await BleakScanner.find_device_by_address(self._device_addr)
-                if not device:
-                    raise Exception(f"未找到设备: {self._device_addr}")
-
-                print(f"找到设备: {self._device_addr}")
-                self._client = BleakClient(device)
-                print("开始连接:{}".format(self._device_addr))
-                await self._client.connect()
-                print("连接成功:{}".format(self._device_addr))
-
-                for service in self._client.services:
-                    for char in service.characteristics:
-                        if self.read_uuid == char.uuid:
-                            self._rx_char = char
-                        if self.write_uuid == char.uuid:
-                            self._tx_char = char
-
-                if not self._rx_char or not self._tx_char:
-                    raise Exception("未找到所需的特征值")
-
-                print("设置通知:{}".format(self._rx_char.uuid))
-                await self._client.start_notify(self._rx_char.uuid, self._notification_handler)
+                await self._transport.connect()
                 return True
             except Exception as e:
                 retry_count += 1
@@ -141,118 +363,165 @@ class Com_DM40A:
         raise Exception("达到最大重试次数，连接失败")
 
     async def disconnect(self):
-        """断开蓝牙连接"""
-        if self._client and self._client.is_connected:
-            await self._client.stop_notify(self._rx_char.uuid)
-            await self._client.disconnect()
-
-    def _notification_handler(self, sender: BleakGATTCharacteristic, data: bytearray):
-        """接收数据回调函数"""
+        """断开连接"""
+        if self._transport.is_connected:
+            await self._transport.disconnect()
+
+    def _on_receive(self, data: bytes):
+        """接收数据回调函数，记录应答第一段到达的时刻"""
+        if not self._response_data:
+            self._rx_time = time.monotonic()
         self._response_data.extend(data)
         self._response_event.set()
 
-    async def send_command(self, cmd: bytes, timeout: float = 1.0) -> Optional[bytearray]:
-        """发送命令并等待响应"""
-        if not self._client or not self._client.is_connected:
+    async def send_command(self, cmd: bytes, timeout: Optional[float] = None,
+                           retries: Optional[int] = None, validate: bool = True) -> Optional[bytearray]:
+        """
+        发送命令并等待响应
+        timeout 不指定时按该类命令的实测 RTT 自适应计算（见 dm40_rtt），超时后立即重发 retries 次
+        （默认取命令类别的设置）；全部超时返回 None
+        应答分多次通知到达时按帧头中的长度拼接成整帧；validate 为 True 时检查帧格式（见
+        dm40_protocol.check_response），不符时告警并计数，strict_frames 为 True 时按无应答处理并重发
+        """
+        if not self._transport.is_connected:
             raise Exception("设备未连接")
 
-        self._response_data.clear()
-        self._response_event.clear()
-
-        await self._client.write_gatt_char(self._tx_char.uuid, cmd)
-
-        try:
-            await asyncio.wait_for(self._response_event.wait(), timeout)
-            return self._response_data
-        except asyncio.TimeoutError:
-            print("等待响应超时")
-            return None
-
-    def _calculate_checksum(self, cmd_bytes: list) -> int:
-        """计算校验和 (简单的异或校验)"""
-        checksum = 0
-        for b in cmd_bytes[:-1]:  # 排除最后一个字节（校验位本身）
-            checksum ^= b
-        return checksum
+        kind = command_class(cmd)
+        estimator = self._rtt[kind]
+        if retries is None:
+            retries = COMMAND_CLASSES[kind].retries
+
+        async with self._command_lock:
+            first_start = None
+            for attempt in range(retries + 1):
+                self._response_data.clear()
+                self._response_event.clear()
+
+                start = time.monotonic()
+                if first_start is None:
+                    first_start = start
+                await self._transport.write(cmd)
+
+                deadline = start + (self._command_timeout(kind) if timeout is None else timeout)
+                response = await self._receive_frame(deadline)
+                if response is None:
+                    estimator.backoff()
+                    self.timeouts += 1
+                    if attempt < retries:
+                        self.retries += 1
+                    continue
+
+                rtt = time.monotonic() - start
+                if validate:
+                    error = check_response(cmd, response)
+                    if error:
+                        print(f"警告: 应答帧无效: {error}")
+                        self.bad_frames += 1
+                        if self.strict_frames:
+                            if attempt < retries:
+                                self.retries += 1
+                            continue
+                # 万用表在发送命令与应答到达之间的某一时刻采样，取中点，误差为半个往返时间；
+                # 重发后的应答可能对应此前任意一次发送（迟到的应答），采样区间从第一次发送算起
+                half = max(self._rx_time - first_start, 0.0) / 2
+                self.last_sample_time = (first_start + half, half)
+                # Karn 算法: 重发后的应答无法确定对应哪一次发送，不计入 RTT
+                if attempt == 0:
+                    estimator.sample(rtt)
+                    self.last_rtt = rtt
+                if kind == 'mode':
+                    self._settle_until = time.monotonic() + COMMAND_CLASSES['mode'].initial
+                return response
+
+        print("等待响应超时")
+        return None
+
+    async def _receive_frame(self, deadline: float) -> Optional[bytearray]:
+        """
+        等待应答直到凑齐帧头中声明的长度，超时返回 None；帧头不符时原样返回已收到的数据
+        已收到部分应答后 fragment_timeout 秒内没有新数据（或到达 deadline）时返回已收到的部分
+        """
+        while True:
+            wait = deadline - time.monotonic()
+            if self._response_data:
+                wait = min(wait, self.fragment_timeout)
+            try:
+                await asyncio.wait_for(self._response_event.wait(), max(wait, 0))
+            except asyncio.TimeoutError:
+                return bytearray(self._response_data) if self._response_data else None
+            self._response_event.clear()
+            data = self._response_data
+            expected = frame_length(data)
+            if expected is None:
+                if len(data) < len(FRAME_HEADER) + 2 and FRAME_HEADER.startswith(bytes(data[:len(FRAME_HEADER)])):
+                    continue
+                return bytearray(data)
+            if len(data) >= expected:
+                return bytearray(data)
+
+    def _command_timeout(self, kind: str) -> float:
+        """该类命令当前的超时，模式切换后的稳定期内读数命令至少等待初始超时"""
+        rto = self._rtt[kind].rto
+        if kind == 'read' and time.monotonic() < self._settle_until:
+            rto = max(rto, COMMAND_CLASSES['read'].initial)
+        return rto
+
+    def get_link_stats(self) -> dict:
+        """通信链路统计: 各类命令的 SRTT/RTTVAR/RTO，超时和重发次数"""
+        return {
+            'timeouts': self.timeouts,
+            'retries': self.retries,
+            'bad_frames': self.bad_frames,
+            'classes': {name: estimator.to_dict() for name, estimator in self._rtt.items()},
+        }
 
     # ==================== 测量模式设置 ====================
 
+    async def _set_mode(self, name: str, label: str) -> bool:
+        """发送预生成的模式设置命令（见 dm40_protocol.MODE_COMMANDS）"""
+        response = await self.send_command(MODE_COMMANDS[name])
+        print(f"设置{label}模式: {'成功' if response else '失败'}")
+        return response is not None
+
     async def set_dc_voltage_mode(self) -> bool:
         """设置直流电压模式 (DCV)"""
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x30, 0x12])
-        response = await self.send_command(cmd)
-        print(f"设置直流电压模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('dc_voltage', '直流电压')
 
     async def set_ac_voltage_mode(self) -> bool:
         """设置交流电压模式 (ACV)"""
-        # 根据协议推测，AC模式可能在第5字节使用不同的值
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x31, 0x13])
-        response = await self.send_command(cmd)
-        print(f"设置交流电压模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('ac_voltage', '交流电压')
 
     async def set_dc_current_mode(self) -> bool:
         """设置直流电流模式 (DCA)"""
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x39, 0x09])
-        response = await self.send_command(cmd)
-        print(f"设置直流电流模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('dc_current', '直流电流')
 
     async def set_ac_current_mode(self) -> bool:
         """设置交流电流模式 (ACA)"""
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x3a, 0x08])
-        response = await self.send_command(cmd)
-        print(f"设置交流电流模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('ac_current', '交流电流')
 
     async def set_resistance_mode(self) -> bool:
         """设置电阻模式 (Ω)"""
-        # 0x32 可能对应电阻模式
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x32, 0x1b])
-        response = await self.send_command(cmd)
-        print(f"设置电阻模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('resistance', '电阻')
 
     async def set_capacitance_mode(self) -> bool:
         """设置电容模式 (F)"""
-        # 0x33 可能对应电容模式
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x33, 0x1a])
-        response = await self.send_command(cmd)
-        print(f"设置电容模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('capacitance', '电容')
 
     async def set_frequency_mode(self) -> bool:
         """设置频率模式 (Hz)"""
-        # 0x34 可能对应频率模式
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x34, 0x19])
-        response = await self.send_command(cmd)
-        print(f"设置频率模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('frequency', '频率')
 
     async def set_temperature_mode(self) -> bool:
         """设置温度模式 (°C)"""
-        # 0x35 可能对应温度模式
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x35, 0x18])
-        response = await self.send_command(cmd)
-        print(f"设置温度模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('temperature', '温度')
 
     async def set_diode_mode(self) -> bool:
         """设置二极管模式"""
-        # 0x36 可能对应二极管模式
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x36, 0x1f])
-        response = await self.send_command(cmd)
-        print(f"设置二极管模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('diode', '二极管')
 
     async def set_continuity_mode(self) -> bool:
         """设置通断模式"""
-        # 0x37 可能对应通断模式
-        cmd = bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x37, 0x1e])
-        response = await self.send_command(cmd)
-        print(f"设置通断模式: {'成功' if response else '失败'}")
-        return response is not None
+        return await self._set_mode('continuity', '通断')
 
     # ==================== 向后兼容 ====================
 
@@ -266,78 +535,94 @@ class Com_DM40A:
 
     # ==================== 数据获取 ====================
 
+    async def get_measurement(self) -> Optional[Measurement]:
+        """
+        获取一次完整测量结果
+        返回: Measurement（含基本单位数值、精度、量程、OL/HOLD 标志），无响应时返回 None
+        """
+        response = await self.send_command(READ_COMMAND)
+        return decode_measurement(response, self.status_overload)
+
     async def get_data(self) -> Tuple[Optional[float], str, str]:
         """
         获取测量数据
-        返回: (value, unit, mode)
+        返回: (value, unit, mode)，超量程时 value 为 None
         """
-        cmd = bytes([0xaf, 0x05, 0x03, 0x09, 0x00, 0x40])
-        response = await self.send_command(cmd)
-
-        if response is not None and len(response) >= 6:
-            # 解析比例因子
-            if response[-8] == 0x18:
-                data_x = 0.1
-            elif response[-8] == 0x19:
-                data_x = -0.1
-            elif response[-8] == 0x16:
-                data_x = 1
-            elif response[-8] == 0x17:
-                data_x = -1
-            elif response[-8] == 0x15:
-                data_x = -0.01
-            elif response[-8] == 0x14:
-                data_x = 0.01
-            elif response[-8] == 0x28:
-                data_x = 0.1
-            elif response[-8] == 0x29:
-                data_x = -0.1
-            else:
-                data_x = 1
-
-            # 解码单位和模式
-            mode_byte = response[5]
-            if mode_byte == 0x30:
-                unit, mode = 'mV', 'DC Voltage'
-            elif mode_byte == 0x31:
-                unit, mode = 'mV', 'AC Voltage'
-            elif mode_byte == 0x39:
-                unit, mode = 'mA', 'DC Current'
-            elif mode_byte == 0x3a:
-                unit, mode = 'mA', 'AC Current'
-            elif mode_byte == 0x32:
-                unit, mode = 'Ω', 'Resistance'
-            elif mode_byte == 0x33:
-                unit, mode = 'nF', 'Capacitance'
-            elif mode_byte == 0x34:
-                unit, mode = 'Hz', 'Frequency'
-            elif mode_byte == 0x35:
-                unit, mode = '°C', 'Temperature'
-            elif mode_byte == 0x36:
-                unit, mode = 'V', 'Diode'
-            elif mode_byte == 0x37:
-                unit, mode = 'Ω', 'Continuity'
-            else:
-                unit, mode = f'0x{mode_byte:02x}', 'Unknown'
+        measurement = await self.get_measurement()
+        if measurement is None:
+            return None, '', ''
+        return measurement.value, measurement.unit, measurement.mode
 
-            # 解析数据值
-            data = response[-3] | response[-2] << 8
-            result = round(data * data_x, 2)
-            return result, unit, mode
+    async def wait_stable(self, tolerance: Optional[float] = None, window: float = 1.0, timeout: float = 10.0,
+                          mode: Optional[str] = None, min_samples: int = 3) -> Optional[Reading]:
+        """
+        等待读数稳定，稳定后立即返回最新读数，超时返回 None
+        - tolerance: 允许的标准差和 window 秒内的漂移（显示单位），默认取 2 个显示分辨率
+        - mode: 只接受该模式的读数（如 "Resistance"），用于跳过模式切换前的旧读数
+        后台采集运行时监听采集到的读数，否则直接连续读取
+        读数单位/模式变化或超量程时重新开始判断
+        """
+        detector = None
+        key = None
+        result = asyncio.get_running_loop().create_future()
 
-        return None, '', ''
+        def feed(reading: Reading):
+            nonlocal detector, key
+            if result.done():
+                return
+            if reading.value is None or (mode is not None and reading.mode != mode):
+                detector = None
+                return
+            if detector is None or key != (reading.unit, reading.mode):
+                tol = tolerance
+                if tol is None:
+                    decimals = reading.measurement.decimals if reading.measurement else 2
+                    tol = 2 / 10 ** decimals
+                detector = StabilityDetector(tol, window, min_samples)
+                key = (reading.unit, reading.mode)
+            if detector.update(reading.timestamp, reading.value):
+                result.set_result(reading)
+
+        polling = self._task is not None and not self._task.done()
+        if polling:
+            self.add_listener(feed)
+        try:
+            if polling:
+                return await asyncio.wait_for(result, timeout)
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                measurement = await self.get_measurement()
+                if measurement is not None:
+                    mono, uncertainty = self.last_sample_time
+                    feed(Reading(measurement.value, measurement.unit, measurement.mode, wall_time(mono),
+                                 measurement, mono, uncertainty))
+                    if result.done():
+                        return result.result()
+            return None
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if polling:
+                self.remove_listener(feed)
 
     # ==================== 自定义命令 ====================
 
-    async def send_custom_command(self, cmd_bytes: list) -> Tuple[Optional[bytearray], str]:
+    async def send_custom_command(self, cmd_bytes: Union[bytes, list, int],
+                                  payload: bytes = b'') -> Tuple[Optional[bytearray], str]:
         """
         发送自定义命令用于实验和调试
-        参数: cmd_bytes - 命令字节列表，例如 [0xaf, 0x05, 0x03, 0x06, 0x01, 0x30, 0x12]
-        返回: (response, hex_string)
+        参数: cmd_bytes - 完整命令帧（bytes 或字节列表），例如 [0xaf, 0x05, 0x03, 0x06, 0x01, 0x30, 0x12]；
+                         或命令字节（int），此时由 build_command 按 payload 生成带长度和校验和的帧
+        返回: (response, hex_string)，应答不做帧格式检查
         """
-        cmd = bytes(cmd_bytes)
+        if isinstance(cmd_bytes, int):
+            cmd = build_command(cmd_bytes, payload)
+        else:
+            cmd = cmd_bytes if isinstance(cmd_bytes, bytes) else bytes(cmd_bytes)
+            if sum(cmd) & 0xFF:
+                print(f"警告: 命令校验和错误，应为 0x{-sum(cmd[:-1]) & 0xFF:02x}")
         print(f"发送自定义命令: {cmd.hex()}")
-        response = await self.send_command(cmd)
+        response = await self.send_command(cmd, validate=False)
         if response:
             return response, response.hex()
         return None, ""
@@ -358,45 +643,123 @@ class Com_DM40A:
         return self._task_state
 
 
-if __name__ == "__main__":
-    import time
 
+class DM40Client:
+    """
+    阻塞式客户端，设备的全部异步操作在进程共享的事件循环线程中执行
+    每个方法阻塞到完成或超时（超时抛出 TimeoutError），可在脚本和 Flask 请求处理中直接调用:
+
+        with DM40Client("D7:ED:DF:91:FC:4D") as meter:
+            meter.set_mode('dc_voltage')
+            print(meter.get_measurement())
+    """
+
+    def __init__(self, device_addr: str = DEFAULT_DEVICE_ADDR, max_retry: int = 3,
+                 transport: Optional[Transport] = None, timeout: float = 5.0):
+        self.device = Com_DM40A(device_addr, max_retry, transport)
+        self.timeout = timeout
+
+    def _run(self, coro, timeout: Optional[float]):
+        return run_sync(coro, self.timeout if timeout is None else timeout)
+
+    def connect(self, timeout: Optional[float] = 60.0) -> bool:
+        """连接设备（含重试，蓝牙扫描较慢，默认最多等待 60 秒）"""
+        return self._run(self.device.connect(), timeout)
+
+    def disconnect(self, timeout: Optional[float] = None):
+        self._run(self.device.disconnect(), timeout)
+
+    def start(self, loop_ms: int = 1000, adaptive: bool = False, timeout: Optional[float] = 60.0,
+              **poller_options) -> bool:
+        """连接（如未连接）并启动后台采集，返回是否成功"""
+        return self._run(self.device.start(loop_ms, adaptive, **poller_options), timeout)
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止后台采集并断开连接"""
+        self._run(self.device.astop(), timeout)
+        self._run(self.device.disconnect(), timeout)
+
+    def set_mode(self, name: str, timeout: Optional[float] = None) -> bool:
+        """按名称切换测量模式，name 如 dc_voltage、resistance，对应 Com_DM40A.set_<name>_mode"""
+        method = getattr(self.device, f'set_{name}_mode', None)
+        if method is None:
+            raise ValueError(f"未知模式: {name}")
+        return self._run(method(), timeout)
+
+    def get_measurement(self, timeout: Optional[float] = None) -> Optional[Measurement]:
+        return self._run(self.device.get_measurement(), timeout)
+
+    def wait_stable(self, tolerance: Optional[float] = None, window: float = 1.0, timeout: float = 10.0,
+                    mode: Optional[str] = None) -> Optional[Reading]:
+        """等待读数稳定，见 Com_DM40A.wait_stable"""
+        return self._run(self.device.wait_stable(tolerance, window, timeout, mode), timeout + self.timeout)
+
+    def get_data(self, timeout: Optional[float] = None) -> Tuple[Optional[float], str, str]:
+        return self._run(self.device.get_data(), timeout)
+
+    def send_command(self, cmd: bytes, timeout: Optional[float] = None) -> Optional[bytearray]:
+        return self._run(self.device.send_command(cmd), timeout)
+
+    def add_listener(self, listener: Callable[[Reading], None], filter: Optional[ChangeFilter] = None):
+        """读数监听器在事件循环线程中调用，不应阻塞"""
+        self.device.add_listener(listener, filter)
+
+    def remove_listener(self, listener: Callable[[Reading], None]):
+        self.device.remove_listener(listener)
+
+    def get_current_data(self) -> Tuple[Optional[float], str, str]:
+        return self.device.get_current_data()
+
+    def get_state(self) -> int:
+        return self.device.get_state()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+if __name__ == "__main__":
     def update_display(data, unit, mode):
         print(f"[{mode}] 数据: {data} {unit}")
 
-    device = Com_DM40A()
-    device.set_data_update_callback(update_display)
-    device.run(200)
+    client = DM40Client()
+    client.device.set_data_update_callback(update_display)
 
     print("等待连接...")
-    try:
-        while device.get_state() != 1:
-            if device.get_state() == -1:
-                print("连接失败，退出")
-                exit(1)
-            time.sleep(0.5)
+    if not client.start(200):
+        print("连接失败，退出")
+        exit(1)
 
+    try:
         print("连接成功！开始测试各测量模式...")
         print("\n=== DM40A 测量模式测试 ===\n")
 
-        # 测试各种模式
+        # 测试各种模式: (中文名称, 模式名, 读数中的模式)
         modes = [
-            ("直流电压", device.set_dc_voltage_mode),
-            ("交流电压", device.set_ac_voltage_mode),
-            ("直流电流", device.set_dc_current_mode),
-            ("交流电流", device.set_ac_current_mode),
-            ("电阻", device.set_resistance_mode),
-            ("电容", device.set_capacitance_mode),
-            ("频率", device.set_frequency_mode),
-            ("温度", device.set_temperature_mode),
-            ("二极管", device.set_diode_mode),
-            ("通断", device.set_continuity_mode),
+            ("直流电压", 'dc_voltage', 'DC Voltage'),
+            ("交流电压", 'ac_voltage', 'AC Voltage'),
+            ("直流电流", 'dc_current', 'DC Current'),
+            ("交流电流", 'ac_current', 'AC Current'),
+            ("电阻", 'resistance', 'Resistance'),
+            ("电容", 'capacitance', 'Capacitance'),
+            ("频率", 'frequency', 'Frequency'),
+            ("温度", 'temperature', 'Temperature'),
+            ("二极管", 'diode', 'Diode'),
+            ("通断", 'continuity', 'Continuity'),
         ]
 
-        for name, mode_func in modes:
+        for name, mode_name, mode in modes:
             print(f"\n--- 切换到 {name} 模式 ---")
-            asyncio.run(mode_func())
-            time.sleep(2)  # 等待数据稳定
+            client.set_mode(mode_name)
+            # 读数稳定后立即进入下一个模式
+            reading = client.wait_stable(window=0.5, timeout=5.0, mode=mode)
+            if reading:
+                print(f"{name} 稳定读数: {reading.value} {reading.unit}")
+            else:
+                print(f"{name} 读数未稳定")
 
         print("\n测试完成，继续读取数据...")
 
@@ -406,5 +769,5 @@ if __name__ == "__main__":
 
     except KeyboardInterrupt:
         print("\n手动停止")
-        device.stop()
+        client.stop()
         print("结束")
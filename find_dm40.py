@@ -4,10 +4,11 @@
 """
 
 import asyncio
-from bleak import BleakScanner
 
 async def find_dm40_device():
     """查找 DM40 设备"""
+    from bleak import BleakScanner
+
     print("🔍 正在扫描 DM40 系列设备...")
     print("=" * 60)
 
@@ -5,7 +5,6 @@
 """
 
 import asyncio
-from bleak import BleakScanner
 import sys
 
 async def scan_ble_devices(timeout=10):
@@ -21,6 +20,8 @@ async def scan_ble_devices(timeout=10):
     print(f"开始扫描蓝牙设备... (扫描时间: {timeout}秒)")
     print("-" * 60)
 
+    from bleak import BleakScanner
+
     # 开始扫描
     devices = await BleakScanner.discover(timeout=timeout, return_adv=True)
 
@@ -60,6 +61,7 @@ async def scan_for_specific_device(device_name_keyword, timeout=15):
     print(f"正在搜索包含 '{device_name_keyword}' 的设备...")
     print("-" * 60)
 
+    from bleak import BleakScanner
     devices = await BleakScanner.discover(timeout=timeout, return_adv=True)
 
     for device, adv_data in devices.items():
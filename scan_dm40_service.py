@@ -3,13 +3,14 @@
 通过 DM40 的服务 UUID 查找设备
 """
 import asyncio
-from bleak import BleakClient, BleakScanner
 
 # DM40 的服务 UUID
 DM40_SERVICE_UUID = "0000fff0-0000-1000-8000-00805f9b34fb"
 
 async def scan_for_dm40_service():
     """扫描并查找具有 DM40 服务的设备"""
+    from bleak import BleakClient, BleakScanner
+
     print("🔍 正在扫描具有 DM40 服务的蓝牙设备...")
     print("=" * 60)
 
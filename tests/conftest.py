@@ -0,0 +1,38 @@
+"""测试从仓库根目录导入各模块，并提供经 LoopbackTransport 连接 MeterSimulator 的模拟万用表"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dm40_transport import LoopbackTransport, MeterSimulator  # noqa: E402
+from dm40ble import Com_DM40A  # noqa: E402
+
+
+class SimulatedSignal:
+    """模拟万用表的输入信号，测试中直接修改 value（None 表示超量程），reads 为读数命令次数"""
+
+    def __init__(self, value=1000.0):
+        self.value = value
+        self.reads = 0
+
+    def __call__(self, mode_byte, t):
+        self.reads += 1
+        return self.value
+
+
+@pytest.fixture
+def signal():
+    return SimulatedSignal()
+
+
+@pytest.fixture
+def simulator(signal):
+    return MeterSimulator(signal)
+
+
+@pytest.fixture
+def meter(simulator):
+    """未连接的 Com_DM40A，传输层为接到 simulator 的 LoopbackTransport"""
+    return Com_DM40A(transport=LoopbackTransport(simulator))
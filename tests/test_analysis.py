@@ -0,0 +1,65 @@
+"""
+离线分析测试
+"""
+import math
+
+import numpy as np
+
+from dm40_analysis import Session, resample
+from dm40_recorder import CSV_HEADER
+
+
+def _write(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(CSV_HEADER) + '\r\n')
+        for row in rows:
+            f.write(row + '\r\n')
+    return str(path)
+
+
+def test_resample_end_excludes_later_samples():
+    t = np.arange(10.0)
+    grid, mean = resample(t, t, 1.0, 'mean', end=3)
+    assert grid.tolist() == [0, 1, 2, 3]
+    assert mean.tolist() == [0, 1, 2, 3]
+    assert resample(t, t, 1.0, 'max', end=3)[1].tolist() == [0, 1, 2, 3]
+    assert resample(t, t, 1.0, 'min', start=2, end=3)[1].tolist() == [2, 3]
+
+
+def test_load_keeps_empty_text_columns(tmp_path):
+    path = _write(tmp_path / 'a.csv', [
+        '1.000000,m1,1.5,mV,DC Voltage,0.0015,V,0',
+        '2.000000,m1,,,DC Voltage,,,1',
+        '3.000000,,2.5,Ω,Resistance,2.5,Ω,0',
+    ])
+    s = Session.load(path)
+    assert s.t.tolist() == [1.0, 2.0, 3.0]
+    assert s.value[0] == 1.5 and math.isnan(s.value[1]) and s.value[2] == 2.5
+    assert math.isnan(s.si_value[1]) and s.si_value[0] == 0.0015
+    assert s.overload.tolist() == [False, True, False]
+    assert [s.devices[c] for c in s.device] == ['m1', 'm1', '']
+    assert [s.units[c] for c in s.unit] == ['mV', '', 'Ω']
+    assert [s.modes[c] for c in s.mode] == ['DC Voltage', 'DC Voltage', 'Resistance']
+    assert 'nan' not in s.units + s.devices
+
+
+def test_load_merges_files_by_time(tmp_path):
+    a = _write(tmp_path / 'a.csv', ['1.0,m1,1,mV,DC Voltage,0.001,V,0', '3.0,m1,3,mV,DC Voltage,0.003,V,0'])
+    b = _write(tmp_path / 'b.csv', ['2.0,m2,2,mA,DC Current,0.002,A,0'])
+    empty = _write(tmp_path / 'c.csv', [])
+    s = Session.load(a, empty, b)
+    assert s.t.tolist() == [1.0, 2.0, 3.0]
+    assert [s.devices[c] for c in s.device] == ['m1', 'm2', 'm1']
+    assert s.select(device='m2').value.tolist() == [2.0]
+    assert len(Session.load(empty)) == 0
+
+
+def test_category_codes_follow_first_appearance(tmp_path):
+    path = _write(tmp_path / 'a.csv', [
+        '1.0,zeta,1,mV,DC Voltage,0.001,V,0',
+        '2.0,alpha,2,mA,DC Current,0.002,A,0',
+        '3.0,zeta,3,mV,DC Voltage,0.003,V,0',
+    ])
+    s = Session.load(path)
+    assert s.devices == ['zeta', 'alpha'] and s.device.tolist() == [0, 1, 0]
+    assert s.modes == ['DC Voltage', 'DC Current']
@@ -0,0 +1,98 @@
+"""
+触发捕获测试: 预触发/触发后窗口、边沿触发、holdoff、单次捕获、手动触发与快照保存
+"""
+import json
+import time
+
+import pytest
+
+from dm40_capture import SnapshotWriter, TriggeredCapture
+from dm40_protocol import decode_measurement, encode_measurement_frame
+from dm40ble import Reading
+
+OVERLOAD = decode_measurement(encode_measurement_frame(0x37, None))
+
+
+def _feed(capture, values, start=0, mode='DC Current', unit='mA'):
+    """每 0.1 秒一个读数，第 i 个读数的时间戳为 (start + i) / 10"""
+    for i, value in enumerate(values, start):
+        capture(Reading(value, unit, mode, i / 10, OVERLOAD if value is None else None))
+
+
+def test_snapshot_holds_pre_and_post_window():
+    capture = TriggeredCapture('m1', op='>', threshold=5, pre=1, post=1)
+    snapshots = []
+    capture.add_listener(snapshots.append)
+    _feed(capture, [0] * 50 + [10] * 5 + [0] * 30)
+    snapshot, = snapshots
+    times = [s[0] for s in snapshot.samples]
+    assert snapshot.trigger_time == 5.0 and snapshot.reason == '> 5.0'
+    assert times[0] == 4.0 and times[-1] == 6.0 and len(times) == 21
+    summary = snapshot.summary()
+    assert (summary['count'], summary['min'], summary['max'], summary['unit']) == (21, 0, 10, 'mA')
+    assert capture.status()['state'] == 'armed' and capture.status()['buffered'] <= 11
+
+
+def test_level_triggers_on_edge_and_respects_holdoff():
+    capture = TriggeredCapture('m1', op='>', threshold=5, pre=0.2, post=0.2, holdoff=4.0)
+    # 持续超过阈值只触发一次；t=3.0 的第二次越限在 holdoff 内被忽略，t=5.0 的第三次触发
+    _feed(capture, [10] * 10 + [0] * 20 + [10] + [0] * 19 + [10] + [0] * 10)
+    assert [s.trigger_time for s in capture.snapshots] == [0.0, 5.0]
+    assert capture.triggers == 2
+
+
+def test_step_trigger_with_mode_filter():
+    capture = TriggeredCapture('m1', op='step', threshold=50, mode='Continuity', pre=0.1, post=0)
+    _feed(capture, [0, 100, 0], mode='Resistance', unit='Ω')
+    _feed(capture, [0, 10, 70, 75], start=3, mode='Continuity', unit='Ω')
+    snapshot, = capture.snapshots
+    assert snapshot.reason == 'step 10 -> 70' and snapshot.trigger_time == 0.5
+    assert [s[1] for s in snapshot.samples] == [10, 70]
+
+
+def test_overload_trigger():
+    capture = TriggeredCapture('m1', op='overload', pre=0.1, post=0.2)
+    _feed(capture, [0.5, 0.5, None, None, 0.5, 0.5], mode='Continuity', unit='Ω')
+    snapshot, = capture.snapshots
+    assert snapshot.trigger_time == 0.2
+    assert [s[1] for s in snapshot.samples] == [0.5, None, None, 0.5]
+
+
+def test_manual_trigger_single_and_rearm():
+    capture = TriggeredCapture('m1', op='>', threshold=5, pre=0.1, post=0.1, single=True, max_snapshots=2)
+    capture.trigger('按钮')
+    _feed(capture, [0, 0, 0])
+    assert capture.status()['state'] == 'stopped'
+    assert [s.reason for s in capture.snapshots] == ['按钮']
+    _feed(capture, [10, 0], start=3)
+    assert len(capture.snapshots) == 1
+    capture.arm()
+    _feed(capture, [10, 0, 0, 10, 0, 0], start=5)
+    assert len(capture.snapshots) == 2      # 单次捕获: 重新布防后只再捕获一次
+    first = capture.snapshots[0]
+    assert capture.get_snapshot(first.id) is first and capture.get_snapshot(-1) is None
+
+
+def test_invalid_specs():
+    with pytest.raises(ValueError, match='未知比较运算符'):
+        TriggeredCapture.from_dict({'op': '=='})
+    with pytest.raises(ValueError, match='pre/post'):
+        TriggeredCapture.from_dict({'op': 'step', 'pre': -1})
+    with pytest.raises(TypeError):
+        TriggeredCapture.from_dict({'op': 'step', 'when': 'now'})
+
+
+def test_snapshot_writer_saves_json(tmp_path):
+    capture = TriggeredCapture('m1', op='>', threshold=5, pre=0.1, post=0)
+    writer = SnapshotWriter(str(tmp_path / 'captures'))
+    capture.add_listener(writer)
+    _feed(capture, [0, 10])
+    deadline = time.monotonic() + 5
+    saved = None
+    while saved is None and time.monotonic() < deadline:
+        try:
+            path, = (tmp_path / 'captures').glob('capture_m1_*.json')
+            saved = json.loads(path.read_text(encoding='utf-8'))
+        except ValueError:      # 目录或文件尚未写完
+            time.sleep(0.01)
+    assert saved['samples'] == [[0.0, 0, 'mA', 'DC Current'], [0.1, 10, 'mA', 'DC Current']]
@@ -0,0 +1,80 @@
+"""
+实时曲线测试: 用 node 执行 templates/index.html 中的曲线脚本（DOM 与 requestAnimationFrame 用桩代替）
+"""
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'index.html')
+
+pytestmark = pytest.mark.skipif(shutil.which('node') is None, reason='需要 node')
+
+_STUBS = """
+const location = { search: '' };
+const window = { devicePixelRatio: 1 };
+const frames = [];
+const displayed = [];
+function requestAnimationFrame(callback) { frames.push(callback); }
+function updateDisplay(data) { displayed.push(data); }
+const document = { getElementById: () => ({ clientWidth: 0, clientHeight: 0, width: 0, height: 0,
+                                           getContext: () => ({ clearRect() {} }) }) };
+let lastStream = null;
+let lastSeq = null;
+function runFrames() { const pending = frames.splice(0); pending.forEach((f) => f()); }
+"""
+
+
+def _chart_script():
+    with open(TEMPLATE, encoding='utf-8') as f:
+        html = f.read()
+    start = html.index('// ==================== 实时曲线')
+    end = html.index('// ==================== 数值显示')
+    return html[start:end]
+
+
+def _run(scenario):
+    """执行曲线脚本和场景，场景最后一个表达式的值以 JSON 返回"""
+    script = _STUBS + _chart_script() + f'\nconsole.log(JSON.stringify((() => {{ {scenario} }})()));\n'
+    output = subprocess.run(['node', '-e', script], capture_output=True, text=True, timeout=30, check=True).stdout
+    return json.loads(output)
+
+
+def test_burst_of_samples_renders_once_per_frame():
+    result = _run("""
+        for (let i = 1; i <= 1000; i++) {
+            pushSample({ stream: 's', seq: i, value: i, mode: 'DC Voltage', timestamp: i / 1000 });
+        }
+        const scheduled = frames.length;
+        runFrames();
+        return { scheduled, displayed: displayed.map((d) => d.value), count: chartCount, pending: frames.length };
+    """)
+    assert result == {'scheduled': 1, 'displayed': [1000], 'count': 1000, 'pending': 0}
+
+
+def test_replayed_sequence_numbers_are_dropped():
+    result = _run("""
+        for (const seq of [1, 2, 3, 2, 3, 4]) {
+            pushSample({ stream: 's', seq, value: seq, mode: 'DC Voltage', timestamp: seq });
+        }
+        pushSample({ stream: 'restarted', seq: 1, value: 9, mode: 'DC Voltage', timestamp: 5 });
+        return { count: chartCount, lastSeq, lastStream };
+    """)
+    assert result == {'count': 5, 'lastSeq': 1, 'lastStream': 'restarted'}
+
+
+def test_mode_change_clears_chart_and_ring_wraps():
+    result = _run("""
+        pushSample({ value: 1, mode: 'DC Voltage', timestamp: 1 });
+        pushSample({ value: 2, mode: 'DC Current', timestamp: 2 });
+        const afterSwitch = chartCount;
+        for (let i = 0; i < CHART_CAPACITY + 10; i++) {
+            pushSample({ value: i, mode: 'DC Current', timestamp: 3 + i });
+        }
+        return { afterSwitch, count: chartCount, head: chartHead, capacity: CHART_CAPACITY };
+    """)
+    assert result['afterSwitch'] == 1
+    assert result['count'] == result['capacity']
+    assert result['head'] == 11
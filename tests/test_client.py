@@ -0,0 +1,74 @@
+"""
+同步接口测试: DM40Client 与 Com_DM40A.run()/call()/stop() 在进程共享的事件循环线程中执行
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from dm40_transport import LoopbackTransport
+from dm40ble import Com_DM40A, DM40Client, run_sync, shared_loop
+
+
+def test_client_blocks_until_done(simulator, signal):
+    signal.value = 42.0
+    with DM40Client(transport=LoopbackTransport(simulator)) as client:
+        assert client.set_mode('dc_current')
+        m = client.get_measurement()
+        assert (m.value, m.mode) == (42.0, 'DC Current')
+        assert client.get_data() == (42.0, 'mA', 'DC Current')
+        with pytest.raises(ValueError, match='未知模式'):
+            client.set_mode('ohms')
+    assert not client.device.transport.is_connected
+
+
+def test_clients_share_one_loop_thread(simulator):
+    clients = [DM40Client(transport=LoopbackTransport(simulator)) for _ in range(2)]
+    for client in clients:
+        assert client.start(10)
+    loops = {client.device._loop for client in clients}
+    assert loops == {shared_loop()}
+    assert len([t for t in threading.enumerate() if t.name == 'dm40-loop']) == 1
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline and not all(c.get_current_data()[0] is not None for c in clients):
+        time.sleep(0.01)
+    assert all(c.get_current_data()[0] == 1000.0 for c in clients)
+    for client in clients:
+        client.stop()
+        assert client.get_state() == 0
+
+
+def test_device_run_call_and_stop_from_sync_code(meter):
+    meter.run(10)
+    assert meter.call('set_ac_voltage_mode') is True
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline and meter.get_current_data()[2] != 'AC Voltage':
+        time.sleep(0.01)
+    assert meter.get_current_data()[2] == 'AC Voltage'
+    assert meter.call('get_state') == 1
+    meter.stop()
+    assert meter.get_state() == 0 and not meter.transport.is_connected
+
+
+def test_run_sync_times_out_and_cancels():
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        run_sync(slow(), timeout=0.05)
+    assert cancelled.wait(1)
+
+
+def test_run_sync_refuses_to_block_its_own_loop():
+    async def nested():
+        return run_sync(asyncio.sleep(0), loop=asyncio.get_running_loop())
+
+    with pytest.raises(RuntimeError, match='不能在事件循环线程中同步等待'):
+        asyncio.run(nested())
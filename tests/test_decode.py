@@ -0,0 +1,68 @@
+"""
+测量帧解码测试: 小数位、符号、量程码、基本单位换算、超量程与 HOLD 标志
+"""
+import asyncio
+
+import pytest
+
+from dm40_protocol import (MODE_TABLE, STATUS_OVERLOAD, decode_measurement, encode_measurement_frame,
+                           format_measurement)
+
+
+@pytest.mark.parametrize('mode_byte', sorted(MODE_TABLE))
+def test_every_mode_decodes_with_si_value(mode_byte):
+    m = decode_measurement(encode_measurement_frame(mode_byte, 12.5))
+    unit, mode = MODE_TABLE[mode_byte]
+    assert (m.unit, m.mode, m.mode_byte, m.value) == (unit, mode, mode_byte, 12.5)
+    assert m.si_value is not None and not m.overload
+
+
+@pytest.mark.parametrize('decimals, value, text', [(0, 123.0, '123 mV'), (1, 12.3, '12.3 mV'), (2, 1.23, '1.23 mV')])
+def test_decimal_point_codes(decimals, value, text):
+    m = decode_measurement(encode_measurement_frame(0x30, value, decimals))
+    assert m.value == value and m.decimals == decimals
+    assert format_measurement(m) == text
+
+
+def test_si_normalisation_and_resolution():
+    m = decode_measurement(encode_measurement_frame(0x39, -250.5, 1, range_code=3))
+    assert m.value == -250.5 and m.negative
+    assert m.si_value == pytest.approx(-0.2505) and m.base_unit == 'A'
+    assert m.resolution == pytest.approx(1e-4)
+    assert m.range_code == 3
+    nf = decode_measurement(encode_measurement_frame(0x33, 470.0, 0))
+    assert nf.si_value == pytest.approx(470e-9) and nf.base_unit == 'F'
+
+
+def test_overload_and_hold():
+    m = decode_measurement(encode_measurement_frame(0x37, None))
+    assert m.overload and m.value is None and m.si_value is None and m.raw == 0xFFFF
+    assert format_measurement(m) == 'OL Ω'
+    assert decode_measurement(encode_measurement_frame(0x30, 1.0, hold=True)).hold
+
+
+def test_status_overload_bit_is_opt_in():
+    frame = bytearray(encode_measurement_frame(0x30, 1.0))
+    frame[-7] |= STATUS_OVERLOAD
+    assert not decode_measurement(bytes(frame)).overload
+    assert decode_measurement(bytes(frame)).status & STATUS_OVERLOAD
+    assert decode_measurement(bytes(frame), status_overload=True).overload
+
+
+def test_unknown_mode_and_short_frames():
+    m = decode_measurement(encode_measurement_frame(0x7f, 1.0))
+    assert (m.mode, m.unit, m.base_unit) == ('Unknown', '0x7f', '0x7f')
+    assert decode_measurement(b'\xaf\x05\x03') is None and decode_measurement(None) is None
+
+
+def test_meter_returns_decoded_measurement(meter, simulator, signal):
+    signal.value = -3.5
+    simulator.mode_byte = 0x39
+
+    async def scenario():
+        await meter.connect()
+        return await meter.get_measurement(), await meter.get_data()
+
+    m, data = asyncio.run(scenario())
+    assert m.si_value == pytest.approx(-3.5e-3) and m.base_unit == 'A'
+    assert data == (-3.5, 'mA', 'DC Current')
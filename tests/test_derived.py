@@ -0,0 +1,96 @@
+"""
+派生通道测试: 功率按时间戳插值配对、超量程与间隙、能量/电荷量梯形积分
+"""
+import pytest
+
+from dm40_derived import DerivedChannel, charge, energy, power
+from dm40ble import ReadingPublisher
+
+
+def _outputs(channel):
+    outputs = []
+    channel.add_listener(lambda r: outputs.append((r.timestamp, r.value, r.unit, r.mode)))
+    return outputs
+
+
+def test_power_interpolates_current_at_voltage_sample_times():
+    v, i = ReadingPublisher(), ReadingPublisher()
+    p = power(v, i)
+    outputs = _outputs(p)
+    v._publish(1000.0, 'mV', 'DC Voltage', timestamp=1.0)
+    assert outputs == []        # 等待电流表在 t=1.0 之后的读数
+    i._publish(100.0, 'mA', 'DC Current', timestamp=0.5)
+    i._publish(200.0, 'mA', 'DC Current', timestamp=1.5)
+    (t, watts, unit, mode), = outputs
+    assert t == 1.0 and watts == pytest.approx(0.15) and (unit, mode) == ('W', 'Power')
+
+    v._publish(2000.0, 'mV', 'DC Voltage', timestamp=1.5)
+    i._publish(300.0, 'mA', 'DC Current', timestamp=2.5)
+    assert len(outputs) == 2 and outputs[-1][1] == pytest.approx(0.4)
+    assert p.description == 'Power(ReadingPublisher, ReadingPublisher)'
+
+
+def test_overload_and_gaps_publish_no_value():
+    v, i = ReadingPublisher(), ReadingPublisher()
+    outputs = _outputs(power(v, i, max_gap=1.0))
+    i._publish(100.0, 'mA', 'DC Current', timestamp=0.0)
+    v._publish(None, 'mV', 'DC Voltage', timestamp=0.2)         # 电压表超量程
+    i._publish(100.0, 'mA', 'DC Current', timestamp=0.4)
+    assert outputs[-1][:2] == (0.2, None)
+
+    i._publish(100.0, 'mA', 'DC Current', timestamp=5.0)         # 相邻电流读数间隔超过 max_gap
+    v._publish(1000.0, 'mV', 'DC Voltage', timestamp=2.0)
+    assert outputs[-1][:2] == (2.0, None)
+
+
+def test_stalled_input_falls_back_to_last_reading():
+    v, i = ReadingPublisher(), ReadingPublisher()
+    outputs = _outputs(power(v, i, max_gap=1.0))
+    i._publish(500.0, 'mA', 'DC Current', timestamp=0.0)
+    v._publish(1000.0, 'mV', 'DC Voltage', timestamp=0.5)
+    assert outputs == []
+    v._publish(1000.0, 'mV', 'DC Voltage', timestamp=1.6)       # t=0.5 已等待超过 max_gap: 零阶保持
+    assert [(t, value) for t, value, _, _ in outputs] == [(0.5, pytest.approx(0.5))]
+
+
+def test_custom_channel_and_stop_detaches():
+    a, b = ReadingPublisher(), ReadingPublisher()
+    ratio = DerivedChannel([a, b], lambda x, y: x / y, '', 'Ratio')
+    outputs = _outputs(ratio)
+    b._publish(0.0, 'V', 'DC Voltage', timestamp=0.0)
+    a._publish(1.0, 'V', 'DC Voltage', timestamp=0.0)
+    b._publish(0.0, 'V', 'DC Voltage', timestamp=0.5)
+    assert outputs[-1][1] is None       # 除零
+    assert ratio.get_state() == 1
+    ratio.stop()
+    assert ratio.get_state() == 0 and a._listeners == [] and b._listeners == []
+    with pytest.raises(ValueError):
+        DerivedChannel([], lambda: 0, '', '')
+
+
+def test_energy_integrates_trapezoids():
+    p = ReadingPublisher()
+    e = energy(p, max_gap=3600)
+    for t, watts in [(0, 1.0), (1800, 1.0)]:
+        p._publish(watts, 'W', 'Power', timestamp=float(t))
+    assert e.total == pytest.approx(0.5)    # 1 W × 0.5 h
+    p._publish(3.0, 'W', 'Power', timestamp=1802.0)
+    assert e.total == pytest.approx(0.5 + (1.0 + 3.0) / 2 * 2 / 3600)
+    assert e.get_current_data() == (e.total, 'Wh', 'Energy')
+
+
+def test_charge_skips_gaps_and_overload_and_resets():
+    i = ReadingPublisher()
+    q = charge(i, max_gap=5.0)
+    i._publish(1000.0, 'mA', 'DC Current', timestamp=0.0)
+    i._publish(1000.0, 'mA', 'DC Current', timestamp=3.6)
+    assert q.total == pytest.approx(1.0)    # 1 A × 3.6 s = 1 mAh
+    i._publish(1000.0, 'mA', 'DC Current', timestamp=13.6)     # 间隙 10 s > max_gap
+    i._publish(None, 'mA', 'DC Current', timestamp=14.6)
+    i._publish(1000.0, 'mA', 'DC Current', timestamp=15.6)
+    i._publish(1000.0, 'mA', 'DC Current', timestamp=15.6)     # 时间戳未前进
+    assert q.total == pytest.approx(1.0) and q.skipped == pytest.approx(12.0)
+    q.reset()
+    assert (q.total, q.skipped) == (0.0, 0.0)
+    i._publish(1000.0, 'mA', 'DC Current', timestamp=16.6)
+    assert q.total == 0.0       # 清零后第一个读数只作为起点
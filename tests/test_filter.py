@@ -0,0 +1,65 @@
+"""
+变化检测/死区过滤测试: 死区、模式变化、心跳、超量程，以及每个监听器独立过滤、记录器接收全部读数
+"""
+import csv
+
+from dm40_filter import ChangeFilter
+from dm40_protocol import decode_measurement, encode_measurement_frame
+from dm40_recorder import CSV_HEADER, CsvRecorder
+from dm40ble import Reading, ReadingPublisher
+
+
+def _passed(filter, readings):
+    return [r.value for r in readings if filter.accept(r)]
+
+
+def _readings(values, mode='DC Voltage', unit='mV', step=0.1):
+    return [Reading(value, unit, mode, i * step) for i, value in enumerate(values)]
+
+
+def test_deadband_compares_with_last_passed_value():
+    f = ChangeFilter(deadband=0.5)
+    # 1.3 与 1.0 相差 0.3 被丢弃，1.6 与上次放行的 1.0 相差 0.6 放行
+    assert _passed(f, _readings([1.0, 1.3, 1.6, 1.6, 1.0])) == [1.0, 1.6, 1.0]
+    assert (f.passed, f.suppressed) == (3, 2)
+
+
+def test_exact_repeats_are_dropped_by_default_and_mode_change_passes():
+    f = ChangeFilter()
+    readings = _readings([5.0, 5.0, 5.0]) + [Reading(5.0, 'mA', 'DC Current', 1.0)]
+    assert _passed(f, readings) == [5.0, 5.0]
+    assert _passed(ChangeFilter(change_only=False), _readings([5.0] * 3)) == [5.0] * 3
+
+
+def test_heartbeat_passes_steady_and_overload_readings():
+    f = ChangeFilter(heartbeat=1.0)
+    assert [r.timestamp for r in _readings([2.0] * 25) if f.accept(r)] == [0.0, 1.0, 2.0]
+    f = ChangeFilter(heartbeat=1.0)
+    assert [r.timestamp for r in _readings([None] * 25) if f.accept(r)] == [0.0, 1.0, 2.0]
+
+
+def test_overload_transitions_pass():
+    f = ChangeFilter(deadband=100)
+    assert _passed(f, _readings([1.0, None, None, 1.0])) == [1.0, None, 1.0]
+
+
+def test_listeners_filter_independently(tmp_path):
+    publisher = ReadingPublisher()
+    filtered, unfiltered = [], []
+    publisher.add_listener(filtered.append, filter=ChangeFilter(deadband=0.5))
+    publisher.add_listener(unfiltered.append)
+    recorder = CsvRecorder(str(tmp_path / 'r.csv'), 'm1')
+    publisher.add_listener(recorder)
+    overload = decode_measurement(encode_measurement_frame(0x30, None))
+    for value in (1.0, 1.1, 1.2, 2.0):
+        publisher._publish(value, 'mV', 'DC Voltage')
+    publisher._publish(None, 'mV', 'DC Voltage', overload)
+    recorder.close()
+
+    assert [r.value for r in filtered] == [1.0, 2.0, None]
+    assert len(unfiltered) == 5
+    with open(tmp_path / 'r.csv', newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == CSV_HEADER and len(rows) == 6
+    assert rows[1][2:7] == ['1.0', 'mV', 'DC Voltage', '0.001', 'V']
+    assert rows[5][2] == '' and rows[5][7] == '1'
@@ -0,0 +1,88 @@
+"""网关与汇聚服务: 网关重启后的数据流不被当作重复块丢弃"""
+import asyncio
+import zlib
+
+import dm40_wire
+from dm40_gateway import Collector, Gateway
+from dm40_transport import LoopbackTransport, MeterSimulator
+from dm40ble import Com_DM40A
+
+
+async def _run_gateway(port: int, seconds: float) -> Gateway:
+    gateway = Gateway('bench1', '127.0.0.1', port, batch_interval=0.05)
+    gateway.add_device('m1', Com_DM40A(transport=LoopbackTransport(MeterSimulator(lambda mode, t: 1.0))))
+    task = asyncio.create_task(gateway.run(loop_ms=10))
+    await asyncio.sleep(seconds)
+    gateway.stop()
+    await task
+    return gateway
+
+
+def test_gateway_restart_starts_new_session():
+    async def scenario():
+        collector = Collector()
+        server = await asyncio.start_server(collector._handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        first = await _run_gateway(port, 0.5)
+        await asyncio.sleep(0.1)
+        after_first = collector.streams['bench1/m1']['samples']
+        second = await _run_gateway(port, 0.5)
+        await asyncio.sleep(0.1)
+        server.close()
+        return collector.streams['bench1/m1'], after_first, first, second
+
+    stream, after_first, first, second = asyncio.run(scenario())
+    assert first.session != second.session
+    assert after_first > 0
+    assert stream['samples'] > after_first
+    assert stream['duplicates'] == 0
+    assert stream['restarts'] == 1
+
+
+def test_collector_resets_sequence_on_new_session():
+    collector = Collector()
+    body = zlib.compress(dm40_wire.encode([(1.0, 2.0, 'mV', 'DC Voltage')], precise=True))
+    for session, seq in (('a', 1), ('a', 2), ('a', 2), ('b', 1), ('b', 2)):
+        collector.handle_block({'gateway': 'g', 'session': session, 'device': 'd', 'seq': seq}, body)
+    stream = collector.streams['g/d']
+    assert stream['samples'] == 4
+    assert stream['duplicates'] == 1
+    assert stream['gaps'] == 0
+    assert stream['last_seq'] == 2 and stream['session'] == 'b'
+
+
+class _StalledWriter:
+    """drain() 一直等待直到 release 被设置，模拟跟不上的汇聚服务"""
+
+    def __init__(self):
+        self.frames = []
+        self.release = asyncio.Event()
+
+    def write(self, frame):
+        self.frames.append(frame)
+
+    async def drain(self):
+        await self.release.wait()
+
+
+def test_send_loop_waits_for_drain_and_bounds_backlog():
+    async def scenario():
+        gateway = Gateway('bench1', '127.0.0.1', 0, retain_blocks=5)
+        gateway.add_device('m1', Com_DM40A(transport=LoopbackTransport()))
+        writer = _StalledWriter()
+        sent = {}
+        task = asyncio.create_task(gateway._send_loop(writer, sent))
+        for i in range(20):
+            gateway._pending['m1'].append((float(i), 1.0, 'mV', 'DC Voltage'))
+            gateway._flush_device('m1')
+            await asyncio.sleep(0)
+        stalled = len(writer.frames)
+        writer.release.set()
+        await asyncio.sleep(0.05)
+        task.cancel()
+        return stalled, writer.frames, sent
+
+    stalled, frames, sent = asyncio.run(scenario())
+    assert stalled == 1                 # drain 未完成时不再写入
+    assert len(frames) == 1 + 5         # 其余只保留最近 retain_blocks 个块
+    assert sent == {'m1': 20}
@@ -0,0 +1,26 @@
+"""
+导入测试: 每个模块在全新的解释器中导入，不得加载 bench_import.DEFAULT_MODULES 中列出的重量级依赖
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bench_import
+
+
+@pytest.mark.parametrize('module', sorted(bench_import.DEFAULT_MODULES))
+def test_module_does_not_load_heavy_dependencies(module):
+    times, loaded = bench_import.measure(module, repeat=1)
+    assert len(times) == 1
+    assert not loaded & set(bench_import.DEFAULT_MODULES[module])
+
+
+def test_ble_transport_imports_bleak_only_on_connect():
+    probe = ("import sys, dm40ble, dm40_transport; "
+             "dm40_transport.transport_from_url('ble://AA:BB'); "
+             "print('bleak' in sys.modules)")
+    output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(bench_import.__file__))).stdout
+    assert output.strip() == 'False'
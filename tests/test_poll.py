@@ -0,0 +1,90 @@
+"""
+自适应轮询测试: RTT 下限、平稳降速、突变加速、无订阅者降速，以及采集循环按控制器调整间隔
+"""
+import asyncio
+
+import pytest
+
+from dm40_poll import AdaptivePoller
+
+
+def _flat(poller, count, value=1.0):
+    for _ in range(count):
+        poller.observe(value)
+
+
+def test_rtt_sets_the_floor():
+    poller = AdaptivePoller(base_interval=0.01, min_interval=0.005, rtt_factor=2.0)
+    assert poller.floor == 0.005
+    poller.record_rtt(0.1)
+    assert poller.floor == pytest.approx(0.2) and poller.next_interval() == pytest.approx(0.2)
+    poller.record_rtt(0.02)
+    assert poller.rtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.02)
+
+
+def test_flat_signal_doubles_interval_up_to_max():
+    poller = AdaptivePoller(base_interval=0.1, max_interval=0.5, flat_count=5)
+    _flat(poller, 5)        # 第一个读数只作为参照
+    assert poller.next_interval() == 0.1
+    _flat(poller, 1)
+    assert poller.next_interval() == 0.2
+    _flat(poller, 5)
+    assert poller.next_interval() == 0.4
+    _flat(poller, 50)
+    assert poller.next_interval() == 0.5
+    poller.observe(1.001)   # 小变化结束平稳计数但不加速
+    assert poller.next_interval() == 0.1
+
+
+def test_transient_boosts_to_floor():
+    poller = AdaptivePoller(base_interval=1.0, min_interval=0.05, transient_ratio=0.05, boost_duration=60)
+    poller.observe(100.0)
+    poller.observe(104.0)
+    assert poller.next_interval() == 1.0
+    poller.observe(120.0)
+    assert poller.next_interval() == 0.05
+    poller.boost(0)     # 更短的加速不会缩短已有的加速
+    assert poller.next_interval() == 0.05
+
+
+def test_no_subscribers_uses_idle_interval():
+    poller = AdaptivePoller(base_interval=0.1, idle_interval=3.0)
+    assert poller.next_interval() == 0.1    # 订阅者数量未知时不降速
+    poller.set_subscribers(0)
+    assert poller.next_interval() == 3.0
+    poller.boost(60)
+    assert poller.next_interval() == poller.floor
+    assert AdaptivePoller(max_interval=2.0).idle_interval == 2.0
+
+
+def test_run_loop_follows_subscriber_count(meter, signal):
+    """开始前设置的订阅者数量生效；有订阅者后立即唤醒采集循环"""
+    async def scenario():
+        meter.set_subscriber_count(0)
+        await meter.start(loop_ms=10, adaptive=True, idle_interval=5.0, min_interval=0.005, flat_count=1000)
+        await asyncio.sleep(0.3)
+        idle_reads = signal.reads
+        meter.set_subscriber_count(1)
+        await asyncio.sleep(0.3)
+        active_reads = signal.reads - idle_reads
+        await meter.astop()
+        return idle_reads, active_reads
+
+    idle_reads, active_reads = asyncio.run(scenario())
+    assert idle_reads == 1
+    assert active_reads >= 10
+
+
+def test_boost_wakes_idle_loop(meter, signal):
+    async def scenario():
+        meter.set_subscriber_count(0)
+        await meter.start(loop_ms=10, adaptive=True, idle_interval=5.0, min_interval=0.005)
+        await asyncio.sleep(0.1)
+        before = signal.reads
+        meter.boost(0.2)
+        await asyncio.sleep(0.15)
+        boosted = signal.reads - before
+        await meter.astop()
+        return boosted
+
+    assert asyncio.run(scenario()) >= 5
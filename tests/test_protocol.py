@@ -0,0 +1,108 @@
+"""
+帧格式测试: 预生成的命令与原始实现中手写的帧逐字节一致，check_response 能识别损坏的应答
+"""
+import asyncio
+import time
+
+import pytest
+
+from dm40_protocol import MODE_BYTES, MODE_COMMANDS, READ_COMMAND, check_response, encode_measurement_frame
+from dm40_transport import LoopbackTransport, MeterSimulator
+from dm40ble import Com_DM40A
+
+# 原始 dm40ble.py 中手写并在真机上验证过的帧（其余模式的帧是推测的，校验和不满足和为 0 的规则）
+BASELINE_READ = bytes([0xaf, 0x05, 0x03, 0x09, 0x00, 0x40])
+BASELINE_MODES = {
+    'dc_voltage': bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x30, 0x12]),
+    'dc_current': bytes([0xaf, 0x05, 0x03, 0x06, 0x01, 0x39, 0x09]),
+}
+
+
+def test_read_command_matches_baseline():
+    assert READ_COMMAND == BASELINE_READ
+
+
+@pytest.mark.parametrize('name', sorted(BASELINE_MODES))
+def test_mode_command_matches_baseline(name):
+    assert MODE_COMMANDS[name] == BASELINE_MODES[name]
+
+
+@pytest.mark.parametrize('name', sorted(MODE_BYTES))
+def test_mode_command_layout(name):
+    cmd = MODE_COMMANDS[name]
+    assert cmd[:5] == bytes([0xaf, 0x05, 0x03, 0x06, 0x01])
+    assert cmd[5] == MODE_BYTES[name]
+    assert sum(cmd) & 0xFF == 0
+
+
+def test_check_response_accepts_valid_frames():
+    frame = encode_measurement_frame(0x30, 12.3)
+    assert check_response(READ_COMMAND, frame) is None
+    assert check_response(MODE_COMMANDS['dc_current'], MODE_COMMANDS['dc_current']) is None
+
+
+def test_check_response_rejects_corrupted_frames():
+    frame = encode_measurement_frame(0x30, 12.3)
+
+    bad_header = b'\x00' + frame[1:]
+    assert '帧头' in check_response(READ_COMMAND, bad_header)
+
+    assert '长度' in check_response(READ_COMMAND, frame[:-1])
+    assert '长度' in check_response(READ_COMMAND, frame + b'\x00')
+
+    assert '命令' in check_response(MODE_COMMANDS['dc_voltage'], frame)
+
+    flipped = bytearray(frame)
+    flipped[6] ^= 0x01
+    assert '校验和' in check_response(READ_COMMAND, bytes(flipped))
+
+
+def _corrupt_first(response_of):
+    """第一条应答的校验和字节被破坏"""
+    corrupt = {'count': 1}
+
+    def responder(cmd):
+        response = response_of(cmd)
+        if corrupt['count']:
+            corrupt['count'] -= 1
+            response = bytearray(response)
+            response[-1] ^= 0xFF
+            response = bytes(response)
+        return response
+    return responder
+
+
+def _send_read(responder, strict=False):
+    async def main():
+        meter = Com_DM40A(transport=LoopbackTransport(responder))
+        meter.strict_frames = strict
+        await meter.connect()
+        response = await meter.send_command(READ_COMMAND, timeout=0.5)
+        await meter.disconnect()
+        return meter, response
+
+    return asyncio.run(main())
+
+
+def test_corrupted_response_is_accepted_with_warning_by_default(capsys):
+    meter, response = _send_read(_corrupt_first(MeterSimulator(source=lambda mode_byte, t: 5.0)))
+    assert response is not None and check_response(READ_COMMAND, response) is not None
+    assert meter.bad_frames == 1 and meter.retries == 0
+    assert '警告: 应答帧无效: 校验和错误' in capsys.readouterr().out
+
+
+def test_corrupted_response_is_retried_when_strict(capsys):
+    meter, response = _send_read(_corrupt_first(MeterSimulator(source=lambda mode_byte, t: 5.0)), strict=True)
+    assert response is not None and check_response(READ_COMMAND, response) is None
+    assert meter.bad_frames == 1 and meter.retries == 1
+    assert '警告: 应答帧无效: 校验和错误' in capsys.readouterr().out
+
+
+def test_overstated_length_does_not_wait_for_timeout():
+    """长度字节大于实际长度时，分段间隔超时后按已收到的数据处理"""
+    frame = bytearray(encode_measurement_frame(0x30, 12.3))
+    frame[4] += 4
+    start = time.monotonic()
+    meter, response = _send_read(lambda cmd: bytes(frame))
+    assert time.monotonic() - start < 0.4
+    assert response == frame and meter.bad_frames == 1 and meter.timeouts == 0
@@ -0,0 +1,97 @@
+"""
+自适应命令超时测试: SRTT/RTTVAR/RTO 计算、指数退避、Karn 算法和按实测 RTT 快速重发
+"""
+import asyncio
+import time
+
+import pytest
+
+from dm40_protocol import MODE_COMMANDS, READ_COMMAND
+from dm40_rtt import COMMAND_CLASSES, RttEstimator, command_class
+from dm40_transport import LoopbackTransport
+from dm40ble import Com_DM40A
+
+
+def test_command_classes():
+    assert command_class(READ_COMMAND) == 'read'
+    assert command_class(MODE_COMMANDS['resistance']) == 'mode'
+    assert command_class(b'\xaf\x05\x03\x42\x00') == 'custom' and command_class(b'') == 'custom'
+
+
+def test_rto_follows_rfc6298():
+    estimator = RttEstimator(initial=1.0, min_rto=0.05, max_rto=2.0)
+    assert estimator.rto == 1.0
+    estimator.sample(0.1)
+    assert (estimator.srtt, estimator.rttvar) == (0.1, 0.05)
+    assert estimator.rto == pytest.approx(0.1 + 4 * 0.05)
+    estimator.sample(0.2)
+    assert estimator.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert estimator.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+
+    stable = RttEstimator(min_rto=0.05)
+    for _ in range(50):
+        stable.sample(0.001)
+    assert stable.rto == 0.05
+
+
+def test_backoff_doubles_until_next_sample():
+    estimator = RttEstimator(initial=0.5, max_rto=3.0)
+    estimator.backoff()
+    assert estimator.rto == 1.0
+    for _ in range(10):
+        estimator.backoff()
+    assert estimator.rto == 3.0
+    estimator.sample(0.1)
+    assert estimator.rto == pytest.approx(0.3)
+
+
+class _DropEvery:
+    """每 n 个读数命令丢弃一个，应答延迟 delay 秒"""
+
+    def __init__(self, simulator, n):
+        self.simulator = simulator
+        self.n = n
+        self.reads = 0
+
+    def __call__(self, cmd):
+        if cmd[3] == 0x09:
+            self.reads += 1
+            if self.reads % self.n == 0:
+                return None
+        return self.simulator(cmd)
+
+
+def test_measured_rtt_shortens_read_timeout_and_retries_fast(simulator):
+    responder = _DropEvery(simulator, 10)
+
+    async def scenario():
+        meter = Com_DM40A(transport=LoopbackTransport(responder, delay=0.01))
+        await meter.connect()
+        for _ in range(9):
+            assert await meter.get_measurement() is not None
+        rto = meter._command_timeout('read')
+        samples = meter.get_link_stats()['classes']['read']['samples']
+        start = time.monotonic()
+        m = await meter.get_measurement()       # 第 10 个读数命令被丢弃，重发
+        return meter, rto, samples, time.monotonic() - start, m
+
+    meter, rto, samples, elapsed, m = asyncio.run(scenario())
+    assert rto < COMMAND_CLASSES['read'].initial / 4
+    assert m is not None and elapsed < 0.5
+    assert meter.timeouts == 1 and meter.retries == 1
+    # Karn 算法: 重发后的应答不计入 RTT
+    assert meter.get_link_stats()['classes']['read']['samples'] == samples
+
+
+def test_mode_switch_keeps_initial_read_timeout(meter):
+    async def scenario():
+        await meter.connect()
+        for _ in range(5):
+            await meter.get_measurement()
+        before = meter._command_timeout('read')
+        await meter.set_resistance_mode()
+        return before, meter._command_timeout('read')
+
+    before, after = asyncio.run(scenario())
+    assert before < COMMAND_CLASSES['read'].initial
+    assert after == COMMAND_CLASSES['read'].initial
@@ -0,0 +1,129 @@
+"""
+报警规则引擎测试: 阈值、持续时间、迟滞、超量程规则、按设备/模式索引与动作分发
+"""
+import threading
+
+import pytest
+
+from dm40_rules import ActionDispatcher, Rule, RuleEngine
+from dm40ble import ReadingPublisher
+
+
+def _engine(*rules):
+    engine = RuleEngine()
+    events = []
+    engine.add_event_listener(lambda event: events.append((event['rule_id'], event['device_id'], event['state'])))
+    for rule in rules:
+        engine.add_rule(rule)
+    return engine, events
+
+
+def _feed(engine, values, device_id='m1', mode='DC Voltage', step=0.1):
+    for i, value in enumerate(values):
+        engine.evaluate(device_id, value, 'mV', mode, i * step, overload=value is None)
+
+
+def test_threshold_with_hysteresis():
+    engine, events = _engine(Rule('hi', '>', threshold=10, hysteresis=2))
+    _feed(engine, [5, 11, 12, 9, 11, 8, 11])
+    # 9 仍在迟滞区内，8 才恢复
+    assert events == [('hi', 'm1', 'triggered'), ('hi', 'm1', 'cleared'), ('hi', 'm1', 'triggered')]
+    assert engine.active_alarms() == [{'rule_id': 'hi', 'device_id': 'm1'}]
+
+
+def test_duration_requires_condition_to_persist():
+    engine, events = _engine(Rule('hi', '>', threshold=10, duration=0.25))
+    for t, value in [(0.0, 11), (0.1, 11), (0.2, 5), (0.3, 11), (0.5, 11)]:
+        engine.evaluate('m1', value, 'mV', 'DC Voltage', t)
+    assert events == []     # 两段都不足 0.25 秒
+    engine.evaluate('m1', 11, 'mV', 'DC Voltage', 0.55)
+    assert events == [('hi', 'm1', 'triggered')]
+
+
+def test_window_ops():
+    engine, events = _engine(Rule('out', 'outside', low=4.75, high=5.25, hysteresis=0.05),
+                             Rule('in', 'inside', low=0, high=1))
+    _feed(engine, [5.0, 5.3, 5.22, 5.1, 0.5])
+    assert events == [('out', 'm1', 'triggered'), ('out', 'm1', 'cleared'),
+                      ('out', 'm1', 'triggered'), ('in', 'm1', 'triggered')]
+
+
+def test_overload_rule_and_other_rules_ignore_overload():
+    engine, events = _engine(Rule('open', 'overload', mode='Continuity'), Rule('low', '<', threshold=1))
+    _feed(engine, [None, None, 0.5], mode='Continuity')
+    assert events == [('open', 'm1', 'triggered'), ('low', 'm1', 'triggered'), ('open', 'm1', 'cleared')]
+    # 无数据（非超量程）的读数不参与判定
+    engine.evaluate('m1', None, '', '', 1.0)
+    assert len(events) == 3
+
+
+def test_rules_are_scoped_by_device_and_mode():
+    engine, events = _engine(Rule('bench', '>', threshold=1, device='m2'), Rule('amps', '>', threshold=1, mode='DC Current'))
+    _feed(engine, [5], device_id='m1', mode='DC Voltage')
+    _feed(engine, [5], device_id='m2', mode='DC Voltage')
+    _feed(engine, [5], device_id='m1', mode='DC Current')
+    assert events == [('bench', 'm2', 'triggered'), ('amps', 'm1', 'triggered')]
+    assert engine.has_rules('m3')      # 不限设备的规则适用于所有设备
+    engine.remove_rule('amps')
+    assert engine.has_rules('m2') and not engine.has_rules('m3')
+
+
+def test_replacing_and_removing_rules_clears_state():
+    engine, events = _engine(Rule('hi', '>', threshold=10))
+    _feed(engine, [11])
+    engine.add_rule(Rule('hi', '>', threshold=20))
+    assert engine.active_alarms() == [] and len(engine.rules()) == 1
+    _feed(engine, [15, 21])
+    assert events == [('hi', 'm1', 'triggered'), ('hi', 'm1', 'triggered')]
+    assert engine.remove_rule('hi') and not engine.remove_rule('hi')
+    assert engine.active_alarms() == [] and not engine.has_rules('m1')
+
+
+def test_attach_evaluates_published_readings_and_detach_clears_alarms():
+    engine, events = _engine(Rule('hi', '>', threshold=10))
+    publisher = ReadingPublisher()
+    listener = engine.attach(publisher, 'm1')
+    publisher._publish(11.0, 'mV', 'DC Voltage')
+    assert events == [('hi', 'm1', 'triggered')]
+    engine.detach(publisher, 'm1', listener)
+    assert engine.active_alarms() == []
+    publisher._publish(5.0, 'mV', 'DC Voltage')
+    assert len(events) == 1
+
+
+def test_actions_are_validated():
+    engine = RuleEngine()
+    with pytest.raises(ValueError, match='未配置的 Webhook'):
+        engine.add_rule(Rule('hook', '>', actions=['webhook:ops']))
+    with pytest.raises(ValueError, match='未知报警动作'):
+        engine.add_rule(Rule('bad', '>', actions=['email']))
+    with pytest.raises(ValueError, match='http/https'):
+        engine.dispatcher.register_webhook('local', 'file:///etc/passwd')
+    engine.dispatcher.register_webhook('ops', 'https://example.invalid/hook')
+    engine.add_rule(Rule('hook', '>', actions=['webhook:ops']))
+    with pytest.raises(ValueError, match='未知比较运算符'):
+        Rule.from_dict({'id': 'x', 'op': '=='})
+
+
+def test_dispatcher_runs_actions_off_thread_and_drops_when_full():
+    dispatcher = ActionDispatcher(max_queue=1)
+    started, release = threading.Event(), threading.Event()
+    handled = []
+
+    def handler(event):
+        started.set()
+        release.wait(5)
+        handled.append((event['n'], threading.current_thread() is not threading.main_thread()))
+
+    dispatcher.register('slow', handler)
+    dispatcher.submit(['slow'], {'n': 1})
+    assert started.wait(5)
+    dispatcher.submit(['slow'], {'n': 2})   # 排队
+    dispatcher.submit(['slow'], {'n': 3})   # 队列已满，丢弃
+    assert dispatcher.dropped == 1
+    done = threading.Event()
+    dispatcher.register('done', lambda event: done.set())
+    release.set()
+    dispatcher._queue.put((['done'], {}))
+    assert done.wait(5)
+    assert handled == [(1, True), (2, True)]
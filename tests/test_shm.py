@@ -0,0 +1,91 @@
+"""
+共享内存环形缓冲区测试
+"""
+import os
+import time
+from multiprocessing import shared_memory
+
+import pytest
+
+from dm40_protocol import encode_measurement_frame, decode_measurement
+from dm40_shm import ShmReader, ShmRing
+from dm40ble import Reading
+
+
+def test_record_round_trip_keeps_mono():
+    m = decode_measurement(encode_measurement_frame(0x30, 12.3))
+    ring = ShmRing(capacity=8, create=True)
+    try:
+        ring(Reading(m.value, m.unit, m.mode, 1700000000.5, m, 1234.25, 0.004))
+        (record,), lost = ring.read_since(0)
+    finally:
+        ring.close()
+        ring.unlink()
+    assert lost == 0
+    assert record.timestamp == 1700000000.5
+    assert record.mono == 1234.25 and record.uncertainty == 0.004
+    assert record.value == m.value and record.measurement.mode_byte == 0x30
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing(f'dm40_test_{os.getpid()}', capacity=8, create=True, replace=True)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def _write(ring, values):
+    for value in values:
+        m = decode_measurement(encode_measurement_frame(0x30, value))
+        ring(Reading(m.value, m.unit, m.mode, time.time(), m))
+
+
+def test_readers_keep_independent_positions(ring):
+    _write(ring, [1.0, 2.0])
+    latest, oldest = ShmReader(ring.name), ShmReader(ring.name, start='oldest')
+    try:
+        assert latest.read() == [] and [r.value for r in oldest.read()] == [1.0, 2.0]
+        _write(ring, [None, 4.0])
+        assert latest.backlog == 2
+        records = latest.read(max_count=1)
+        assert records[0].value is None and records[0].measurement.overload
+        assert [r.value for r in latest.read()] == [4.0]
+        assert [r.seq for r in oldest.read()] == [3, 4]
+    finally:
+        latest.close()
+        oldest.close()
+
+
+def test_lapped_reader_skips_to_oldest_valid_record(ring):
+    reader = ShmReader(ring.name)
+    try:
+        _write(ring, [float(i) for i in range(20)])
+        records = reader.read()
+        assert [r.seq for r in records] == list(range(13, 21))
+        assert reader.lost == 12 and reader.laps == 1
+    finally:
+        reader.close()
+
+
+def test_reader_reopens_replaced_ring(ring):
+    reader = ShmReader(ring.name)
+    try:
+        assert not reader.reopen_if_replaced()
+        replacement = ShmRing(ring.name, capacity=8, create=True, replace=True)
+        _write(replacement, [7.0])
+        assert reader.reopen_if_replaced()
+        assert [r.value for r in reader.read()] == [7.0]
+        replacement.close()
+    finally:
+        reader.close()
+
+
+def test_foreign_shared_memory_is_rejected():
+    shm = shared_memory.SharedMemory(create=True, size=256)
+    try:
+        with pytest.raises(ValueError, match='不是 DM40'):
+            ShmRing(shm.name, track=False)
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,39 @@
+"""
+SQLite 读数存储测试
+"""
+import sqlite3
+import time
+
+from dm40_sqlite import PRUNE_SQL, SCHEMA, SqliteStore
+
+
+def _wait_written(store, n, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while store.written + store.dropped < n and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_prune_uses_device_index():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(SCHEMA)
+    plan = ' '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + PRUNE_SQL, ('m1', 0.0)))
+    assert 'readings_device_ts' in plan
+
+
+def test_prune_each_device_and_query(tmp_path):
+    now = time.time()
+    store = SqliteStore(str(tmp_path / 'r.db'), flush_interval=0.01, retention=60, prune_interval=0)
+    try:
+        for device in ('m1', 'm2'):
+            store.append(device, now - 3600, 1.0, 'mV', 'DC Voltage', 0.001)
+            store.append(device, now - 1, 2.0, 'mV', 'DC Voltage', 0.002)
+            store.append(device, now, None, 'mV', 'DC Voltage', None, overload=True)
+        _wait_written(store, 6)
+    finally:
+        store.close()
+
+    raw = store.query('m2', now - 7200, now + 1)
+    assert [row[1] for row in raw['rows']] == [2.0, None]
+    assert raw['rows'][1][5] == 1
+    buckets = store.query('m1', now - 7200, now + 1, resolution=7200)['rows']
+    assert sum(row[4] for row in buckets) == 1     # 一小时前的读数已删除，只剩 2.0
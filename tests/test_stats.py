@@ -0,0 +1,132 @@
+"""
+统计引擎测试: 累计与滑动窗口统计、REL 相对值、模式变化清零，以及稳定判断与 wait_stable
+"""
+import asyncio
+import math
+import random
+import statistics
+import time
+
+import pytest
+
+from dm40_stats import RunningStats, StabilityDetector, StatsEngine, WindowStats
+from dm40_transport import LoopbackTransport, MeterSimulator
+from dm40ble import Com_DM40A, ReadingPublisher
+
+
+def test_running_stats_match_statistics_module():
+    rng = random.Random(1)
+    values = [rng.gauss(3, 2) for _ in range(200)]
+    stats = RunningStats()
+    for v in values:
+        stats.add(v)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(statistics.fmean(values))
+    assert stats.stddev == pytest.approx(statistics.pstdev(values))
+    assert stats.rms == pytest.approx(math.sqrt(sum(v * v for v in values) / len(values)))
+    assert (stats.min, stats.max) == (min(values), max(values))
+
+    for v in values[:150]:
+        stats.remove(v)
+    assert stats.mean == pytest.approx(statistics.fmean(values[150:]))
+    assert stats.stddev == pytest.approx(statistics.pstdev(values[150:]))
+
+
+def test_window_expires_old_samples_and_tracks_extremes():
+    window = WindowStats(10)
+    for t, v in enumerate([9.0, 1.0, 5.0, 7.0, 3.0]):
+        window.add(float(t * 4), v)     # t = 0, 4, 8, 12, 16
+    result = window.as_dict()
+    # 窗口 (6, 16] 内只剩 t = 8, 12, 16
+    assert result['count'] == 3
+    assert (result['min'], result['max']) == (3.0, 7.0)
+    assert result['avg'] == pytest.approx(5.0)
+    assert result['window'] == 10
+
+
+def test_engine_resets_on_mode_change_and_tracks_relative():
+    engine = StatsEngine(windows=(10,))
+    engine.update(1.0, 'mV', 'DC Voltage', 0.0)
+    engine.update(3.0, 'mV', 'DC Voltage', 1.0)
+    engine.update(None, 'mV', 'DC Voltage', 2.0)     # 超量程不计入
+    assert engine.set_reference() == 3.0
+    engine.update(4.0, 'mV', 'DC Voltage', 3.0)
+    snapshot = engine.snapshot()
+    assert snapshot['total']['count'] == 3 and snapshot['total']['avg'] == pytest.approx(8 / 3)
+    assert snapshot['rel'] == 1.0
+
+    engine.update(10.0, 'mA', 'DC Current', 4.0)
+    snapshot = engine.snapshot()
+    assert snapshot['mode'] == 'DC Current' and snapshot['total']['count'] == 1
+    assert snapshot['reference'] is None and snapshot['rel'] is None
+    assert snapshot['windows'][0]['min'] == 10.0
+
+
+def test_publisher_stats_follow_published_readings():
+    publisher = ReadingPublisher()
+    assert publisher.get_stats() is None
+    publisher.enable_stats((10,))
+    for v in (1.0, 2.0, 3.0):
+        publisher._publish(v, 'mV', 'DC Voltage')
+    assert publisher.set_relative() == 3.0
+    stats = publisher.get_stats()
+    assert stats['total']['count'] == 3 and stats['total']['max'] == 3.0 and stats['rel'] == 0.0
+    publisher.reset_stats()
+    assert publisher.get_stats()['total']['count'] == 0 and publisher.get_stats()['reference'] == 3.0
+
+
+def test_stability_needs_full_window_and_min_samples():
+    detector = StabilityDetector(tolerance=0.01, window=1.0, min_samples=3)
+    assert not detector.update(100.0, 5.0)
+    assert not detector.update(100.5, 5.0)
+    assert detector.update(101.0, 5.0)
+    assert detector.mean == 5.0 and detector.count == 3
+
+
+def test_noise_and_drift_are_not_stable():
+    noisy = StabilityDetector(tolerance=0.01, window=1.0)
+    assert not any(noisy.update(t / 10, 5.0 + (0.05 if t % 2 else -0.05)) for t in range(30))
+    assert noisy.stddev == pytest.approx(0.05, rel=0.1)
+
+    drifting = StabilityDetector(tolerance=0.01, window=1.0)
+    # 每秒漂移 0.02，标准差小于容差但斜率造成的漂移超出
+    assert not any(drifting.update(t / 10, 5.0 + 0.002 * t) for t in range(30))
+    assert drifting.slope == pytest.approx(0.02)
+
+
+def test_stable_again_after_step_leaves_window():
+    detector = StabilityDetector(tolerance=0.01, window=1.0)
+    results = [detector.update(t / 10, 1.0 if t < 20 else 2.0) for t in range(40)]
+    assert results[15] and not results[25]
+    assert results.index(True, 20) == 30      # 跳变前的读数全部移出窗口之后
+
+
+def test_wait_stable_returns_once_settled():
+    def settling(mode_byte, t):
+        return round(1000 + 500 * math.exp(-t / 0.05), 1)
+
+    async def scenario():
+        meter = Com_DM40A(transport=LoopbackTransport(MeterSimulator(settling)))
+        await meter.connect()
+        start = time.monotonic()
+        reading = await meter.wait_stable(window=0.1, timeout=3.0)
+        return reading, time.monotonic() - start
+
+    reading, elapsed = asyncio.run(scenario())
+    assert reading is not None and abs(reading.value - 1000) <= 0.2
+    assert elapsed < 1.0
+
+
+def test_wait_stable_times_out_and_filters_mode(meter, signal):
+    async def scenario():
+        await meter.connect()
+        wrong_mode = await meter.wait_stable(window=0.05, timeout=0.3, mode='Resistance')
+        await meter.start(loop_ms=10)
+        await meter.set_resistance_mode()
+        reading = await meter.wait_stable(window=0.05, timeout=2.0, mode='Resistance')
+        await meter.astop()
+        return wrong_mode, reading
+
+    wrong_mode, reading = asyncio.run(scenario())
+    assert wrong_mode is None
+    assert reading.mode == 'Resistance' and reading.value == signal.value
@@ -0,0 +1,75 @@
+"""
+分级保留存储测试: 1 秒 / 1 分钟汇总、按分辨率和保留时长选择级别、模式变化与超量程、淘汰
+"""
+import pytest
+
+from dm40_storage import COLUMNS, TieredStore
+
+
+def _fill(store, seconds, rate=10, start=0.0, value=lambda t: t, mode='DC Voltage'):
+    for i in range(int(seconds * rate)):
+        t = start + i / rate
+        store.append(t, value(t), 'mV', mode)
+
+
+def _rows(result):
+    return [dict(zip(COLUMNS, row)) for row in result['rows']]
+
+
+def test_one_second_and_one_minute_rollups():
+    store = TieredStore(raw_retention=600, tiers=((1.0, 3600), (60.0, 86400)))
+    _fill(store, 125)
+    second = _rows(store.query(10.0, 10.5, resolution=1))[0]
+    assert store.query(10.0, 10.5, resolution=1)['resolution'] == 1.0
+    assert (second['timestamp'], second['count'], second['min'], second['max']) == (10.0, 10, 10.0, 10.9)
+    assert second['mean'] == pytest.approx(10.45)
+
+    minutes = _rows(store.query(0, 125, resolution=60))
+    assert [m['timestamp'] for m in minutes] == [0.0, 60.0, 120.0]
+    assert [m['count'] for m in minutes] == [600, 600, 40]     # 当前分钟桶只含已结束的 1 秒桶
+    assert minutes[1]['min'] == 60.0 and minutes[1]['max'] == pytest.approx(119.9)
+    assert minutes[1]['mean'] == pytest.approx(89.95)
+
+
+def test_query_falls_back_to_coarser_tier_when_retention_is_short():
+    store = TieredStore(raw_retention=10, tiers=((1.0, 100), (60.0, 86400)))
+    _fill(store, 300)
+    assert store.query(295, 300, resolution=0)['resolution'] == 0.0
+    assert store.query(250, 300, resolution=0)['resolution'] == 1.0
+    assert store.query(100, 300, resolution=0)['resolution'] == 60.0
+    raw = _rows(store.query(291, 300))
+    assert raw[0]['timestamp'] >= 290 and raw[-1]['timestamp'] == pytest.approx(299.9)
+
+
+def test_old_rows_are_trimmed():
+    store = TieredStore(raw_retention=10, tiers=((1.0, 100), (60.0, 86400)))
+    _fill(store, 600)
+    tiers = store.status()['tiers']
+    assert tiers[0]['rows'] < 10 * 10 + 300      # 批量淘汰，不超过保留量加一批
+    assert tiers[1]['rows'] < 100 + 300
+    assert tiers[2]['rows'] == 9
+    assert store.status()['latest'] == pytest.approx(599.9)
+
+
+def test_mode_change_closes_bucket_and_overload_is_counted():
+    store = TieredStore(raw_retention=600, tiers=((1.0, 3600),))
+    store.append(0.1, 1.0, 'mV', 'DC Voltage')
+    store.append(0.2, None, 'mV', 'DC Voltage', overload=True)
+    store.append(0.3, 5.0, 'mA', 'DC Current')
+    store.append(1.5, 6.0, 'mA', 'DC Current')
+    rows = _rows(store.query(0, 2, resolution=1))
+    assert [(r['timestamp'], r['mode'], r['count'], r['overload']) for r in rows] == [
+        (0.0, 'DC Voltage', 1, 1), (0.0, 'DC Current', 1, 0), (1.0, 'DC Current', 1, 0)]
+
+
+def test_covers_and_invalid_tiers():
+    store = TieredStore(raw_retention=10, tiers=((1.0, 100),))
+    assert not store.covers(0)
+    _fill(store, 50, start=1000)
+    assert store.covers(1000) and not store.covers(999)
+    _fill(store, 100, start=1050)
+    assert not store.covers(1000)
+    with pytest.raises(ValueError, match='整数倍'):
+        TieredStore(tiers=((1.0, 10), (1.5, 10)))
+    with pytest.raises(ValueError, match='递增'):
+        TieredStore(tiers=((60.0, 10), (1.0, 10)))
@@ -0,0 +1,49 @@
+"""
+重连补发缓冲区测试: 增量、快照判定与降采样
+"""
+from dm40_stream import SampleRing, downsample
+
+
+def _fill(ring, values):
+    for i, value in enumerate(values):
+        ring.append(float(i), value, 'mV', 'DC Voltage', value is None)
+
+
+def test_since_returns_delta_with_overload_flag():
+    ring = SampleRing(capacity=10)
+    _fill(ring, [1.0, None, 3.0])
+    assert ring.since(1) == [(2, 1.0, None, 'mV', 'DC Voltage', True), (3, 2.0, 3.0, 'mV', 'DC Voltage', False)]
+    assert ring.since(3) == []
+
+
+def test_since_requires_snapshot_when_gap_unavailable():
+    ring = SampleRing(capacity=4)
+    _fill(ring, [float(i) for i in range(10)])
+    assert ring.first_seq == 7 and ring.last_seq == 10
+    assert ring.since(5) is None            # 第 6 个样本已被覆盖
+    assert [s[0] for s in ring.since(6)] == [7, 8, 9, 10]
+    assert ring.since(11) is None           # 序号超前（服务器重启）
+    assert ring.since(7, max_count=2) is None
+    assert [s[0] for s in ring.since(7)] == [8, 9, 10]
+    assert [s[0] for s in ring.latest(2)] == [9, 10]
+
+
+def test_downsample_keeps_extremes_and_overload():
+    ring = SampleRing(capacity=100)
+    values = [5.0] * 40
+    values[3] = 100.0
+    values[12] = -100.0
+    values[25] = None
+    _fill(ring, values)
+    result = downsample(ring.latest(), 8)
+    assert [s[0] for s in result] == sorted(s[0] for s in result)
+    assert any(s[2] == 100.0 for s in result) and any(s[2] == -100.0 for s in result)
+    assert [s[0] for s in result if s[5]] == [26]
+    assert downsample(ring.latest(5), 8) == ring.latest(5)
+
+
+def test_empty_ring_and_new_stream_per_ring():
+    ring = SampleRing(capacity=4)
+    assert ring.last_seq == 0 and ring.since(0) == [] and ring.latest() == []
+    assert ring.since(1) is None
+    assert SampleRing().stream_id != ring.stream_id
@@ -0,0 +1,82 @@
+"""测试计划执行器: 期望 OL 的步骤、模式切换后的旧读数与过时的当前模式"""
+import asyncio
+
+from dm40_protocol import MODE_BYTES
+import dm40_testplan as testplan
+from dm40_transport import LoopbackTransport, MeterSimulator
+from dm40ble import Com_DM40A
+
+
+def _source(mode_byte, t):
+    if mode_byte == MODE_BYTES['continuity']:
+        return None     # 开路
+    return 3300.0
+
+
+class StaleAfterSwitch:
+    """模式切换后的第一个读数仍是旧模式的帧"""
+
+    def __init__(self):
+        self.simulator = MeterSimulator(_source)
+        self.stale = None
+
+    def __call__(self, cmd):
+        if cmd[3] == 0x06:
+            self.stale = self.simulator.mode_byte
+        elif cmd[3] == 0x09 and self.stale is not None:
+            current, self.simulator.mode_byte = self.simulator.mode_byte, self.stale
+            self.stale = None
+            try:
+                return self.simulator(cmd)
+            finally:
+                self.simulator.mode_byte = current
+        return self.simulator(cmd)
+
+
+def _run(plan, responder):
+    async def scenario():
+        meter = Com_DM40A(transport=LoopbackTransport(responder))
+        await meter.connect()
+        return await testplan.run_plan(meter, plan, 'm1')
+    return asyncio.run(scenario())
+
+
+def test_expect_overload_skips_stabilisation():
+    plan = testplan.TestPlan('ol', [testplan.Step('开路', 'continuity', expect_overload=True, timeout=1.0)])
+    result = _run(plan, MeterSimulator(_source))
+    step = result.steps[0]
+    assert step.passed and step.overload
+    assert step.total_time < 1.0
+
+
+def test_unstable_step_discards_previous_mode_frame():
+    plan = testplan.TestPlan('stale', [
+        testplan.Step('VCC', 'dc_voltage', low=3200, high=3400, stable=False),
+        testplan.Step('开路', 'continuity', expect_overload=True, stable=False, timeout=1.0),
+    ])
+    result = _run(plan, StaleAfterSwitch())
+    assert [s.passed for s in result.steps] == [True, True]
+    assert result.steps[1].overload
+
+
+def test_first_step_switches_mode_even_if_cached_reading_matches():
+    """缓存的读数是直流电压，但万用表已在面板上切到交流电压"""
+    simulator = MeterSimulator(_source)
+    commands = []
+
+    def responder(cmd):
+        commands.append(cmd[3])
+        return simulator(cmd)
+
+    async def scenario():
+        meter = Com_DM40A(transport=LoopbackTransport(responder))
+        await meter.connect()
+        m = await meter.get_measurement()
+        meter._publish(m.value, m.unit, m.mode, m)     # 与采集循环相同，更新缓存的当前读数
+        simulator.mode_byte = MODE_BYTES['ac_voltage']
+        plan = testplan.TestPlan('panel', [testplan.Step('VCC', 'dc_voltage', stable=False, timeout=0.3)])
+        return await testplan.run_plan(meter, plan, 'm1')
+
+    result = asyncio.run(scenario())
+    assert result.steps[0].passed
+    assert 0x06 in commands
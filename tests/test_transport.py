@@ -0,0 +1,121 @@
+"""
+通过 LoopbackTransport + MeterSimulator 驱动 Com_DM40A 的协议层测试（不需要蓝牙）
+"""
+import asyncio
+
+import pytest
+
+from dm40_protocol import MODE_BYTES, READ_COMMAND, encode_measurement_frame
+from dm40_transport import LoopbackTransport, MeterSimulator, Transport
+from dm40ble import Com_DM40A
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _connected(transport: Transport) -> Com_DM40A:
+    meter = Com_DM40A(transport=transport)
+    await meter.connect()
+    return meter
+
+
+def test_transport_is_abstract():
+    with pytest.raises(TypeError):
+        Transport()
+
+
+def test_read_measurement():
+    async def scenario():
+        meter = await _connected(LoopbackTransport(MeterSimulator(lambda mode, t: 1234.5)))
+        return await meter.get_measurement()
+
+    m = run(scenario())
+    assert m.value == 1234.5
+    assert m.unit == 'mV' and m.mode == 'DC Voltage'
+    assert m.si_value == pytest.approx(1.2345)
+    assert not m.overload
+
+
+def test_mode_switch():
+    simulator = MeterSimulator(lambda mode, t: 12.0)
+
+    async def scenario():
+        meter = await _connected(LoopbackTransport(simulator))
+        ok = await meter.set_dc_current_mode()
+        return ok, await meter.get_measurement()
+
+    ok, m = run(scenario())
+    assert ok
+    assert simulator.mode_byte == MODE_BYTES['dc_current']
+    assert m.mode == 'DC Current' and m.unit == 'mA'
+
+
+def test_overload_frame():
+    async def scenario():
+        meter = await _connected(LoopbackTransport(MeterSimulator(lambda mode, t: None)))
+        return await meter.get_measurement(), await meter.get_data()
+
+    m, (value, unit, mode) = run(scenario())
+    assert m.overload and m.value is None and m.si_value is None
+    assert value is None and unit == 'mV'
+
+
+def test_timeout_then_retry_succeeds():
+    """第一次命令不应答，重发后收到应答"""
+    simulator = MeterSimulator(lambda mode, t: 1.0)
+    calls = []
+
+    def responder(cmd):
+        calls.append(cmd)
+        return None if len(calls) == 1 else simulator(cmd)
+
+    async def scenario():
+        meter = await _connected(LoopbackTransport(responder))
+        m = await meter.get_measurement()
+        return meter, m
+
+    meter, m = run(scenario())
+    assert m is not None and m.value == 1.0
+    assert len(calls) == 2
+    assert meter.timeouts == 1 and meter.retries == 1
+
+
+def test_late_response_after_retry_widens_uncertainty():
+    """第一次应答迟到、在重发后才到达时，采样时刻的误差从第一次发送算起"""
+    async def scenario():
+        meter = await _connected(LoopbackTransport(MeterSimulator(lambda mode, t: 1.0), delay=0.03))
+        response = await meter.send_command(READ_COMMAND, timeout=0.02, retries=1)
+        return meter, response
+
+    meter, response = run(scenario())
+    assert response is not None and meter.retries == 1
+    mono, half = meter.last_sample_time
+    assert half >= 0.014
+
+
+def test_timeout_gives_up():
+    async def scenario():
+        meter = await _connected(LoopbackTransport(lambda cmd: None))
+        return meter, await meter.send_command(READ_COMMAND, timeout=0.02, retries=2)
+
+    meter, response = run(scenario())
+    assert response is None
+    assert meter.timeouts == 3 and meter.retries == 2
+
+
+def test_fragmented_response_is_reassembled():
+    """应答分两次通知到达时拼成整帧"""
+    frame = encode_measurement_frame(0x30, 42.0, 1)
+
+    class Split(LoopbackTransport):
+        async def write(self, data):
+            loop = asyncio.get_running_loop()
+            loop.call_soon(self._deliver, frame[:5])
+            loop.call_later(0.01, self._deliver, frame[5:])
+
+    async def scenario():
+        meter = await _connected(Split())
+        return await meter.get_measurement()
+
+    assert run(scenario()).value == 42.0
@@ -0,0 +1,272 @@
+"""
+Web 服务测试: 通过 Flask 测试客户端和 sim:// 模拟设备驱动 REST 接口（不需要蓝牙）
+"""
+import math
+
+import pytest
+
+import dm40_wire
+import web_server
+from dm40_protocol import decode_measurement, encode_measurement_frame
+from dm40ble import ReadingPublisher
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_server, 'RECORD_DIR', str(tmp_path))
+    monkeypatch.setattr(web_server, 'CAPTURE_DIR', None)
+    with web_server.app.test_client() as client:
+        yield client
+        for device_id in list(web_server.devices):
+            client.post(f'/api/devices/{device_id}/disconnect')
+        for rule in web_server.rule_engine.rules():
+            web_server.rule_engine.remove_rule(rule.id)
+
+
+def _connect(client, device_id):
+    response = client.post(f'/api/devices/{device_id}/connect', json={'transport': 'sim://'})
+    assert response.get_json()['status'] == 'ok'
+    return web_server.devices[device_id]
+
+
+def test_full_rate_consumers_count_as_subscribers(client):
+    entry = _connect(client, 'm1')
+    device = entry["device"]
+    assert device._subscribers == 0
+
+    client.post('/api/rules', json={'id': 'hi', 'op': '>', 'threshold': 5, 'device': 'm1'})
+    assert device._subscribers == 1
+    client.post('/api/devices/m1/record/start')
+    assert device._subscribers == 2
+    client.post('/api/devices/m1/capture', json={'op': '>', 'threshold': 5})
+    assert device._subscribers == 3
+
+    client.delete('/api/devices/m1/capture')
+    client.post('/api/devices/m1/record/stop')
+    client.delete('/api/rules/hi')
+    assert device._subscribers == 0
+
+
+def test_rules_for_other_devices_do_not_count(client):
+    device = _connect(client, 'm1')["device"]
+    client.post('/api/rules', json={'id': 'other', 'op': '>', 'threshold': 5, 'device': 'm2'})
+    assert device._subscribers == 0
+    client.post('/api/rules', json={'id': 'any', 'op': '>', 'threshold': 5})
+    assert device._subscribers == 1
+
+
+def test_derived_channel_counts_for_its_inputs(client):
+    v = _connect(client, 'v')["device"]
+    i = _connect(client, 'i')["device"]
+    response = client.post('/api/derived', json={'id': 'p', 'type': 'power', 'inputs': ['v', 'i']})
+    assert response.get_json()['status'] == 'ok'
+    assert v._subscribers == 1 and i._subscribers == 1
+    client.post('/api/devices/p/disconnect')
+    assert v._subscribers == 0 and i._subscribers == 0
+
+
+def test_failed_connect_tears_down_registration(client, tmp_path, monkeypatch):
+    from dm40_shm import ShmRing
+    from dm40ble import Com_DM40A
+
+    monkeypatch.setattr(web_server, 'SHM_EXPORT', True)
+    monkeypatch.setattr(web_server, 'SQLITE_PATH', str(tmp_path / 'r.db'))
+    monkeypatch.setattr(web_server, '_sqlite_store', None)
+    created = []
+    create = web_server._create_device
+    monkeypatch.setattr(web_server, '_create_device', lambda *args: created.append(create(*args)) or created[-1])
+
+    def fail(self, *args, **kwargs):
+        raise RuntimeError('启动失败')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Com_DM40A, 'run', fail)
+        response = client.post('/api/devices/m1/connect', json={'transport': 'sim://'})
+    assert response.status_code == 500
+    assert 'm1' not in web_server.devices
+    device = created[0][0]
+    assert [l for l, _ in device._listeners
+            if getattr(l, '__qualname__', '').startswith(('RuleEngine.', 'SqliteStore.'))] == []
+    with pytest.raises(FileNotFoundError):
+        ShmRing('dm40_m1', track=False)
+
+    entry = _connect(client, 'm1')
+    assert entry["shm"] is not None and entry["sqlite"] is not None
+    client.post('/api/devices/m1/disconnect')
+    web_server._sqlite_store.close()
+
+
+class _Source(ReadingPublisher):
+    """直接发布读数的读数来源，代替万用表"""
+
+    def set_subscriber_count(self, count):
+        pass
+
+    def stop(self):
+        pass
+
+
+def _subscribe(client, source_id, **message):
+    socket = web_server.socketio.test_client(web_server.app, flask_test_client=client)
+    socket.get_received()
+    socket.emit('subscribe', dict(message, device_id=source_id))
+    received = {event['name']: event['args'][0] for event in socket.get_received()}
+    socket.disconnect()
+    return received
+
+
+def test_history_replays_overload_like_live_updates(client):
+    source = _Source()
+    with web_server.devices_lock:
+        web_server._register_device('h1', source, 'test')
+    overload = decode_measurement(encode_measurement_frame(0x30, None))
+    source._publish(1.0, 'mV', 'DC Voltage')
+    source._publish(None, 'mV', 'DC Voltage', overload)
+    source._publish(2.0, 'mV', 'DC Voltage')
+    stream = web_server.devices['h1']["history"].stream_id
+
+    delta = _subscribe(client, 'h1', stream=stream, last_seq=1)['history']
+    assert delta['kind'] == 'delta'
+    assert [s[2] for s in delta['samples']] == [None, 2.0]
+    assert [s[5] for s in delta['samples']] == [True, False]
+
+    snapshot = _subscribe(client, 'h1', stream='other', last_seq=1)['history']
+    assert snapshot['kind'] == 'snapshot' and [s[0] for s in snapshot['samples']] == [1, 2, 3]
+
+    binary = _subscribe(client, 'h1', encoding='binary', stream=stream, last_seq=0)['history_bin']
+    assert binary['seqs'] == [1, 2, 3]
+    assert [v for _, v, _ in dm40_wire.decode(binary['data'])] == [1.0, math.inf, 2.0]
+
+
+def _register_source(device_id):
+    source = _Source()
+    with web_server.devices_lock:
+        web_server._register_device(device_id, source, 'test')
+    return source
+
+
+def test_updates_go_only_to_the_device_room(client):
+    a, b = _register_source('a'), _register_source('b')
+    socket = web_server.socketio.test_client(web_server.app, flask_test_client=client)
+    socket.emit('subscribe', {'device_id': 'a'})
+    socket.get_received()
+
+    a._publish(1.5, 'V', 'DC Voltage')
+    b._publish(2.5, 'V', 'DC Voltage')
+    updates = [event['args'][0] for event in socket.get_received() if event['name'] == 'data_update']
+    assert [(u['device_id'], u['value']) for u in updates] == [('a', 1.5)]
+
+    socket.emit('unsubscribe', {'device_id': 'a'})
+    a._publish(3.5, 'V', 'DC Voltage')
+    assert socket.get_received() == []
+    socket.disconnect()
+
+
+def test_device_status_and_listing_are_per_device(client):
+    a = _register_source('a')
+    _register_source('b')
+    a._publish(1.5, 'V', 'DC Voltage')
+    assert client.get('/api/devices/a/status').get_json()['value'] == 1.5
+    assert client.get('/api/devices/b/status').get_json()['value'] is None
+    assert client.get('/api/devices/c/status').get_json()['status'] == 'disconnected'
+    assert set(client.get('/api/devices').get_json()) == {'a', 'b'}
+
+
+def test_disconnect_notifies_json_and_binary_subscribers(client):
+    _register_source('a')
+    sockets = {}
+    for encoding in ('json', 'binary'):
+        sockets[encoding] = web_server.socketio.test_client(web_server.app, flask_test_client=client)
+        sockets[encoding].emit('subscribe', {'device_id': 'a', 'encoding': encoding})
+        sockets[encoding].get_received()
+
+    assert client.post('/api/devices/a/disconnect').get_json()['status'] == 'ok'
+    assert 'a' not in web_server.devices
+    for socket in sockets.values():
+        updates = [event['args'][0] for event in socket.get_received() if event['name'] == 'data_update']
+        assert [(u['device_id'], u['status']) for u in updates] == [('a', 'disconnected')]
+        socket.disconnect()
+
+
+def test_binary_subscribers_get_schema_and_packed_updates(client):
+    source = _register_source('a')
+    sockets = {}
+    for encoding in ('json', 'binary'):
+        sockets[encoding] = web_server.socketio.test_client(web_server.app, flask_test_client=client)
+        sockets[encoding].emit('subscribe', {'device_id': 'a', 'encoding': encoding})
+    assert 'schema' in [event['name'] for event in sockets['binary'].get_received()]
+    assert 'schema' not in [event['name'] for event in sockets['json'].get_received()]
+
+    source._publish(1.5, 'mV', 'DC Voltage')
+    overload = decode_measurement(encode_measurement_frame(0x30, None))
+    source._publish(None, 'mV', 'DC Voltage', overload)
+
+    received = {encoding: socket.get_received() for encoding, socket in sockets.items()}
+    assert {event['name'] for event in received['json']} == {'data_update'}
+    packed = [event['args'][0] for event in received['binary']]
+    assert {event['name'] for event in received['binary']} == {'data_bin'}
+    assert [p['seq'] for p in packed] == [1, 2]
+    assert [v for p in packed for _, v, _ in dm40_wire.decode(p['data'])] == [1.5, math.inf]
+    for socket in sockets.values():
+        socket.disconnect()
+
+
+def test_large_gap_sends_bounded_snapshot(client, monkeypatch):
+    monkeypatch.setattr(web_server, 'MAX_DELTA', 5)
+    monkeypatch.setattr(web_server, 'SNAPSHOT_POINTS', 4)
+    source = _register_source('h1')
+    web_server.devices['h1']["ui_filter"].change_only = False
+    for i in range(20):
+        source._publish(float(i % 3), 'mV', 'DC Voltage')
+    stream = web_server.devices['h1']["history"].stream_id
+
+    history = _subscribe(client, 'h1', stream=stream, last_seq=15)['history']
+    assert history['kind'] == 'delta' and [s[0] for s in history['samples']] == [16, 17, 18, 19, 20]
+
+    history = _subscribe(client, 'h1', stream=stream, last_seq=14)['history']
+    assert history['kind'] == 'snapshot' and history['last_seq'] == 20
+    assert 0 < len(history['samples']) <= 4
+
+
+def test_reconnected_device_starts_a_new_stream(client):
+    first = _connect(client, 'm1')["history"].stream_id
+    client.post('/api/devices/m1/disconnect')
+    assert _connect(client, 'm1')["history"].stream_id != first
+
+
+def test_capture_api_freezes_and_serves_snapshots(client):
+    source = _register_source('c1')
+    assert client.post('/api/devices/c1/capture', json={'op': '==', 'threshold': 1}).status_code == 400
+    status = client.post('/api/devices/c1/capture', json={'op': '>', 'threshold': 5, 'pre': 1, 'post': 0}).get_json()
+    assert status['state'] == 'armed'
+    socket = web_server.socketio.test_client(web_server.app, flask_test_client=client)
+    socket.emit('subscribe', {'device_id': 'c1'})
+    socket.get_received()
+
+    for i, value in enumerate([1.0, 2.0, 9.0]):
+        source._publish(value, 'mA', 'DC Current', timestamp=100.0 + i / 10)
+    summary, = [e['args'][0] for e in socket.get_received() if e['name'] == 'capture']
+    assert summary['count'] == 3 and summary['max'] == 9.0
+    snapshot = client.get(f"/api/devices/c1/capture/snapshots/{summary['id']}").get_json()
+    assert [s[1] for s in snapshot['samples']] == [1.0, 2.0, 9.0]
+    assert client.get('/api/devices/c1/capture/snapshots/0').status_code == 404
+
+    client.post('/api/devices/c1/capture/trigger', json={'reason': '手动'})
+    source._publish(1.0, 'mA', 'DC Current', timestamp=101.0)
+    assert [s['reason'] for s in client.get('/api/devices/c1/capture').get_json()['snapshots']] == ['> 5.0', '手动']
+    assert client.delete('/api/devices/c1/capture').get_json()['status'] == 'ok'
+    assert client.get('/api/devices/c1/capture').get_json()['state'] == 'off'
+    socket.disconnect()
+
+
+def test_history_endpoint_serves_memory_tiers(client):
+    source = _register_source('s1')
+    for i in range(50):
+        source._publish(float(i), 'mV', 'DC Voltage', timestamp=1000.0 + i / 10)
+    raw = client.get('/api/devices/s1/history?start=1000&end=1010&resolution=0').get_json()
+    assert raw['source'] == 'memory' and len(raw['rows']) == 50
+    rolled = client.get('/api/devices/s1/history?start=1000&end=1010&resolution=1').get_json()
+    assert [row[4] for row in rolled['rows']] == [10, 10, 10, 10, 10]
+    assert client.get('/api/devices/s1/history?start=1010&end=1000').status_code == 400
+    assert client.get('/api/devices/nope/history').status_code == 400
+    assert client.get('/api/devices/s1/history/status').get_json()['tiers'][0]['rows'] == 50
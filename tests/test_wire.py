@@ -0,0 +1,61 @@
+"""
+实时二进制编码测试
+"""
+import math
+
+import dm40_wire
+
+
+def _round_trip(samples, precise=True):
+    modes = dm40_wire.schema()['modes']
+    return [(t, v, modes[str(c)]['unit'], modes[str(c)]['mode'])
+            for t, v, c in dm40_wire.decode(dm40_wire.encode(samples, precise))]
+
+
+def test_existing_mode_codes_are_stable():
+    assert dm40_wire.mode_code('DC Voltage', 'mV') == 1
+    assert dm40_wire.mode_code('Continuity', 'Ω') == 10
+
+
+def test_derived_channels_round_trip():
+    samples = [
+        (1.0, 3.3, 'W', 'Power'),
+        (2.0, 0.25, 'Wh', 'Energy'),
+        (3.0, 12.5, 'mAh', 'Charge'),
+        (4.0, 1234.5, 'mV', 'DC Voltage'),
+    ]
+    assert _round_trip(samples) == samples
+    assert all(dm40_wire.mode_code(mode, unit) != dm40_wire.MODE_CODE_UNKNOWN for _, _, unit, mode in samples)
+
+
+def test_overload_and_missing_values():
+    (overload, missing, empty) = _round_trip([(1.0, math.inf, 'mV', 'DC Voltage'),
+                                             (2.0, None, 'W', 'Power'),
+                                             (3.0, None, '', '')], precise=False)
+    assert overload == (1.0, math.inf, 'mV', 'DC Voltage')
+    assert missing == (2.0, None, 'W', 'Power')
+    assert empty == (3.0, None, '', '')
+
+
+def test_columnar_layout_is_aligned():
+    payload = dm40_wire.encode([(1.0, 2.0, 'mV', 'DC Voltage'), (2.0, 3.0, 'mV', 'DC Voltage')])
+    header = dm40_wire.schema()['header_bytes']
+    assert header % 8 == 0
+    # 时间戳 float64 + 数值 float32 + 模式码 uint8
+    assert len(payload) == header + 2 * 8 + 2 * 4 + 2
+    assert payload[-2:] == bytes([1, 1])
+
+
+def test_float32_values_round_to_single_precision():
+    (_, value, _), = dm40_wire.decode(dm40_wire.encode([(1.0, 1234.567, 'mV', 'DC Voltage')]))
+    assert value != 1234.567 and math.isclose(value, 1234.567, rel_tol=1e-6)
+    (_, value, _), = dm40_wire.decode(dm40_wire.encode([(1.0, 1234.567, 'mV', 'DC Voltage')], precise=True))
+    assert value == 1234.567
+
+
+def test_unknown_mode_and_schema():
+    (_, _, code), = dm40_wire.decode(dm40_wire.encode([(1.0, 1.0, 'furlong', 'Distance')]))
+    assert code == dm40_wire.MODE_CODE_UNKNOWN
+    modes = dm40_wire.schema()['modes']
+    assert modes[str(dm40_wire.MODE_CODE_NONE)] == {'mode': '', 'unit': ''}
+    assert len(modes) == len(dm40_wire.MODE_CODES) + 2
@@ -0,0 +1,78 @@
+"""
+多进程采集测试: 工作进程中的模拟万用表（sim://）经共享内存把读数传回主进程，
+远程调用、同组共用进程、进程退出后的自动重启与设备移除
+"""
+import os
+import signal
+import time
+
+import pytest
+
+from dm40_shm import ShmRing
+from dm40_worker import WorkerPool
+
+
+def _wait_until(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(ring_capacity=256, poll_interval=0.01, heartbeat_interval=0.1,
+                      restart_backoff=0.1, max_backoff=0.2)
+    yield pool
+    pool.close()
+
+
+def test_grouped_meters_share_a_process_and_accept_calls(pool):
+    m1 = pool.add_meter('m1', 'sim://', group='bench')
+    m2 = pool.add_meter('m2', 'sim://', group='bench')
+    readings = {'m1': [], 'm2': []}
+    m1.add_listener(readings['m1'].append)
+    m2.add_listener(readings['m2'].append)
+    pool.start(20)
+
+    assert _wait_until(lambda: len(readings['m1']) >= 3 and len(readings['m2']) >= 3)
+    assert list(pool.status()) == ['bench'] and pool.is_group_alive('bench')
+    assert readings['m1'][0].mode == 'DC Voltage' and readings['m1'][0].mono is not None
+    assert _wait_until(lambda: m1.get_state() == 1)     # 状态随心跳更新
+    with pytest.raises(RuntimeError, match='进程组 bench 已启动'):
+        pool.add_meter('m3', 'sim://', group='bench')
+
+    assert m2.call('set_dc_current_mode') is True
+    assert _wait_until(lambda: readings['m2'][-1].mode == 'DC Current')
+    assert readings['m1'][-1].mode == 'DC Voltage'
+    with pytest.raises(RuntimeError, match='AttributeError'):
+        m1.call('no_such_method')
+
+
+def test_supervisor_restarts_a_killed_worker(pool, capsys):
+    meter = pool.add_meter('m1', 'sim://')
+    readings = []
+    meter.add_listener(readings.append)
+    pool.start(20)
+    assert _wait_until(lambda: readings)
+    pid = pool.status()['m1']['pid']
+
+    os.kill(pid, signal.SIGKILL)
+    assert _wait_until(lambda: pool.status()['m1']['restarts'] == 1 and pool.is_group_alive('m1'))
+    assert pool.status()['m1']['pid'] != pid
+    count = len(readings)
+    assert _wait_until(lambda: len(readings) > count)
+    assert '工作进程 m1 异常: 进程退出' in capsys.readouterr().out
+
+
+def test_remove_meter_releases_its_ring(pool):
+    meter = pool.add_meter('m1', 'sim://')
+    name = meter.ring.name
+    pool.start(20)
+    assert _wait_until(lambda: meter.ring.write_seq > 0)
+    pool.remove_meter(meter)
+    assert pool.meters() == [] and pool.status() == {}
+    with pytest.raises(FileNotFoundError):
+        ShmRing(name, track=False)
@@ -2,34 +2,268 @@
 DM40A 蓝牙万用表实时数据 Web 服务器
 支持多种测量模式：直流/交流电压、直流/交流电流、电阻、电容、频率、温度等
 """
-from flask import Flask, render_template, jsonify
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, jsonify, request
+from flask_socketio import SocketIO, emit, join_room, leave_room
+import math
+import os
+import sqlite3
 import threading
 import time
 from dm40ble import Com_DM40A
+from dm40_transport import transport_from_url
+import dm40_wire
+from dm40_stream import SampleRing, downsample
+from dm40_rules import Rule, RuleEngine
+from dm40_filter import ChangeFilter
+from dm40_storage import TieredStore
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'dm40a-secret-key'
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# 全局变量
-dm40_device = None
-current_data = {"value": None, "unit": "", "mode": "", "status": "disconnected"}
-
-
-def data_update_callback(data, unit, mode):
-    """数据更新回调函数"""
-    global current_data
-    current_data["value"] = data
-    current_data["unit"] = unit
-    current_data["mode"] = mode
-    # 通过 WebSocket 推送数据到前端
-    socketio.emit('data_update', {
-        'value': data,
-        'unit': unit,
-        'mode': mode,
-        'timestamp': time.time()
-    })
+# 设备注册表: device_id -> {"device": Com_DM40A, "data": 当前数据, "history": 样本环形缓冲区}
+# 每台万用表对应一个 Socket.IO 房间（房间名即 device_id），数据只推送给订阅了该设备的客户端
+# 选择二进制编码的客户端加入 "<device_id>:bin" 房间，接收 data_bin 事件
+DEFAULT_DEVICE_ID = 'default'
+devices = {}
+devices_lock = threading.Lock()
+
+# 断线重连补发: 每台设备保留最近 HISTORY_CAPACITY 个带序号样本
+# 缺失样本不超过 MAX_DELTA 时逐个补发，否则发送不超过 SNAPSHOT_POINTS 点的降采样快照
+HISTORY_CAPACITY = 6000
+MAX_DELTA = 1000
+SNAPSHOT_POINTS = 600
+
+# 统计滑动窗口（秒）
+STATS_WINDOWS = (10, 60, 600)
+
+# 报警规则引擎，所有设备共用；"socketio" 动作把报警推送到对应设备的房间
+rule_engine = RuleEngine()
+
+# Webhook 报警目标: 名称 -> http(s) URL，规则中以 "webhook:<名称>" 引用，接口不能指定任意地址
+WEBHOOKS = {}
+
+# 自适应采样: 基准间隔 200ms，无人订阅时降速，报警触发时加速
+POLL_INTERVAL_MS = 200
+ADAPTIVE_POLLING = True
+
+# 界面推送过滤: 读数变化超过死区才推送，稳定时每 UI_HEARTBEAT 秒发送一次心跳
+# 统计、报警、记录器直接接收全分辨率读数
+UI_DEADBAND = 0.0
+UI_HEARTBEAT = 1.0
+
+# 记录文件保存目录
+RECORD_DIR = 'recordings'
+
+# 分级保留存储（dm40_storage）: 原始读数保留 STORAGE_RAW_RETENTION 秒，
+# 汇总桶 (宽度秒, 保留秒数) 供 /api/devices/<id>/history 查询长时间趋势
+STORAGE_RAW_RETENTION = 600
+STORAGE_TIERS = ((1.0, 86400), (60.0, 90 * 86400))
+HISTORY_MAX_POINTS = 2000
+
+# SQLite 持久化（dm40_sqlite）: 设置为数据库文件路径后所有设备的全分辨率读数写入该文件，
+# 历史查询超出内存分级存储的范围（例如服务器重启前、设备已断开）时从数据库查询
+SQLITE_PATH = None
+SQLITE_RETENTION = None
+_sqlite_store = None
+
+# 触发捕获快照保存目录（None 表示只保存在内存中）
+CAPTURE_DIR = 'captures'
+_snapshot_writer = None
+
+# 多进程采集: 每台设备运行在独立的工作进程中（dm40_worker），故障互不影响并自动重启
+WORKER_PROCESSES = False
+_worker_pool = None
+
+# 共享内存导出: 每台设备的全分辨率读数写入名为 "dm40_<device_id>" 的共享内存缓冲区，
+# 本机其他进程可用 dm40_shm.ShmReader 直接读取（python dm40_shm.py dm40_<device_id>）
+SHM_EXPORT = False
+SHM_CAPACITY = 16384
+
+# WebSocket 客户端订阅表: sid -> {device_id, ...}，用于统计每台设备的订阅者数量
+client_subscriptions = {}
+
+# 模式切换命令的等待时间（秒）
+MODE_TIMEOUT = 3.0
+
+# 模式路由名 -> (模式常量, 中文名称)，切换时调用设备的 set_<路由名>_mode
+MODE_ROUTES = {
+    'dc_voltage': (Com_DM40A.MODE_DC_VOLTAGE, '直流电压'),
+    'ac_voltage': (Com_DM40A.MODE_AC_VOLTAGE, '交流电压'),
+    'dc_current': (Com_DM40A.MODE_DC_CURRENT, '直流电流'),
+    'ac_current': (Com_DM40A.MODE_AC_CURRENT, '交流电流'),
+    'resistance': (Com_DM40A.MODE_RESISTANCE, '电阻'),
+    'capacitance': (Com_DM40A.MODE_CAPACITANCE, '电容'),
+    'frequency': (Com_DM40A.MODE_FREQUENCY, '频率'),
+    'temperature': (Com_DM40A.MODE_TEMPERATURE, '温度'),
+    'diode': (Com_DM40A.MODE_DIODE, '二极管'),
+    'continuity': (Com_DM40A.MODE_CONTINUITY, '通断'),
+    # 兼容旧代码，默认直流
+    'voltage': (Com_DM40A.MODE_DC_VOLTAGE, '直流电压'),
+    'current': (Com_DM40A.MODE_DC_CURRENT, '直流电流'),
+}
+
+
+def _empty_data(status="disconnected"):
+    """生成空的设备数据"""
+    return {"value": None, "unit": "", "mode": "", "status": status}
+
+
+def _make_ui_listener(device_id):
+    """生成绑定到指定设备的界面推送监听器（经过 ui_filter 过滤）"""
+    def ui_listener(reading):
+        """读数推送到设备房间"""
+        entry = devices.get(device_id)
+        if entry is None:
+            return
+        data, unit, mode, timestamp = reading.value, reading.unit, reading.mode, reading.timestamp
+        overload = reading.measurement is not None and reading.measurement.overload
+        current_data = entry["data"]
+        current_data["value"] = data
+        current_data["unit"] = unit
+        current_data["mode"] = mode
+        current_data["overload"] = overload
+        seq = entry["history"].append(timestamp, data, unit, mode, overload)
+        current_data["seq"] = seq
+        # 只推送到订阅了该设备的房间
+        socketio.emit('data_update', {
+            'device_id': device_id,
+            'stream': entry["history"].stream_id,
+            'seq': seq,
+            'value': data,
+            'unit': unit,
+            'mode': mode,
+            'overload': overload,
+            'timestamp': timestamp
+        }, to=device_id)
+        # 没有二进制订阅者时跳过打包
+        if _room_has_members(_binary_room(device_id)):
+            socketio.emit('data_bin', {
+                'device_id': device_id,
+                'stream': entry["history"].stream_id,
+                'seq': seq,
+                'data': dm40_wire.encode([(timestamp, math.inf if overload else data, unit, mode)])
+            }, to=_binary_room(device_id))
+    return ui_listener
+
+
+def _emit_alarm(event):
+    """报警事件推送到设备房间（由报警分发线程调用）"""
+    socketio.emit('alarm', event, to=event['device_id'])
+    socketio.emit('alarm', event, to=_binary_room(event['device_id']))
+
+
+rule_engine.dispatcher.register('socketio', _emit_alarm)
+for _name, _url in WEBHOOKS.items():
+    rule_engine.dispatcher.register_webhook(_name, _url)
+
+
+def _boost_on_alarm(event):
+    """报警触发时让对应设备临时加速采样"""
+    entry = devices.get(event['device_id'])
+    if entry and event['state'] == 'triggered':
+        entry["device"].boost()
+
+
+rule_engine.add_event_listener(_boost_on_alarm)
+
+
+def _full_rate_consumers(device_id, entry):
+    """
+    需要全分辨率读数的服务端消费者数量: 报警规则、CSV 记录、触发捕获、共享内存导出、SQLite 和以该设备为输入的派生通道
+    它们与浏览器订阅者同样计入订阅者数量，没有打开界面时采样也不会降到 idle_interval
+    """
+    count = sum(1 for key in ("recorder", "capture", "shm", "sqlite") if entry[key])
+    if rule_engine.has_rules(device_id):
+        count += 1
+    count += sum(1 for other in list(devices.values()) if entry["device"] in getattr(other["device"], 'inputs', ()))
+    return count
+
+
+def _update_subscriber_count(device_id):
+    """把订阅者数量（WebSocket 订阅者 + 全分辨率消费者）同步给设备的采样控制器"""
+    entry = devices.get(device_id)
+    if entry:
+        count = sum(1 for subscribed in list(client_subscriptions.values()) if device_id in subscribed)
+        entry["device"].set_subscriber_count(count + _full_rate_consumers(device_id, entry))
+
+
+def _update_all_subscriber_counts():
+    """规则或派生通道变化后重新计算所有设备的订阅者数量"""
+    for device_id in list(devices):
+        _update_subscriber_count(device_id)
+
+
+def _get_worker_pool():
+    """首次使用时创建工作进程池"""
+    global _worker_pool
+    if _worker_pool is None:
+        from dm40_worker import WorkerPool
+        _worker_pool = WorkerPool()
+    return _worker_pool
+
+
+def _get_sqlite_store():
+    """首次使用时打开 SQLite 存储，未配置 SQLITE_PATH 时返回 None"""
+    global _sqlite_store
+    if _sqlite_store is None and SQLITE_PATH:
+        from dm40_sqlite import SqliteStore
+        _sqlite_store = SqliteStore(SQLITE_PATH, retention=SQLITE_RETENTION)
+    return _sqlite_store
+
+
+def _create_device(device_id, body):
+    """按请求体创建设备，返回 (设备, 地址描述)"""
+    address = body.get('address')
+    if WORKER_PROCESSES:
+        url = body.get('transport') or f"ble://{address or ''}"
+        device = _get_worker_pool().add_meter(device_id, url)
+        return device, device.description
+    if body.get('transport'):
+        device = Com_DM40A(transport=transport_from_url(body['transport']))
+    else:
+        device = Com_DM40A(address) if address else Com_DM40A()
+    return device, device.transport.description
+
+
+def _register_device(device_id, device, address):
+    """把设备（或派生通道）加入注册表并挂上界面推送、统计、报警和共享内存导出，调用方持有 devices_lock"""
+    devices[device_id] = {
+        "device": device,
+        "address": address,
+        "data": _empty_data("connecting"),
+        "history": SampleRing(HISTORY_CAPACITY),
+        "ui_filter": ChangeFilter(UI_DEADBAND, heartbeat=UI_HEARTBEAT),
+        "recorder": None,
+        "capture": None,
+        "shm": None,
+        "store": TieredStore(STORAGE_RAW_RETENTION, STORAGE_TIERS),
+        "sqlite": None,
+        "rules": None,
+    }
+    if SQLITE_PATH:
+        devices[device_id]["sqlite"] = _get_sqlite_store().attach(device, device_id)
+    if SHM_EXPORT:
+        from dm40_shm import ShmRing
+        ring = ShmRing(f'dm40_{device_id}', SHM_CAPACITY, create=True, replace=True)
+        devices[device_id]["shm"] = ring
+        device.add_listener(ring)
+    device.add_listener(devices[device_id]["store"])
+    device.add_listener(_make_ui_listener(device_id), filter=devices[device_id]["ui_filter"])
+    device.enable_stats(STATS_WINDOWS)
+    devices[device_id]["rules"] = rule_engine.attach(device, device_id)
+
+
+def _binary_room(device_id):
+    """二进制编码订阅者所在的房间"""
+    return f'{device_id}:bin'
+
+
+def _room_has_members(room):
+    """房间内是否有客户端"""
+    for _ in socketio.server.manager.get_participants('/', room):
+        return True
+    return False
 
 
 @app.route('/')
@@ -38,190 +272,427 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/api/status')
-def get_status():
-    """获取当前状态 API"""
-    return jsonify(current_data)
+# ==================== 设备管理 ====================
 
+@app.route('/api/devices')
+def list_devices():
+    """列出所有设备及其状态"""
+    with devices_lock:
+        result = {device_id: dict(entry["data"], address=entry["address"],
+                                  shm=entry["shm"].name if entry["shm"] else None)
+                  for device_id, entry in devices.items()}
+    return jsonify(result)
 
-@app.route('/api/connect', methods=['POST'])
-def connect_device():
-    """连接设备"""
-    global dm40_device, current_data
-    try:
-        if dm40_device is None:
-            dm40_device = Com_DM40A()
-            dm40_device.set_data_update_callback(data_update_callback)
-            dm40_device.run(200)
-            current_data["status"] = "connecting"
-        return jsonify({'status': 'ok', 'message': '正在连接设备...'})
-    except Exception as e:
-        current_data["status"] = "error"
-        return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/devices/<device_id>/status')
+def get_device_status(device_id):
+    """获取指定设备的当前状态"""
+    entry = devices.get(device_id)
+    if entry is None:
+        return jsonify(_empty_data())
+    return jsonify(entry["data"])
 
-@app.route('/api/disconnect', methods=['POST'])
-def disconnect_device():
-    """断开设备"""
-    global dm40_device, current_data
+
+@app.route('/api/devices/<device_id>/connect', methods=['POST'])
+def connect_device_by_id(device_id):
+    """
+    连接指定设备，请求体可选:
+    {"address": "..."} 蓝牙地址，或 {"transport": "tcp://host:port" | "sim://"} 指定传输层
+    """
+    body = request.get_json(silent=True) or {}
     try:
-        if dm40_device:
-            dm40_device.stop()
-            dm40_device = None
-        current_data = {"value": None, "unit": "", "mode": "", "status": "disconnected"}
-        return jsonify({'status': 'ok', 'message': '已断开连接'})
+        with devices_lock:
+            if device_id not in devices:
+                device, address = _create_device(device_id, body)
+                try:
+                    _register_device(device_id, device, address)
+                    device.run(POLL_INTERVAL_MS, adaptive=ADAPTIVE_POLLING)
+                except Exception:
+                    # 与断开相同的路径拆除已挂上的监听器、规则、共享内存等，重试时不会重复注册
+                    _teardown_device(device_id, devices.pop(device_id))
+                    raise
+        _update_subscriber_count(device_id)
+        return jsonify({'status': 'ok', 'message': '正在连接设备...', 'device_id': device_id})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
-# ==================== 电压模式 ====================
-
-@app.route('/api/mode/dc_voltage', methods=['POST'])
-def set_dc_voltage_mode():
-    """设置直流电压模式"""
-    global dm40_device
+def _teardown_device(device_id, entry):
+    """停止设备并移除 _register_device 及之后挂上的监听器和资源，调用方已把条目移出注册表"""
+    entry["device"].stop()
+    if _worker_pool is not None and entry["device"] in _worker_pool.meters():
+        _worker_pool.remove_meter(entry["device"])
+    if entry["recorder"]:
+        entry["recorder"].close()
+    if entry["capture"]:
+        entry["device"].remove_listener(entry["capture"])
+    if entry["sqlite"]:
+        entry["device"].remove_listener(entry["sqlite"])
+    if entry["rules"]:
+        rule_engine.detach(entry["device"], device_id, entry["rules"])
+    if entry["shm"]:
+        entry["shm"].close()
+        entry["shm"].unlink()
+
+
+@app.route('/api/devices/<device_id>/disconnect', methods=['POST'])
+def disconnect_device_by_id(device_id):
+    """断开指定设备"""
     try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_DC_VOLTAGE)
-            return jsonify({'status': 'ok', 'message': '已切换到直流电压模式'})
-        return jsonify({'status': 'error', 'message': '设备未连接'}), 400
+        with devices_lock:
+            entry = devices.pop(device_id, None)
+        if entry:
+            _teardown_device(device_id, entry)
+            _update_all_subscriber_counts()     # 派生通道断开后其输入设备少了一个消费者
+        # 二进制订阅者同样通过 data_update 获知设备状态
+        socketio.emit('data_update', dict(_empty_data(), device_id=device_id), to=device_id)
+        socketio.emit('data_update', dict(_empty_data(), device_id=device_id), to=_binary_room(device_id))
+        return jsonify({'status': 'ok', 'message': '已断开连接', 'device_id': device_id})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
-@app.route('/api/mode/ac_voltage', methods=['POST'])
-def set_ac_voltage_mode():
-    """设置交流电压模式"""
-    global dm40_device
+@app.route('/api/devices/<device_id>/mode/<mode_name>', methods=['POST'])
+def set_device_mode(device_id, mode_name):
+    """设置指定设备的测量模式"""
+    if mode_name not in MODE_ROUTES:
+        return jsonify({'status': 'error', 'message': f'未知模式: {mode_name}'}), 404
+    mode, name = MODE_ROUTES[mode_name]
     try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_AC_VOLTAGE)
-            return jsonify({'status': 'ok', 'message': '已切换到交流电压模式'})
+        entry = devices.get(device_id)
+        if entry:
+            entry["device"].set_mode(mode)
+            # 在设备所在的事件循环中发送模式切换命令并等待应答
+            if entry["device"].call(f'set_{mode_name}_mode', timeout=MODE_TIMEOUT):
+                entry["device"].boost()     # 尽快采到新模式下的读数
+                return jsonify({'status': 'ok', 'message': f'已切换到{name}模式'})
+            return jsonify({'status': 'error', 'message': f'切换到{name}模式失败: 设备无应答'}), 504
         return jsonify({'status': 'error', 'message': '设备未连接'}), 400
+    except TimeoutError:
+        return jsonify({'status': 'error', 'message': f'切换到{name}模式超时'}), 504
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
-# ==================== 电流模式 ====================
+# ==================== 统计 ====================
 
-@app.route('/api/mode/dc_current', methods=['POST'])
-def set_dc_current_mode():
-    """设置直流电流模式"""
-    global dm40_device
-    try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_DC_CURRENT)
-            return jsonify({'status': 'ok', 'message': '已切换到直流电流模式'})
+@app.route('/api/devices/<device_id>/stats')
+def get_device_stats(device_id):
+    """获取指定设备的 MIN/MAX/AVG/RMS/标准差/REL 统计"""
+    entry = devices.get(device_id)
+    if entry is None:
         return jsonify({'status': 'error', 'message': '设备未连接'}), 400
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify(entry["device"].get_stats())
 
 
-@app.route('/api/mode/ac_current', methods=['POST'])
-def set_ac_current_mode():
-    """设置交流电流模式"""
-    global dm40_device
-    try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_AC_CURRENT)
-            return jsonify({'status': 'ok', 'message': '已切换到交流电流模式'})
+@app.route('/api/devices/<device_id>/stats/reset', methods=['POST'])
+def reset_device_stats(device_id):
+    """清零指定设备的统计"""
+    entry = devices.get(device_id)
+    if entry is None:
         return jsonify({'status': 'error', 'message': '设备未连接'}), 400
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
-
+    entry["device"].reset_stats()
+    return jsonify({'status': 'ok', 'message': '统计已清零'})
 
-# ==================== 其他测量模式 ====================
 
-@app.route('/api/mode/resistance', methods=['POST'])
-def set_resistance_mode():
-    """设置电阻模式"""
-    global dm40_device
-    try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_RESISTANCE)
-            return jsonify({'status': 'ok', 'message': '已切换到电阻模式'})
+@app.route('/api/devices/<device_id>/stats/rel', methods=['POST', 'DELETE'])
+def set_device_relative(device_id):
+    """设置 REL 参考值，请求体可选 {"value": 参考值}，默认取当前读数；DELETE 清除"""
+    entry = devices.get(device_id)
+    if entry is None:
         return jsonify({'status': 'error', 'message': '设备未连接'}), 400
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if request.method == 'DELETE':
+        entry["device"].enable_stats().clear_reference()
+        return jsonify({'status': 'ok', 'reference': None})
+    body = request.get_json(silent=True) or {}
+    reference = entry["device"].set_relative(body.get('value'))
+    return jsonify({'status': 'ok', 'reference': reference})
+
 
+# ==================== 推送过滤 ====================
 
-@app.route('/api/mode/capacitance', methods=['POST'])
-def set_capacitance_mode():
-    """设置电容模式"""
-    global dm40_device
+@app.route('/api/devices/<device_id>/filter', methods=['GET', 'POST'])
+def device_filter(device_id):
+    """查看或设置界面推送过滤 {"deadband": 0.5, "change_only": true, "heartbeat": 1.0}"""
+    entry = devices.get(device_id)
+    if entry is None:
+        return jsonify({'status': 'error', 'message': '设备未连接'}), 400
+    ui_filter = entry["ui_filter"]
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        try:
+            if 'deadband' in body:
+                ui_filter.deadband = float(body['deadband'])
+            if 'change_only' in body:
+                ui_filter.change_only = bool(body['change_only'])
+            if 'heartbeat' in body:
+                ui_filter.heartbeat = None if body['heartbeat'] is None else float(body['heartbeat'])
+        except (TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify(ui_filter.to_dict())
+
+
+# ==================== 记录 ====================
+
+@app.route('/api/devices/<device_id>/record/start', methods=['POST'])
+def start_recording(device_id):
+    """开始以全分辨率记录到 CSV，请求体可选 {"filename": "..."}，文件保存在 RECORD_DIR"""
+    entry = devices.get(device_id)
+    if entry is None:
+        return jsonify({'status': 'error', 'message': '设备未连接'}), 400
+    if entry["recorder"]:
+        return jsonify({'status': 'ok', 'message': '正在记录', 'path': entry["recorder"].path})
+    body = request.get_json(silent=True) or {}
+    filename = os.path.basename(body.get('filename') or f'dm40_{device_id}_{time.strftime("%Y%m%d_%H%M%S")}.csv')
+    os.makedirs(RECORD_DIR, exist_ok=True)
+    from dm40_recorder import CsvRecorder
+    recorder = CsvRecorder(os.path.join(RECORD_DIR, filename), device_id)
+    entry["recorder"] = recorder
+    entry["device"].add_listener(recorder)
+    _update_subscriber_count(device_id)
+    return jsonify({'status': 'ok', 'message': '开始记录', 'path': recorder.path})
+
+
+@app.route('/api/devices/<device_id>/record/stop', methods=['POST'])
+def stop_recording(device_id):
+    """停止记录"""
+    entry = devices.get(device_id)
+    if entry is None or entry["recorder"] is None:
+        return jsonify({'status': 'error', 'message': '未在记录'}), 400
+    recorder = entry["recorder"]
+    entry["recorder"] = None
+    entry["device"].remove_listener(recorder)
+    recorder.close()
+    _update_subscriber_count(device_id)
+    return jsonify({'status': 'ok', 'message': '记录已停止', 'path': recorder.path, 'count': recorder.count})
+
+
+# ==================== 历史数据 ====================
+
+@app.route('/api/devices/<device_id>/history')
+def device_history(device_id):
+    """
+    查询历史读数，参数: start/end（Unix 时间戳，默认最近 window 秒，window 默认 600）、
+    resolution（秒，默认按 HISTORY_MAX_POINTS 个点计算）
+    从满足分辨率的最粗一级返回: resolution 为 0 时 rows 为原始读数，否则为 min/max/mean 汇总桶
+    内存分级存储不能覆盖所查时间段且配置了 SQLITE_PATH 时从数据库查询（设备未连接也可查询）
+    """
+    entry = devices.get(device_id)
+    store = entry["store"] if entry else None
     try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_CAPACITANCE)
-            return jsonify({'status': 'ok', 'message': '已切换到电容模式'})
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - float(request.args.get('window', 600))))
+        resolution = request.args.get('resolution')
+        resolution = (end - start) / HISTORY_MAX_POINTS if resolution is None else float(resolution)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if end < start:
+        return jsonify({'status': 'error', 'message': 'end 早于 start'}), 400
+    sqlite_store = _get_sqlite_store()
+    if sqlite_store is not None and (store is None or not store.covers(start)):
+        try:
+            result, source = sqlite_store.query(device_id, start, end, resolution), 'sqlite'
+        except sqlite3.Error as e:
+            return jsonify({'status': 'error', 'message': f'数据库查询失败: {e}'}), 500
+    elif store is not None:
+        result, source = store.query(start, end, resolution), 'memory'
+    else:
         return jsonify({'status': 'error', 'message': '设备未连接'}), 400
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify(dict(result, device_id=device_id, start=start, end=end, source=source))
 
 
-@app.route('/api/mode/frequency', methods=['POST'])
-def set_frequency_mode():
-    """设置频率模式"""
-    global dm40_device
-    try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_FREQUENCY)
-            return jsonify({'status': 'ok', 'message': '已切换到频率模式'})
+@app.route('/api/devices/<device_id>/history/status')
+def device_history_status(device_id):
+    """分级存储各级的行数与保留时长，以及 SQLite 写入状态"""
+    entry = devices.get(device_id)
+    if entry is None:
         return jsonify({'status': 'error', 'message': '设备未连接'}), 400
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    result = entry["store"].status()
+    if _sqlite_store is not None:
+        result['sqlite'] = _sqlite_store.status()
+    return jsonify(result)
+
+
+# ==================== 触发捕获 ====================
+
+def _make_snapshot_listener(device_id):
+    """快照完成时推送摘要到设备房间，并交给后台线程保存"""
+    def on_snapshot(snapshot):
+        summary = snapshot.summary()
+        socketio.emit('capture', summary, to=device_id)
+        socketio.emit('capture', summary, to=_binary_room(device_id))
+        if _snapshot_writer is not None:
+            _snapshot_writer(snapshot)
+    return on_snapshot
+
+
+@app.route('/api/devices/<device_id>/capture', methods=['GET', 'POST', 'DELETE'])
+def device_capture(device_id):
+    """
+    查看、设置或关闭触发捕获
+    POST 请求体为触发条件 JSON（见 dm40_capture），例如 {"op": ">", "threshold": 500, "pre": 2, "post": 3}
+    重新设置时丢弃之前的快照
+    """
+    global _snapshot_writer
+    entry = devices.get(device_id)
+    if entry is None:
+        return jsonify({'status': 'error', 'message': '设备未连接'}), 400
+    if request.method == 'POST':
+        from dm40_capture import SnapshotWriter, TriggeredCapture
+        try:
+            capture = TriggeredCapture.from_dict(request.get_json(force=True), device_id)
+        except (TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if CAPTURE_DIR and _snapshot_writer is None:
+            _snapshot_writer = SnapshotWriter(CAPTURE_DIR)
+        capture.add_listener(_make_snapshot_listener(device_id))
+        if entry["capture"]:
+            entry["device"].remove_listener(entry["capture"])
+        entry["capture"] = capture
+        entry["device"].add_listener(capture)
+        _update_subscriber_count(device_id)
+    elif request.method == 'DELETE':
+        if entry["capture"]:
+            entry["device"].remove_listener(entry["capture"])
+            entry["capture"] = None
+            _update_subscriber_count(device_id)
+        return jsonify({'status': 'ok', 'message': '触发捕获已关闭'})
+    if entry["capture"] is None:
+        return jsonify({'status': 'ok', 'state': 'off', 'snapshots': []})
+    return jsonify(dict(entry["capture"].status(), status='ok'))
+
+
+@app.route('/api/devices/<device_id>/capture/trigger', methods=['POST'])
+def trigger_capture(device_id):
+    """手动触发一次捕获，请求体可选 {"reason": "..."}"""
+    entry = devices.get(device_id)
+    if entry is None or entry["capture"] is None:
+        return jsonify({'status': 'error', 'message': '未启用触发捕获'}), 400
+    body = request.get_json(silent=True) or {}
+    entry["capture"].trigger(body.get('reason') or 'manual')
+    return jsonify({'status': 'ok', 'message': '已手动触发'})
+
+
+@app.route('/api/devices/<device_id>/capture/arm', methods=['POST'])
+def arm_capture(device_id):
+    """单次捕获完成后重新开始判定触发"""
+    entry = devices.get(device_id)
+    if entry is None or entry["capture"] is None:
+        return jsonify({'status': 'error', 'message': '未启用触发捕获'}), 400
+    entry["capture"].arm()
+    return jsonify({'status': 'ok', 'message': '已重新布防'})
+
+
+@app.route('/api/devices/<device_id>/capture/snapshots/<int:snapshot_id>')
+def get_capture_snapshot(device_id, snapshot_id):
+    """获取快照的全部样本 [[时间戳, 数值, 单位, 模式], ...]"""
+    entry = devices.get(device_id)
+    snapshot = entry["capture"].get_snapshot(snapshot_id) if entry and entry["capture"] else None
+    if snapshot is None:
+        return jsonify({'status': 'error', 'message': f'未找到快照: {snapshot_id}'}), 404
+    return jsonify(snapshot.to_dict())
+
+
+# ==================== 派生通道 ====================
+
+@app.route('/api/derived', methods=['POST'])
+def add_derived_channel():
+    """
+    创建派生通道（见 dm40_derived），作为虚拟设备加入注册表，界面、统计、记录、报警与普通设备相同
+    请求体: {"id": "p1", "type": "power", "inputs": ["v", "i"]}，type 为 power / energy / charge，
+    inputs 为已连接的设备或派生通道 ID；删除时调用 /api/devices/<id>/disconnect
+    """
+    from dm40_derived import CHANNEL_TYPES
+    body = request.get_json(silent=True) or {}
+    channel_id, kind, inputs = body.get('id'), body.get('type'), body.get('inputs') or []
+    if not channel_id or kind not in CHANNEL_TYPES:
+        return jsonify({'status': 'error', 'message': f'需要 id 和 type ({", ".join(CHANNEL_TYPES)})'}), 400
+    factory, count = CHANNEL_TYPES[kind]
+    with devices_lock:
+        if channel_id in devices:
+            return jsonify({'status': 'error', 'message': f'ID 已存在: {channel_id}'}), 409
+        missing = [i for i in inputs if i not in devices]
+        if len(inputs) != count or missing:
+            return jsonify({'status': 'error',
+                            'message': f'{kind} 需要 {count} 个已连接的输入' + (f'，未找到: {missing}' if missing else '')}), 400
+        channel = factory(*(devices[i]["device"] for i in inputs))
+        _register_device(channel_id, channel, f'{kind}({", ".join(inputs)})')
+    _update_all_subscriber_counts()
+    return jsonify({'status': 'ok', 'message': '派生通道已创建', 'device_id': channel_id})
+
+
+@app.route('/api/derived/<channel_id>/reset', methods=['POST'])
+def reset_derived_channel(channel_id):
+    """积分通道（能量/电荷量）累计值清零"""
+    entry = devices.get(channel_id)
+    if entry is None or not hasattr(entry["device"], 'reset'):
+        return jsonify({'status': 'error', 'message': f'未找到积分通道: {channel_id}'}), 404
+    entry["device"].reset()
+    return jsonify({'status': 'ok', 'message': '累计值已清零'})
+
+
+# ==================== 报警规则 ====================
+
+@app.route('/api/rules')
+def list_rules():
+    """列出所有报警规则及当前触发中的报警"""
+    return jsonify({
+        'rules': [rule.to_dict() for rule in rule_engine.rules()],
+        'active': rule_engine.active_alarms(),
+        'dropped': rule_engine.dispatcher.dropped,
+    })
 
 
-@app.route('/api/mode/temperature', methods=['POST'])
-def set_temperature_mode():
-    """设置温度模式"""
-    global dm40_device
+@app.route('/api/rules', methods=['POST'])
+def add_rule():
+    """添加或替换报警规则，请求体为规则 JSON（见 dm40_rules）"""
     try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_TEMPERATURE)
-            return jsonify({'status': 'ok', 'message': '已切换到温度模式'})
-        return jsonify({'status': 'error', 'message': '设备未连接'}), 400
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        rule = rule_engine.add_rule(Rule.from_dict(request.get_json(force=True)))
+        _update_all_subscriber_counts()
+        return jsonify({'status': 'ok', 'rule': rule.to_dict()})
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
 
 
-@app.route('/api/mode/diode', methods=['POST'])
-def set_diode_mode():
-    """设置二极管模式"""
-    global dm40_device
-    try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_DIODE)
-            return jsonify({'status': 'ok', 'message': '已切换到二极管模式'})
-        return jsonify({'status': 'error', 'message': '设备未连接'}), 400
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+@app.route('/api/rules/<rule_id>', methods=['DELETE'])
+def delete_rule(rule_id):
+    """删除报警规则"""
+    if rule_engine.remove_rule(rule_id):
+        _update_all_subscriber_counts()
+        return jsonify({'status': 'ok', 'message': '规则已删除'})
+    return jsonify({'status': 'error', 'message': f'未找到规则: {rule_id}'}), 404
 
 
-@app.route('/api/mode/continuity', methods=['POST'])
-def set_continuity_mode():
-    """设置通断模式"""
-    global dm40_device
-    try:
-        if dm40_device:
-            dm40_device.set_mode(Com_DM40A.MODE_CONTINUITY)
-            return jsonify({'status': 'ok', 'message': '已切换到通断模式'})
-        return jsonify({'status': 'error', 'message': '设备未连接'}), 400
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+# ==================== 兼容旧 API（操作默认设备） ====================
+
+@app.route('/api/status')
+def get_status():
+    """获取当前状态 API"""
+    return get_device_status(DEFAULT_DEVICE_ID)
 
 
-# ==================== 兼容旧 API ====================
+@app.route('/api/stats')
+def get_stats():
+    """获取默认设备的统计"""
+    return get_device_stats(DEFAULT_DEVICE_ID)
 
-@app.route('/api/mode/voltage', methods=['POST'])
-def set_voltage_mode():
-    """设置电压模式（兼容旧代码，默认直流）"""
-    return set_dc_voltage_mode()
+
+@app.route('/api/connect', methods=['POST'])
+def connect_device():
+    """连接设备"""
+    return connect_device_by_id(DEFAULT_DEVICE_ID)
+
+
+@app.route('/api/disconnect', methods=['POST'])
+def disconnect_device():
+    """断开设备"""
+    return disconnect_device_by_id(DEFAULT_DEVICE_ID)
 
 
-@app.route('/api/mode/current', methods=['POST'])
-def set_current_mode():
-    """设置电流模式（兼容旧代码，默认直流）"""
-    return set_dc_current_mode()
+@app.route('/api/mode/<mode_name>', methods=['POST'])
+def set_mode(mode_name):
+    """设置默认设备的测量模式"""
+    return set_device_mode(DEFAULT_DEVICE_ID, mode_name)
 
 
 # ==================== WebSocket 事件 ====================
@@ -229,14 +700,74 @@ def set_current_mode():
 @socketio.on('connect')
 def handle_connect():
     """WebSocket 连接处理"""
-    emit('connected', {'data': 'WebSocket connected'})
-    # 发送当前数据
-    emit('data_update', current_data)
+    emit('connected', {'data': 'WebSocket connected', 'devices': list(devices.keys())})
+
+
+@socketio.on('subscribe')
+def handle_subscribe(message):
+    """
+    订阅设备数据 {"device_id": "...", "encoding": "json" | "binary", "stream": "...", "last_seq": n}
+    加入对应房间并发送当前数据；二进制编码先发送一次 schema（模式/单位字典）
+    重连客户端携带 stream/last_seq 时补发缺失样本
+    """
+    message = message or {}
+    device_id = message.get('device_id', DEFAULT_DEVICE_ID)
+    client_subscriptions.setdefault(request.sid, set()).add(device_id)
+    _update_subscriber_count(device_id)
+    binary = message.get('encoding') == 'binary'
+    if binary:
+        join_room(_binary_room(device_id))
+        emit('schema', dict(dm40_wire.schema(), device_id=device_id))
+    else:
+        join_room(device_id)
+    entry = devices.get(device_id)
+    if entry is None:
+        emit('data_update', dict(_empty_data(), device_id=device_id))
+        return
+    if message.get('last_seq') is not None:
+        _send_history(device_id, entry["history"], message.get('stream'), int(message['last_seq']), binary)
+    emit('data_update', dict(entry["data"], device_id=device_id, stream=entry["history"].stream_id))
+
+
+def _send_history(device_id, history, stream_id, last_seq, binary):
+    """
+    补发 last_seq 之后的样本
+    同一数据流且缺口在缓冲区内、不超过 MAX_DELTA 时发送增量 (kind=delta)，
+    否则发送降采样快照 (kind=snapshot)
+    """
+    samples = history.since(last_seq, MAX_DELTA) if stream_id == history.stream_id else None
+    kind = 'delta'
+    if samples is None:
+        kind = 'snapshot'
+        samples = downsample(history.latest(), SNAPSHOT_POINTS)
+    message = {'device_id': device_id, 'kind': kind, 'stream': history.stream_id,
+               'last_seq': history.last_seq}
+    if binary:
+        message['seqs'] = [s[0] for s in samples]
+        # 与实时推送相同: 超量程编码为 +Inf
+        message['data'] = dm40_wire.encode([(t, math.inf if overload else value, unit, mode)
+                                            for _, t, value, unit, mode, overload in samples])
+        emit('history_bin', message)
+    else:
+        message['samples'] = samples
+        emit('history', message)
+
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(message):
+    """取消订阅设备数据"""
+    device_id = (message or {}).get('device_id', DEFAULT_DEVICE_ID)
+    leave_room(device_id)
+    leave_room(_binary_room(device_id))
+    client_subscriptions.get(request.sid, set()).discard(device_id)
+    _update_subscriber_count(device_id)
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """WebSocket 断开处理"""
+    for device_id in client_subscriptions.pop(request.sid, set()):
+        _update_subscriber_count(device_id)
     print('Client disconnected')
 
 